@@ -1,215 +1,432 @@
 import praw
+import prawcore
 import json
 import logging
 import os
+import re
 import time
 import requests
-import sys
-
-#region Logging Configuration
-logging.basicConfig(
-    filename='logs.txt',
-    level=logging.NOTSET,
-    format='Type: %(levelname)s %(asctime)s \n%(message)s\n',
-    datefmt='on %d-%m-%Y at %H:%M:%S'
-)
-logging.info("---------- Application Started ----------")
-#endregion
-
-#region API Connection
-# Load Reddit credentials from JSON
-with open("credentials.json", "r") as cred_file:
-    creds = json.load(cred_file)
-
-logging.info(f"""---------- Credentials Loaded Successfully ----------
-username = {creds['username']}
-useragent = {creds['user_agent']}
-""")
-print("Established Connection with the API")
-#endregion
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-# Create Reddit instance
-reddit = praw.Reddit(
-    client_id=creds['client_id'],
-    client_secret=creds['client_secret'],
-    user_agent=creds['user_agent']
-)
-
-# List of subreddits to scrape (Sequential Order)
-if(len(sys.argv) > 1):
-    subreddits_list = sys.argv[1].split()
-    print("I will crawl from your given list of topics.")
-else:
-    subreddits_list = [
-        'technology', 'Android', 'iOS', 'gadgets', 'programming', 
-        'learnprogramming', 'webdev', 'Python', 'cybersecurity', 'techsupport', 
-        'DevOps', 'DataScience', 'MachineLearning', 'ArtificialIntelligence', 'Linux'
-    ]
-    print("No topic provided, scrawling defaults.")
+# List of subreddits to scrape when no topics are given
+DEFAULT_SUBREDDITS = [
+    'technology', 'Android', 'iOS', 'gadgets', 'programming',
+    'learnprogramming', 'webdev', 'Python', 'cybersecurity', 'techsupport',
+    'DevOps', 'DataScience', 'MachineLearning', 'ArtificialIntelligence', 'Linux'
+]
 
 # 'Computers', 'TechNews', 'BigData', 'Blockchain', 'cryptocurrency'
-# 'Apple', 'Windows10', 'VirtualReality', '3Dprinting', 'IoT', 
+# 'Apple', 'Windows10', 'VirtualReality', '3Dprinting', 'IoT',
 #     'SelfDrivingCars', 'QuantumComputing', 'cloudcomputing', 'networking', 'gamedev'
 
 # Path for storing Reddit posts
 reddit_file_prefix = "reddit_batch"
 processed_ids_file = "processed_ids.json"
 
-# Load previously processed IDs (if the file exists)
-if os.path.exists(processed_ids_file):
-    with open(processed_ids_file, "r") as f:
-        processed_ids = set(json.load(f))
-else:
-    processed_ids = set()
-
-print(f"We have currently {len(processed_ids)} posts.")
-print(f"Crawling posts from subreddits in order...")
-
 # Directory for saving images
 image_directory = "Assets/Images"
-os.makedirs(image_directory, exist_ok=True)
 
 # File size threshold (in bytes, 10 MB)
 FILE_SIZE_THRESHOLD = 9.5 * 1024 * 1024  # 10 MB Approx.
 
-# Function to check the size of the file
-def get_file_size(file_path):
-    return os.path.getsize(file_path) if os.path.exists(file_path) else 0
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.gif', '.jpeg', '.webp')
+
+#region Concurrent Crawling
+# Subreddit listings are walked on their own threads; every post worth
+# keeping is handed to a bounded pool that fetches its comments, while its
+# image (if any) downloads on a separate pool over one pooled session. All
+# Reddit API calls of all threads share one RateLimiter. Finished posts go
+# to a single BatchWriter that owns the output files and their rotation.
+#endregion
+
+class RateLimiter:
+    """
+    Token bucket shared by all crawler threads: on average at most
+    requests_per_minute API calls, in bursts of up to `burst`. When Reddit
+    reports the rate limit as used up, every thread waits for its reset.
+    """
+
+    def __init__(self, requests_per_minute=100, burst=5):
+        self.interval = 60 / requests_per_minute
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self._tokens) * self.interval)
+            time.sleep(wait)
 
-# Create a new file with an incremented index
-def get_new_file_path(file_prefix, index):
-    return f"{file_prefix}_{index}.txt"
+    def update(self, headers):
+        remaining = _header_number(headers, "x-ratelimit-remaining", None)
+        if remaining is not None and remaining <= 0:
+            # Reddit may send fractional seconds (e.g. "59.0").
+            reset = _header_number(headers, "x-ratelimit-reset", 60)
+            with self._lock:
+                self._blocked_until = time.monotonic() + reset
+
+def _header_number(headers, name, default):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+class RateLimitedRequestor(prawcore.Requestor):
+    """
+    PRAW requestor that takes a token from the shared RateLimiter before every request.
+    """
+
+    def __init__(self, *args, rate_limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+
+    def request(self, *args, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        response = super().request(*args, **kwargs)
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(response.headers)
+        return response
+
+class BatchWriter:
+    """
+    Appends posts to <prefix>_<n>.txt (one JSON record per line followed by
+    ","), starting the next file once FILE_SIZE_THRESHOLD is reached. Writes
+    are buffered and the size is counted as it goes; a new run continues the
+    highest-numbered existing file.
+    """
+
+    def __init__(self, prefix, threshold=FILE_SIZE_THRESHOLD, buffer_size=1024 * 1024):
+        self.prefix = prefix
+        self.threshold = threshold
+        self.buffer_size = buffer_size
+        self.written = 0
+        directory = os.path.dirname(prefix) or "."
+        pattern = re.compile(re.escape(os.path.basename(prefix)) + r"_(\d+)\.txt$")
+        existing = [int(match.group(1)) for match in map(pattern.match, os.listdir(directory)) if match]
+        self.file_index = max(existing, default=1)
+        self._lock = threading.Lock()
+        self._open()
+        if self.size >= self.threshold:
+            self._rotate()
+
+    @property
+    def path(self):
+        return f"{self.prefix}_{self.file_index}.txt"
+
+    def _open(self):
+        self._file = open(self.path, "ab", buffering=self.buffer_size)
+        self.size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        self.file_index += 1
+        self._open()
+        logging.info(f"File exceeded {self.threshold / (1024*1024)} MB. Created new file: {self.path}")
+
+    def write(self, post_data):
+        """
+        Writes one post and returns the file it went to.
+        """
+        line = (json.dumps(post_data) + ",\n").encode("utf-8")
+        with self._lock:
+            path = self.path
+            self._file.write(line)
+            self.size += len(line)
+            self.written += 1
+            # **Check file size AFTER writing**
+            if self.size >= self.threshold:
+                self._rotate()
+        return path
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def image_session(pool_size):
+    """
+    One requests session for all image downloads, keeping up to pool_size
+    connections per host open and retrying failed connections.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 # Function to download images
-def download_image(image_url, post_id):
+def download_image(session, image_url, post_id):
     try:
-        response = requests.get(image_url, stream=True)
-        if response.status_code == 200:
-            image_extension = os.path.splitext(image_url)[-1]  # Get file extension
-            if image_extension.lower() not in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
-                image_extension = ".jpg"  # Default to .jpg if extension is unknown
-            
-            image_path = os.path.join(image_directory, f"{post_id}{image_extension}")
-            with open(image_path, "wb") as img_file:
-                for chunk in response.iter_content(1024):
-                    img_file.write(chunk)
-            logging.info(f"Downloaded Image: {image_url} -> {image_path}")
-            return image_path
+        with session.get(image_url, stream=True, timeout=30) as response:
+            if response.status_code == 200:
+                image_extension = os.path.splitext(image_url)[-1]  # Get file extension
+                if image_extension.lower() not in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
+                    image_extension = ".jpg"  # Default to .jpg if extension is unknown
+
+                image_path = os.path.join(image_directory, f"{post_id}{image_extension}")
+                with open(image_path, "wb") as img_file:
+                    for chunk in response.iter_content(64 * 1024):
+                        img_file.write(chunk)
+                logging.info(f"Downloaded Image: {image_url} -> {image_path}")
+                return image_path
     except Exception as e:
         logging.warning(f"Failed to download image {image_url}: {e}")
     return None
 
-# Crawl data in bulk
-time_start_crawl = time.time()
-max_posts_to_save = 15000  # Specify how many posts you want to collect
+def post_to_data(post):
+    return {
+        "subreddit": post.subreddit.display_name,
+        "id": post.id,
+        "title": post.title,
+        "author": post.author.name if post.author else 'Unknown',
+        "body": post.selftext,
+        "comments": [],
+        "flair_text": post.link_flair_text,
+        "permalink": post.permalink,
+        "url": post.url,
+        "image_path": None,  # Set once the image (if any) is downloaded
+        "created_utc": post.created_utc,
+        "score": post.score,
+        "upvote_ratio": post.upvote_ratio,
+        "num_comments": post.num_comments,
+        "is_self": post.is_self,
+        "over_18": post.over_18,
+        "spoiler": post.spoiler,
+        "locked": post.locked,
+        "stickied": post.stickied,
+    }
 
-# File counter for naming
-file_index = 1
-reddit_file = get_new_file_path(reddit_file_prefix, file_index)
+def comment_to_data(comment):
+    return {
+        "id": comment.id,
+        "author": comment.author.name if comment.author else 'Unknown',
+        "body": comment.body,
+        "subreddit": comment.subreddit.display_name,
+        "parent_id": comment.parent_id,
+        "permalink": comment.permalink,
+        "author_flair_text": comment.author_flair_text,
+        "created_utc": comment.created_utc,
+        "score": comment.score,
+        "is_submitter": comment.is_submitter,
+        "stickied": comment.stickied,
+        "edited": comment.edited,
+        "distinguished": comment.distinguished,
+    }
 
-counter = 0
-posts_checked = 0
+class Crawler:
+    """
+    Crawls the top posts of subreddits concurrently into a BatchWriter.
 
-# Collect posts from subreddits **in a structured order**
-for subreddit_name in subreddits_list:
-    subreddit = reddit.subreddit(subreddit_name)
+    `make_reddit()` returns a new praw.Reddit; PRAW instances are not thread
+    safe, so every thread gets its own. Up to `workers` posts have their
+    comments fetched at once, images download on `image_workers` threads,
+    and at most max_posts new posts are saved.
+    """
 
-    try:
-        for post in subreddit.top(limit=990):
-            try:
-                if post.id not in processed_ids and (post.is_self or post.url.endswith(('.jpg', '.png', '.gif', '.jpeg', '.webp'))):
-                    counter += 1
-                    image_path = None  # Default to None
+    def __init__(self, make_reddit, writer, processed_ids, max_posts=15000, limit=990,
+                 workers=8, image_workers=4):
+        self.make_reddit = make_reddit
+        self.writer = writer
+        self.processed_ids = processed_ids
+        self.max_posts = max_posts
+        self.limit = limit
+        self.workers = workers
+        self.image_workers = image_workers
+        self.posts_checked = 0
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Bounds the posts waiting for their comments or image.
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._done = threading.Event()
+
+    def _reddit(self):
+        if not hasattr(self._local, "reddit"):
+            self._local.reddit = self.make_reddit()
+        return self._local.reddit
+
+    def _claim(self, post):
+        """
+        Returns True if this thread should save the post: it is new, a text
+        or image post, and max_posts has not been reached.
+        """
+        with self._lock:
+            self.posts_checked += 1
+            if self._done.is_set() or post.id in self.processed_ids or post.id in self._claimed:
+                return False
+            if not (post.is_self or post.url.endswith(IMAGE_EXTENSIONS)):
+                return False
+            self._claimed.add(post.id)
+            if len(self._claimed) >= self.max_posts:
+                self._done.set()
+            return True
 
-                    # Download image if it's in post body or a direct image link
-                    if post.url.endswith(('.jpg', '.png', '.gif', '.jpeg', '.webp')):
+    def crawl(self, subreddits):
+        session = image_session(self.image_workers)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="comments") as comment_pool, \
+                ThreadPoolExecutor(self.image_workers, thread_name_prefix="images") as image_pool, \
+                ThreadPoolExecutor(min(self.workers, len(subreddits)) or 1, thread_name_prefix="listing") as listing_pool:
+            for subreddit_name in subreddits:
+                listing_pool.submit(self._crawl_subreddit, subreddit_name, comment_pool, image_pool, session)
+        session.close()
+
+    def _crawl_subreddit(self, subreddit_name, comment_pool, image_pool, session):
+        try:
+            for post in self._reddit().subreddit(subreddit_name).top(limit=self.limit):
+                if self._done.is_set():
+                    break
+                try:
+                    if not self._claim(post):
+                        continue
+                    post_data = post_to_data(post)
+                    image = None
+                    # Download image if it's a direct image link
+                    if post.url.endswith(IMAGE_EXTENSIONS):
                         logging.info("Found a post with Image!")
-                        image_path = download_image(post.url, post.id)
-
-                    post_data = {
-                        "subreddit": post.subreddit.display_name,
-                        "id": post.id,
-                        "title": post.title,
-                        "author": post.author.name if post.author else 'Unknown',
-                        "body": post.selftext,
-                        "comments": [],
-                        "flair_text": post.link_flair_text,
-                        "permalink": post.permalink,
-                        "url": post.url,
-                        "image_path": image_path,  # Store image path if available
-                        "created_utc": post.created_utc,
-                        "score": post.score,
-                        "upvote_ratio": post.upvote_ratio,
-                        "num_comments": post.num_comments,
-                        "is_self": post.is_self,
-                        "over_18": post.over_18,
-                        "spoiler": post.spoiler,
-                        "locked": post.locked,
-                        "stickied": post.stickied,
-                    }
-
-                    # Fetching comments for the post
-                    try:
-                        post.comments.replace_more(limit=0)
-                        for comment in post.comments.list():
-                            comment_data = {
-                                "id": comment.id,
-                                "author": comment.author.name if comment.author else 'Unknown',
-                                "body": comment.body,
-                                "subreddit": comment.subreddit.display_name,
-                                "parent_id": comment.parent_id,
-                                "permalink": comment.permalink,
-                                "author_flair_text": comment.author_flair_text,
-                                "created_utc": comment.created_utc,
-                                "score": comment.score,
-                                "is_submitter": comment.is_submitter,
-                                "stickied": comment.stickied,
-                                "edited": comment.edited,
-                                "distinguished": comment.distinguished,
-                            }
-                            post_data["comments"].append(comment_data)
-                    except Exception as e:
-                        logging.warning(f"Error fetching comments for post {post.id}: {e}")
-
-                    # Add the post ID to the processed set
-                    processed_ids.add(post.id)
-
-                    # Write the post to the file
-                    with open(reddit_file, "a") as file:
-                        file.write(json.dumps(post_data) + ",\n")
-                        logging.info(f"WRITTEN: {post_data['title']}")
-
-                    print(f"Written {counter}th post in {reddit_file} file.")
-
-                    # **Check file size AFTER writing**
-                    if get_file_size(reddit_file) >= FILE_SIZE_THRESHOLD:
-                        file_index += 1  # Increment file index
-                        reddit_file = get_new_file_path(reddit_file_prefix, file_index)  # Get new file path
-                        logging.info(f"File exceeded {FILE_SIZE_THRESHOLD / (1024*1024)} MB. Created new file: {reddit_file}")
-                
-                posts_checked+=1
+                        image = image_pool.submit(download_image, session, post.url, post.id)
+                    self._slots.acquire()
+                    comment_pool.submit(self._finish_post, post_data, image)
+                except Exception as e:
+                    logging.warning(f"Skipping post due to error: {e}")
+        except Exception as e:
+            logging.error(f"Error fetching posts from subreddit {subreddit_name}: {e}")
+            print(f"Skipping subreddit {subreddit_name} due to error: {e}")
+
+    def _finish_post(self, post_data, image):
+        try:
+            # Fetching comments for the post
+            try:
+                submission = self._reddit().submission(id=post_data["id"])
+                submission.comments.replace_more(limit=0)
+                post_data["comments"] = [comment_to_data(comment) for comment in submission.comments.list()]
             except Exception as e:
-                logging.warning(f"Skipping post due to error: {e}")
-                continue  # Ignore error and move to the next post
+                logging.warning(f"Error fetching comments for post {post_data['id']}: {e}")
+            if image is not None:
+                post_data["image_path"] = image.result()
 
-    except Exception as e:
-        logging.error(f"Error fetching posts from subreddit {subreddit_name}: {e}")
-        print(f"Skipping subreddit {subreddit_name} due to error: {e}")
-
-time_end_crawl = time.time()
-time_execution_crawl = time_end_crawl - time_start_crawl
-minutes = int(time_execution_crawl // 60)
-seconds = int(time_execution_crawl % 60)
-print(f"Crawling Completed in {minutes} minutes and {seconds} seconds.")
-print(f"Checked: {posts_checked}.")
-
-# Save the processed IDs to a file
-with open(processed_ids_file, "w") as f:
-    json.dump(list(processed_ids), f)
-print(f"Updated processed IDs in '{processed_ids_file}'.")
-
-logging.info(f"Total Posts: {len(processed_ids)}")
-logging.info("---------- Application Completed ----------")
-
-print(f"Total Posts: {len(processed_ids)}")
-print("Successfully ran the application.")
\ No newline at end of file
+            # Write the post to the file
+            reddit_file = self.writer.write(post_data)
+            logging.info(f"WRITTEN: {post_data['title']}")
+            with self._lock:
+                # Add the post ID to the processed set
+                self.processed_ids.add(post_data["id"])
+                counter = self.writer.written
+            print(f"Written {counter}th post in {reddit_file} file.")
+        except Exception as e:
+            logging.warning(f"Skipping post {post_data['id']} due to error: {e}")
+        finally:
+            self._slots.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the top posts of subreddits")
+    parser.add_argument("topics", nargs="*", help="subreddits to crawl (default: the tech subreddits above)")
+    parser.add_argument("--max-posts", type=int, default=15000, help="how many new posts to collect")
+    parser.add_argument("--limit", type=int, default=990, help="top posts to check per subreddit")
+    parser.add_argument("--workers", type=int, default=8, help="posts whose comments are fetched at once")
+    parser.add_argument("--image-workers", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=100, help="Reddit API rate limit")
+    parser.add_argument("--credentials", default="credentials.json")
+    parser.add_argument("--reddit-url", help="e.g. the URL of stub_reddit.py (default: credentials or www.reddit.com)")
+    parser.add_argument("--oauth-url", help="default: credentials or oauth.reddit.com")
+    args = parser.parse_args()
+
+    #region Logging Configuration
+    logging.basicConfig(
+        filename='logs.txt',
+        level=logging.NOTSET,
+        format='Type: %(levelname)s %(asctime)s \n%(message)s\n',
+        datefmt='on %d-%m-%Y at %H:%M:%S'
+    )
+    logging.info("---------- Application Started ----------")
+    #endregion
+
+    #region API Connection
+    # Load Reddit credentials from JSON
+    with open(args.credentials, "r") as cred_file:
+        creds = json.load(cred_file)
+
+    logging.info(f"""---------- Credentials Loaded Successfully ----------
+username = {creds['username']}
+useragent = {creds['user_agent']}
+""")
+    print("Established Connection with the API")
+    #endregion
+
+    rate_limiter = RateLimiter(args.requests_per_minute)
+    urls = {}
+    for name, value in (("reddit_url", args.reddit_url), ("oauth_url", args.oauth_url)):
+        if value or creds.get(name):
+            urls[name] = value or creds[name]
+
+    # Create a Reddit instance (one per thread)
+    def make_reddit():
+        return praw.Reddit(
+            client_id=creds['client_id'],
+            client_secret=creds['client_secret'],
+            user_agent=creds['user_agent'],
+            requestor_class=RateLimitedRequestor,
+            requestor_kwargs={"rate_limiter": rate_limiter},
+            **urls
+        )
+
+    # The start scripts pass the topics as one space-separated argument
+    subreddits_list = " ".join(args.topics).split()
+    if subreddits_list:
+        print("I will crawl from your given list of topics.")
+    else:
+        subreddits_list = DEFAULT_SUBREDDITS
+        print("No topic provided, scrawling defaults.")
+
+    # Load previously processed IDs (if the file exists)
+    if os.path.exists(processed_ids_file):
+        with open(processed_ids_file, "r") as f:
+            processed_ids = set(json.load(f))
+    else:
+        processed_ids = set()
+
+    print(f"We have currently {len(processed_ids)} posts.")
+    print(f"Crawling posts from {len(subreddits_list)} subreddits with {args.workers} workers...")
+
+    os.makedirs(image_directory, exist_ok=True)
+
+    # Crawl data in bulk
+    time_start_crawl = time.time()
+    writer = BatchWriter(reddit_file_prefix)
+    crawler = Crawler(make_reddit, writer, processed_ids, args.max_posts, args.limit,
+                      args.workers, args.image_workers)
+    try:
+        crawler.crawl(subreddits_list)
+    finally:
+        writer.close()
+        # Save the processed IDs to a file
+        with open(processed_ids_file, "w") as f:
+            json.dump(list(processed_ids), f)
+        print(f"Updated processed IDs in '{processed_ids_file}'.")
+
+    time_end_crawl = time.time()
+    time_execution_crawl = time_end_crawl - time_start_crawl
+    minutes = int(time_execution_crawl // 60)
+    seconds = int(time_execution_crawl % 60)
+    print(f"Crawling Completed in {minutes} minutes and {seconds} seconds.")
+    print(f"Checked: {crawler.posts_checked}.")
+
+    logging.info(f"Total Posts: {len(processed_ids)}")
+    logging.info("---------- Application Completed ----------")
+
+    print(f"Total Posts: {len(processed_ids)}")
+    print("Successfully ran the application.")
+
+if __name__ == "__main__":
+    main()
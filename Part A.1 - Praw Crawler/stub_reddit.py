@@ -0,0 +1,179 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+# Synthetic posts in the crawler's schema (shared with the benchmarks)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import synthetic_corpus
+
+#region Local Reddit Stand-in
+# Serves just enough of the Reddit API for crawl_reddit.py, so the crawler
+# can be run and timed offline:
+#   POST /api/v1/access_token    client credentials token
+#   GET  /r/<subreddit>/top      Listing of posts, paginated with limit/after
+#   GET  /comments/<id>          the post and its comments
+#   GET  /images/<id>.png        image bytes (for posts that link an image)
+# Both --reddit-url and --oauth-url of the crawler point at this server.
+# Posts are generated from the subreddit name, so every run sees the same data.
+#endregion
+
+IMAGE_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(2048)
+
+def _posts(subreddit, count, comments, image_ratio, base_url):
+    seed = zlib.crc32(subreddit.encode("utf-8"))
+    rng = random.Random(seed)
+    posts = []
+    for i in range(count):
+        post = synthetic_corpus.make_post(rng, seed * count + i, comments)
+        post["subreddit"] = subreddit
+        if rng.random() < image_ratio:
+            post["is_self"] = False
+            post["url"] = f"{base_url}/images/{post['id']}.png"
+        posts.append(post)
+    return posts
+
+def _thing(kind, data):
+    data = dict(data, name=f"{kind}_{data['id']}")
+    return {"kind": kind, "data": data}
+
+def _listing(children, after=None):
+    return {"kind": "Listing", "data": {"after": after, "before": None, "dist": len(children), "children": children}}
+
+class StubReddit:
+    """
+    The state of the stand-in: generated posts per subreddit and request counts.
+    latency_ms delays every response, like a round trip to the real API.
+    """
+
+    def __init__(self, posts_per_subreddit=200, comments=5, image_ratio=0.1, latency_ms=0):
+        self.posts_per_subreddit = posts_per_subreddit
+        self.comments = comments
+        self.image_ratio = image_ratio
+        self.latency = latency_ms / 1000
+        self.base_url = None
+        self.requests = 0
+        self._subreddits = {}
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def subreddit(self, name):
+        with self._lock:
+            if name not in self._subreddits:
+                posts = _posts(name, self.posts_per_subreddit, self.comments, self.image_ratio, self.base_url)
+                self._subreddits[name] = posts
+                self._by_id.update((post["id"], post) for post in posts)
+            return self._subreddits[name]
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def post(self, post_id):
+        with self._lock:
+            return self._by_id.get(post_id)
+
+def _submission(post):
+    data = {key: value for key, value in post.items() if key != "comments"}
+    data["selftext"] = data.pop("body")
+    data["link_flair_text"] = data.pop("flair_text")
+    return _thing("t3", data)
+
+def _comment(post, comment):
+    return _thing("t1", dict(comment, link_id=f"t3_{post['id']}", replies=""))
+
+class _Handler(BaseHTTPRequestHandler):
+    stub = None
+
+    def _send(self, status, body, content_type="application/json"):
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        # Plenty of budget: the crawler's own limiter sets the pace.
+        self.send_header("x-ratelimit-remaining", "1000")
+        self.send_header("x-ratelimit-used", "0")
+        self.send_header("x-ratelimit-reset", "600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.stub.count_request()
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlparse(self.path).path.rstrip("/") == "/api/v1/access_token":
+            self._send(200, {"access_token": "stub", "token_type": "bearer", "expires_in": 86400, "scope": "*"})
+        else:
+            self._send(404, {"error": 404})
+
+    def do_GET(self):
+        self.stub.count_request()
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        match = re.fullmatch(r"/r/([^/]+)/top", path)
+        if match:
+            posts = self.stub.subreddit(match.group(1))
+            start = 0
+            if params.get("after"):
+                ids = [post["id"] for post in posts]
+                after = params["after"].split("_", 1)[-1]
+                start = ids.index(after) + 1 if after in ids else len(posts)
+            page = posts[start:start + min(int(params.get("limit", 25)), 100)]
+            after = f"t3_{page[-1]['id']}" if page and start + len(page) < len(posts) else None
+            return self._send(200, _listing([_submission(post) for post in page], after))
+
+        match = re.fullmatch(r"/comments/([^/]+)(/.*)?", path)
+        if match:
+            post = self.stub.post(match.group(1))
+            if post is None:
+                return self._send(404, {"error": 404})
+            return self._send(200, [_listing([_submission(post)]),
+                                    _listing([_comment(post, comment) for comment in post["comments"]])])
+
+        if re.fullmatch(r"/images/[^/]+", path):
+            return self._send(200, IMAGE_BYTES, "image/png")
+        self._send(404, {"error": 404})
+
+def serve(host="127.0.0.1", port=0, **settings):
+    """
+    Starts the stand-in on a background thread and returns (server, stub).
+    With port 0 a free port is picked; the URL is stub.base_url.
+    """
+    stub = StubReddit(**settings)
+    handler = type("Handler", (_Handler,), {"stub": stub})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    stub.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="stub-reddit", daemon=True).start()
+    return server, stub
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Reddit API and image hosts")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--posts", type=int, default=200, help="posts per subreddit")
+    parser.add_argument("--comments", type=int, default=5, help="comments per post")
+    parser.add_argument("--image-ratio", type=float, default=0.1, help="share of posts linking an image")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every response")
+    args = parser.parse_args()
+    server, stub = serve(port=args.port, posts_per_subreddit=args.posts, comments=args.comments,
+                         image_ratio=args.image_ratio, latency_ms=args.latency_ms)
+    print(f"Serving a stand-in Reddit API on {stub.base_url}")
+    print(f"Crawl it with: python crawl_reddit.py --reddit-url {stub.base_url} --oauth-url {stub.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
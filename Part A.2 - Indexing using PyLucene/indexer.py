@@ -4,28 +4,112 @@ import lucene
 import os
 import json
 import time
-from org.apache.lucene.store import SimpleFSDirectory, NIOFSDirectory
+import hashlib
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+# Shared streaming reader for the crawler's batch files (lives with the web app utils)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Part B.2 - Web App", "utils"))
+import reddit_reader
+from org.apache.lucene.store import FSDirectory
 from java.nio.file import Paths
 from org.apache.lucene.analysis.standard import StandardAnalyzer
-from org.apache.lucene.document import Document, Field, FieldType, LongPoint
+from org.apache.lucene.document import Document, Field, FieldType, LongPoint, StringField, StoredField, \
+    NumericDocValuesField, SortedDocValuesField
+from org.apache.lucene.util import BytesRef
 from org.apache.lucene.queryparser.classic import QueryParser
-from org.apache.lucene.index import IndexWriter, IndexWriterConfig, IndexOptions, DirectoryReader
-from org.apache.lucene.search import IndexSearcher, BooleanQuery, BooleanClause, TermQuery, PhraseQuery, WildcardQuery
+from org.apache.lucene.index import IndexWriter, IndexWriterConfig, IndexOptions, DirectoryReader, TieredMergePolicy
+from org.apache.lucene.search import SearcherManager, SearcherFactory, BooleanQuery, BooleanClause, TermQuery, PhraseQuery, WildcardQuery
 from org.apache.lucene.index import Term
 
-def create_index(index_dir, data_dir):
+# IndexWriter settings for bulk indexing (see writer_config).
+DEFAULT_WRITER_SETTINGS = {
+    "ram_buffer_mb": 256,           # flush segments by RAM use instead of the 16 MB default
+    "segments_per_tier": 10,        # TieredMergePolicy: higher merges less often while indexing
+    "max_merged_segment_mb": 5120,
+    "compound_files": False,        # .cfs files save file handles but cost a copy per segment
+}
+
+def writer_config(analyzer, open_mode, settings=None):
+    """
+    Builds the IndexWriterConfig from DEFAULT_WRITER_SETTINGS overridden by `settings`.
+    """
+    settings = dict(DEFAULT_WRITER_SETTINGS, **(settings or {}))
+    config = IndexWriterConfig(analyzer)
+    config.setOpenMode(open_mode)
+    config.setRAMBufferSizeMB(float(settings["ram_buffer_mb"]))
+    merge_policy = TieredMergePolicy()
+    merge_policy.setSegmentsPerTier(float(settings["segments_per_tier"]))
+    merge_policy.setMaxMergedSegmentMB(float(settings["max_merged_segment_mb"]))
+    merge_policy.setNoCFSRatio(1.0 if settings["compound_files"] else 0.0)
+    config.setMergePolicy(merge_policy)
+    config.setUseCompoundFile(bool(settings["compound_files"]))
+    return config
+
+# Bumped whenever the document fields change, forcing a full rebuild.
+INDEX_SCHEMA = 2
+
+# Numeric post metadata, indexed for range filters and doc-value sorts
+NUMERIC_FIELDS = ("created_utc", "score", "num_comments")
+
+def add_numeric_field(doc, name, value):
+    """
+    Adds a long as a point (range filters), doc value (sorting) and stored field.
+    """
+    doc.add(LongPoint(name, value))
+    doc.add(NumericDocValuesField(name, value))
+    doc.add(StoredField(name, value))
+
+def document_id(record):
+    """
+    The term a post is upserted on: its id, else its URL, else a hash of its
+    text, so posts lacking both do not replace one another.
+    """
+    if record.get('id') or record.get('url'):
+        return record.get('id') or record.get('url')
+    text = "\0".join(record.get(field) or '' for field in ('title', 'body', 'comments_text'))
+    return "sha1:" + hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def scan_files(paths):
+    """
+    Returns {filename: {"size", "mtime_ns"}} used to detect changed batch files.
+    """
+    files = {}
+    for path in paths:
+        stat = os.stat(path)
+        files[os.path.basename(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return files
+
+def create_index(index_dir, data_dir, threads=4, writer_settings=None, full=False):
     """
     Index multiple Reddit JSON/TXT files from a given directory while measuring execution time.
+
+    Documents are upserted with updateDocument keyed on the post id, so only
+    files that are new or changed since the last run (tracked in
+    <index_dir>.manifest.json) are read; posts of changed or deleted files
+    that are gone are removed. full=True (or a missing index) rebuilds from
+    scratch. Parsing runs in a process pool and `threads` Python threads,
+    each attached to the JVM, build and add the documents.
     """
     start_time = time.time()  # Start total timing
 
     if not os.path.exists(index_dir):
         os.mkdir(index_dir)
-    store = SimpleFSDirectory(Paths.get(index_dir))
+    store = FSDirectory.open(Paths.get(index_dir))
+    manifest_path = index_dir.rstrip("/") + ".manifest.json"
+    manifest = None
+    if not full and os.path.exists(manifest_path) and DirectoryReader.indexExists(store):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("schema") != INDEX_SCHEMA:
+            # Indexed fields changed, existing documents lack them.
+            manifest = None
+    open_mode = IndexWriterConfig.OpenMode.CREATE if manifest is None else IndexWriterConfig.OpenMode.CREATE_OR_APPEND
+    manifest = manifest or {"schema": INDEX_SCHEMA, "files": {}}
+
     analyzer = StandardAnalyzer()
-    config = IndexWriterConfig(analyzer)
-    config.setOpenMode(IndexWriterConfig.OpenMode.CREATE)
-    writer = IndexWriter(store, config)
+    writer = IndexWriter(store, writer_config(analyzer, open_mode, writer_settings))
 
     # Define field types for indexing
     metaType = FieldType()
@@ -37,54 +121,163 @@ def create_index(index_dir, data_dir):
     textType.setTokenized(True)
     textType.setIndexOptions(IndexOptions.DOCS_AND_FREQS_AND_POSITIONS)
 
-    # Iterate over all JSON/TXT files in the directory
-    for filename in os.listdir(data_dir):
-        file_path = os.path.join(data_dir, filename)
-        if filename.endswith(".txt") or filename.endswith(".json"):
-            print(f"Indexing file: {file_path}")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        post = json.loads(line.strip())
-
-                        title = post.get('title', '')
-                        body = post.get('body', '')
-                        url = post.get('url','')
-                        comments = ' '.join([comment['body'] for comment in post.get('comments', [])])
-                        mod_date = int(post.get('mod_date', 0))  # Ensure mod_date is indexed as an integer
-
-                        doc = Document()
-                        doc.add(Field('URL', url, metaType))
-                        doc.add(Field('Title', title, metaType))
-                        doc.add(Field('Body', body, textType))
-                        doc.add(Field('Comments', comments, textType))
-                        doc.add(LongPoint("mod_date", mod_date))  # Store mod_date as a long integer
-                        writer.addDocument(doc)
-                    except json.JSONDecodeError:
-                        continue
-    
+    paths = reddit_reader.batch_files(data_dir, prefix="", extensions=(".txt", ".json"))
+    current_files = scan_files(paths)
+    changed = [path for path in paths if manifest["files"].get(os.path.basename(path)) != current_files[os.path.basename(path)]]
+    removed = [name for name in manifest["files"] if name not in current_files]
+
+    # Posts of changed or deleted files are dropped first; the ones still
+    # present are added back below, other copies are replaced by id.
+    for name in removed + [os.path.basename(path) for path in changed]:
+        writer.deleteDocuments(Term("source_file", name))
+
+    def build_document(record, source_file):
+        title = record.get('title', '')
+        body = record.get('body', '')
+        url = record.get('url','')
+        comments = record['comments_text']
+
+        doc = Document()
+        doc.add(StringField('id', document_id(record), Field.Store.YES))
+        doc.add(StringField('source_file', source_file, Field.Store.NO))
+        doc.add(Field('URL', url, metaType))
+        doc.add(Field('Title', title, metaType))
+        doc.add(Field('Body', body, textType))
+        doc.add(Field('Comments', comments, textType))
+        # Metadata for filters (points / terms) and sorting (doc values)
+        subreddit = (record.get('subreddit') or '').lower()
+        doc.add(StringField('subreddit', subreddit, Field.Store.YES))
+        doc.add(SortedDocValuesField('subreddit', BytesRef(subreddit)))
+        doc.add(StringField('over_18', 'true' if record.get('over_18') else 'false', Field.Store.NO))
+        for name in NUMERIC_FIELDS:
+            add_numeric_field(doc, name, int(record.get(name) or 0))
+        return doc
+
+    # Indexing threads: analysis runs in Java, which releases the GIL.
+    tasks = queue.Queue(maxsize=threads * 256)
+    failures = []
+
+    def index_worker():
+        lucene.getVMEnv().attachCurrentThread()
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            try:
+                record, source_file = task
+                doc = build_document(record, source_file)
+                writer.updateDocument(Term("id", doc.get("id")), doc)
+            except Exception as e:
+                failures.append(str(e))
+
+    workers = [threading.Thread(target=index_worker, name=f"indexer-{i}") for i in range(threads)]
+    for worker in workers:
+        worker.start()
+
+    # Stream the changed files through the shared reader, parsing files in
+    # parallel and keeping only the fields indexed above.
+    index_start = time.time()
+    doc_count = 0
+    read_stats = reddit_reader.ReadStats()
+    fields = ("id", "title", "body", "url", "comments_text", "subreddit", "over_18") + NUMERIC_FIELDS
+    # The JVM and the indexing threads are already running, so the parser
+    # processes are spawned rather than forked from this process.
+    for path, records in reddit_reader.iter_file_records(changed, fields, workers=os.cpu_count(), stats=read_stats,
+                                                         start_method="spawn"):
+        for record in records:
+            tasks.put((record, os.path.basename(path)))
+            doc_count += 1
+    for _ in workers:
+        tasks.put(None)
+    for worker in workers:
+        worker.join()
+    index_seconds = time.time() - index_start
+    print(read_stats, flush=True)
+
+    commit_start = time.time()
+    writer.commit()
+    total_docs = writer.getDocStats().numDocs
     writer.close()
+    commit_seconds = time.time() - commit_start
+
+    manifest["files"] = current_files
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
     end_time = time.time()  # End total timing
     total_runtime = end_time - start_time  # Calculate total runtime
-    print(f"Total indexing completed in {total_runtime:.2f} seconds.", flush=True)
+    print(f"Indexed {doc_count} documents from {len(changed)} changed files ({len(removed)} files removed) "
+          f"with {threads} threads: {doc_count / max(index_seconds, 1e-9):.0f} docs/sec.", flush=True)
+    print(f"Commit and merges: {commit_seconds:.2f} seconds. Index now holds {total_docs} documents.", flush=True)
+    if failures:
+        print(f"{len(failures)} documents failed, first error: {failures[0]}", flush=True)
+    print(f"Total indexing completed in {total_runtime:.2f} seconds "
+          f"({doc_count / max(total_runtime, 1e-9):.0f} docs/sec overall).", flush=True)
 
     # Save total indexing time to a file
     with open("indexing_time.txt", "w") as f:
         f.write(str(total_runtime))
 
 
-def retrieve(storedir, query_type, **kwargs):
-    searchDir = NIOFSDirectory(Paths.get(storedir))
-    searcher = IndexSearcher(DirectoryReader.open(searchDir))
-    
+# Seconds between checks for a changed index (new commits from create_index).
+REFRESH_INTERVAL = 1.0
+
+class ReusableSearcher:
+    """
+    Keeps one reader open over an index through a SearcherManager and
+    refreshes it (at most every REFRESH_INTERVAL seconds) when the index
+    changes. The analyzer is shared; QueryParser is not thread-safe, so
+    each thread gets its own.
+    """
+
+    def __init__(self, storedir):
+        self.manager = SearcherManager(FSDirectory.open(Paths.get(storedir)), SearcherFactory())
+        self.analyzer = StandardAnalyzer()
+        self._local = threading.local()
+        self._last_refresh = time.monotonic()
+        self._refresh_lock = threading.Lock()
+
+    def parser(self):
+        if not hasattr(self._local, "parser"):
+            self._local.parser = QueryParser("Body", self.analyzer)
+        return self._local.parser
+
+    def acquire(self):
+        with self._refresh_lock:
+            if time.monotonic() - self._last_refresh >= REFRESH_INTERVAL:
+                self.manager.maybeRefresh()
+                self._last_refresh = time.monotonic()
+        return self.manager.acquire()
+
+    def release(self, searcher):
+        self.manager.release(searcher)
+
+    def close(self):
+        self.manager.close()
+
+_searchers = {}
+_searchers_lock = threading.Lock()
+
+def get_searcher(storedir):
+    """
+    Returns the shared ReusableSearcher of an index directory.
+    """
+    with _searchers_lock:
+        if storedir not in _searchers:
+            _searchers[storedir] = ReusableSearcher(storedir)
+        return _searchers[storedir]
+
+def build_query(query_type, parser, **kwargs):
     boolean_query = BooleanQuery.Builder()
     
     if query_type == "boolean":
         for term, occur in kwargs.get("terms", []):  
+            # Occur may be given by name, e.g. "MUST" in a batch query file
+            if isinstance(occur, str):
+                occur = getattr(BooleanClause.Occur, occur)
             boolean_query.add(BooleanClause(TermQuery(Term("Body", term)), occur))
     
     elif query_type == "boosting":
-        parser = QueryParser("Body", StandardAnalyzer())
         boosted_query = parser.parse(kwargs.get("query", ""))
         boolean_query.add(BooleanClause(boosted_query, BooleanClause.Occur.SHOULD))
 
@@ -96,7 +289,7 @@ def retrieve(storedir, query_type, **kwargs):
         boolean_query.add(BooleanClause(phrase_query.build(), BooleanClause.Occur.MUST))
 
     elif query_type == "range":
-        field = kwargs.get("field", "mod_date")
+        field = kwargs.get("field", "created_utc")
         start, end = kwargs.get("range", (0, 0))
         range_query = LongPoint.newRangeQuery(field, start, end)
         boolean_query.add(BooleanClause(range_query, BooleanClause.Occur.MUST))
@@ -106,85 +299,167 @@ def retrieve(storedir, query_type, **kwargs):
         boolean_query.add(BooleanClause(wildcard_query, BooleanClause.Occur.MUST))
 
     else:
-        parser = QueryParser("Body", StandardAnalyzer())
         parsed_query = parser.parse(kwargs.get("query", ""))
         boolean_query.add(BooleanClause(parsed_query, BooleanClause.Occur.MUST))
 
-    topDocs = searcher.search(boolean_query.build(), kwargs.get("top_k", 10)).scoreDocs
-    results = []
-
-    for hit in topDocs:
-        doc = searcher.doc(hit.doc)
-        result = {
-            "score": hit.score,
-            "url": doc.get("URL"),
-            "title": doc.get("Title"),
-            "body": doc.get("Body"),
-            "comments": doc.get("Comments")
-        }
-        results.append(result)
+    return boolean_query.build()
 
-        # Print search results to console
-        print("\n----------------------------------------")
-        print(f"Score: {result['score']}")
-        print(f"URL: {result['url']}")
-        print(f"Title: {result['title']}")
-        print(f"Body: {result['body'][:500]}...")  # Print only first 500 chars to avoid long output
-        print(f"Comments: {result['comments'][:300]}...")  # Print only first 300 chars
-        print("----------------------------------------\n")
+def retrieve(storedir, query_type, verbose=True, **kwargs):
+    """
+    Runs one query of the given type over the shared searcher of storedir.
+    With verbose=False nothing is printed (e.g. in batch mode).
+    """
+    shared = get_searcher(storedir)
+    query = build_query(query_type, shared.parser(), **kwargs)
+
+    searcher = shared.acquire()
+    try:
+        topDocs = searcher.search(query, kwargs.get("top_k", 10)).scoreDocs
+        results = []
+
+        for hit in topDocs:
+            doc = searcher.doc(hit.doc)
+            result = {
+                "score": hit.score,
+                "id": doc.get("id"),
+                "url": doc.get("URL"),
+                "title": doc.get("Title"),
+                "body": doc.get("Body"),
+                "comments": doc.get("Comments")
+            }
+            results.append(result)
+
+            if verbose:
+                # Print search results to console
+                print("\n----------------------------------------")
+                print(f"Score: {result['score']}")
+                print(f"URL: {result['url']}")
+                print(f"Title: {result['title']}")
+                print(f"Body: {result['body'][:500]}...")  # Print only first 500 chars to avoid long output
+                print(f"Comments: {result['comments'][:300]}...")  # Print only first 300 chars
+                print("----------------------------------------\n")
+    finally:
+        shared.release(searcher)
 
     return results
 
-# Initialize Lucene VM
-lucene.initVM(vmargs=['-Djava.awt.headless=true'])
-
-# Directory containing multiple Reddit JSON/TXT files
-data_directory = '/home/cs242/CS242-Project-Reddit/data'  # Change this to the path of your data directory
-
-# Path to store Lucene index
-index_directory = 'reddit_lucene_index/'
-
-# Automatically index the Reddit data
-print("\nIndexing the Reddit data...")
-create_index(index_directory, data_directory)
-
-# Choose a query type for searching
-print("\nChoose a query type:")
-print("1. Basic Query")
-print("2. Boolean Query (AND/OR)")
-print("3. Boosting Query")
-print("4. Proximity Search")
-print("5. Wildcard Search")
-
-query_type = input("Enter query type (1-5): ").strip()
-
-if query_type == "1":
-    query = input("Enter search query: ").strip()
-    search_args = {"query_type": "default", "query": query}
-
-elif query_type == "2":
-    term1 = input("Enter first term: ").strip()
-    term2 = input("Enter second term: ").strip()
-    search_args = {"query_type": "boolean", "terms": [(term1, BooleanClause.Occur.MUST), (term2, BooleanClause.Occur.SHOULD)]}
-
-elif query_type == "3":
-    query = input("Enter search query with boosting (e.g., 'ios^2.0 OR android'): ").strip()
-    search_args = {"query_type": "boosting", "query": query}
-
-elif query_type == "4":
-    phrase = input("Enter phrase for proximity search (separate words by space): ").strip().split()
-    slop = int(input("Enter proximity slop (distance between words): ").strip())
-    search_args = {"query_type": "proximity", "phrase": phrase, "slop": slop}
-
-elif query_type == "5":
-    pattern = input("Enter wildcard pattern (e.g., 'android*life'): ").strip()
-    search_args = {"query_type": "wildcard", "pattern": pattern}
+def run_batch(storedir, queries_path, output_path, threads=4, top_k=10):
+    """
+    Runs every query of a JSONL file (one retrieve() argument object per line,
+    e.g. {"query_type": "proximity", "phrase": ["linux", "kernel"], "slop": 2})
+    in parallel over the shared searcher. Writes one line per query, in input
+    order, with its latency and hits (score, id, url, title) to output_path.
+    """
+    with open(queries_path, "r") as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+
+    def run(spec):
+        spec = dict(spec)
+        spec.setdefault("top_k", top_k)
+        start = time.perf_counter()
+        try:
+            results = retrieve(storedir, verbose=False, **spec)
+            error = None
+        except Exception as e:
+            results, error = [], str(e)
+        latency_ms = (time.perf_counter() - start) * 1000
+        hits = [{key: r[key] for key in ("score", "id", "url", "title")} for r in results]
+        return {"query": spec, "latency_ms": latency_ms, "hits": hits, "error": error}
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=threads, initializer=lambda: lucene.getVMEnv().attachCurrentThread()) as pool, \
+            open(output_path, "w") as out:
+        latencies = []
+        for row in pool.map(run, queries):
+            latencies.append(row["latency_ms"])
+            out.write(json.dumps(row) + "\n")
+    total_runtime = time.time() - start_time
+
+    if latencies:
+        latencies.sort()
+        print(f"Ran {len(latencies)} queries with {threads} threads in {total_runtime:.2f} seconds "
+              f"({len(latencies) / max(total_runtime, 1e-9):.0f} queries/sec), latency ms: "
+              f"mean {sum(latencies) / len(latencies):.2f}, p50 {latencies[len(latencies) // 2]:.2f}, "
+              f"p95 {latencies[int(len(latencies) * 0.95)]:.2f}.", flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the Reddit data with PyLucene and run a query")
+    parser.add_argument("--data-dir", default='/home/cs242/CS242-Project-Reddit/data')
+    parser.add_argument("--index-dir", default='reddit_lucene_index/')
+    parser.add_argument("--threads", type=int, default=4, help="indexing threads")
+    parser.add_argument("--ram-buffer-mb", type=float, default=DEFAULT_WRITER_SETTINGS["ram_buffer_mb"])
+    parser.add_argument("--segments-per-tier", type=float, default=DEFAULT_WRITER_SETTINGS["segments_per_tier"])
+    parser.add_argument("--compound-files", action="store_true", help="write compound (.cfs) segments")
+    parser.add_argument("--full", action="store_true", help="rebuild the index from scratch")
+    parser.add_argument("--no-index", action="store_true", help="search the existing index without updating it")
+    parser.add_argument("--index-only", action="store_true", help="exit after indexing, without searching")
+    parser.add_argument("--batch", help="JSONL file of queries to run instead of the interactive prompt")
+    parser.add_argument("--output", default="batch_results.jsonl", help="where --batch writes results and latencies")
+    parser.add_argument("--search-threads", type=int, default=4)
+    args = parser.parse_args()
+
+    # Initialize Lucene VM
+    lucene.initVM(vmargs=['-Djava.awt.headless=true'])
+
+    # Directory containing multiple Reddit JSON/TXT files
+    data_directory = args.data_dir  # Change --data-dir to the path of your data directory
+
+    # Path to store Lucene index
+    index_directory = args.index_dir
+
+    # Automatically index the Reddit data (only new or changed files unless --full)
+    if not args.no_index:
+        print("\nIndexing the Reddit data...")
+        writer_settings = {
+            "ram_buffer_mb": args.ram_buffer_mb,
+            "segments_per_tier": args.segments_per_tier,
+            "compound_files": args.compound_files,
+        }
+        create_index(index_directory, data_directory, threads=args.threads, writer_settings=writer_settings, full=args.full)
+    if args.index_only:
+        sys.exit(0)
+
+    if args.batch:
+        run_batch(index_directory, args.batch, args.output, threads=args.search_threads)
+        sys.exit(0)
+
+    # Choose a query type for searching
+    print("\nChoose a query type:")
+    print("1. Basic Query")
+    print("2. Boolean Query (AND/OR)")
+    print("3. Boosting Query")
+    print("4. Proximity Search")
+    print("5. Wildcard Search")
+
+    query_type = input("Enter query type (1-5): ").strip()
+
+    if query_type == "1":
+        query = input("Enter search query: ").strip()
+        search_args = {"query_type": "default", "query": query}
+
+    elif query_type == "2":
+        term1 = input("Enter first term: ").strip()
+        term2 = input("Enter second term: ").strip()
+        search_args = {"query_type": "boolean", "terms": [(term1, BooleanClause.Occur.MUST), (term2, BooleanClause.Occur.SHOULD)]}
+
+    elif query_type == "3":
+        query = input("Enter search query with boosting (e.g., 'ios^2.0 OR android'): ").strip()
+        search_args = {"query_type": "boosting", "query": query}
+
+    elif query_type == "4":
+        phrase = input("Enter phrase for proximity search (separate words by space): ").strip().split()
+        slop = int(input("Enter proximity slop (distance between words): ").strip())
+        search_args = {"query_type": "proximity", "phrase": phrase, "slop": slop}
+
+    elif query_type == "5":
+        pattern = input("Enter wildcard pattern (e.g., 'android*life'): ").strip()
+        search_args = {"query_type": "wildcard", "pattern": pattern}
 
-else:
-    print("Invalid choice! Exiting...")
-    search_args = None
+    else:
+        print("Invalid choice! Exiting...")
+        search_args = None
 
-# Perform the search after indexing
-if search_args:
-    retrieve(index_directory, **search_args)
+    # Perform the search after indexing
+    if search_args:
+        retrieve(index_directory, **search_args)
 
@@ -1,16 +1,37 @@
+import org.apache.lucene.analysis.Analyzer;
+import org.apache.lucene.analysis.en.EnglishAnalyzer;
+import org.apache.lucene.analysis.TokenStream;
+import org.apache.lucene.analysis.tokenattributes.CharTermAttribute;
+import org.apache.lucene.analysis.tokenattributes.OffsetAttribute;
 import org.apache.lucene.analysis.standard.StandardAnalyzer;
 import org.apache.lucene.document.Document;
+import org.apache.lucene.document.LongPoint;
 import org.apache.lucene.index.DirectoryReader;
+import org.apache.lucene.index.IndexableField;
+import org.apache.lucene.index.Term;
 import org.apache.lucene.queryparser.classic.QueryParser;
+import org.apache.lucene.search.BooleanClause;
+import org.apache.lucene.search.BooleanQuery;
 import org.apache.lucene.search.IndexSearcher;
 import org.apache.lucene.search.Query;
+import org.apache.lucene.search.QueryVisitor;
 import org.apache.lucene.search.ScoreDoc;
+import org.apache.lucene.search.Sort;
+import org.apache.lucene.search.SortField;
+import org.apache.lucene.search.TermInSetQuery;
+import org.apache.lucene.search.TermQuery;
 import org.apache.lucene.search.TopDocs;
 import org.apache.lucene.store.FSDirectory;
+import org.apache.lucene.util.BytesRef;
 
 import java.nio.file.Paths;
 import java.io.FileReader;
 import java.io.IOException;
+import java.util.ArrayList;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Locale;
+import java.util.Set;
 
 // JSON-simple imports
 import org.json.simple.JSONObject;
@@ -19,6 +40,9 @@ import org.json.simple.parser.JSONParser;
 import org.json.simple.parser.ParseException;
 
 public class LuceneSearch {
+    // Hardcoded path, relative to the web app directory
+    static final String CONFIG_PATH = "./utils/config.json";
+
     public static void main(String[] args) throws Exception {
         // Expect two arguments: topK and query (which can be multiple words)
         if (args.length < 2) {
@@ -26,12 +50,10 @@ public class LuceneSearch {
             System.exit(1);
         }
 
-        // 1. Load configuration from JSON (Fixed Path)
-        String configPath = "./utils/config.json";  // Hardcoded path
-        JSONParser jsonParser = new JSONParser();
+        // 1. Load configuration from JSON
         JSONObject config;
-        try (FileReader reader = new FileReader(configPath)) {
-            config = (JSONObject) jsonParser.parse(reader);
+        try {
+            config = loadConfig(CONFIG_PATH);
         } catch (IOException | ParseException e) {
             System.err.println("{\"error\": \"Error reading/parsing config file: " + e.getMessage() + "\"}");
             return;
@@ -53,34 +75,245 @@ public class LuceneSearch {
         DirectoryReader reader = DirectoryReader.open(directory);
         IndexSearcher searcher = new IndexSearcher(reader);
 
-        // Use the StandardAnalyzer and search in the "Body" field (adjust if needed)
-        StandardAnalyzer analyzer = new StandardAnalyzer();
+        JSONObject output = search(searcher, new StandardAnalyzer(), queryStr, topK, null, 0, null, null);
+
+        // 4. Print JSON output to stdout
+        System.out.println(output.toJSONString());
+
+        reader.close();
+    }
+
+    static JSONObject loadConfig(String configPath) throws IOException, ParseException {
+        JSONParser jsonParser = new JSONParser();
+        try (FileReader reader = new FileReader(configPath)) {
+            return (JSONObject) jsonParser.parse(reader);
+        }
+    }
+
+    // Reads an integer setting from the config, falling back to a default when missing
+    static int intSetting(JSONObject config, String key, int defaultValue) {
+        Object value = config.get(key);
+        return value instanceof Number ? ((Number) value).intValue() : defaultValue;
+    }
+
+    // Metadata returned with each hit: response key -> stored index field
+    static final String[][] METADATA_FIELDS = {
+        {"Subreddit", "subreddit"}, {"CreatedUtc", "created_utc"},
+        {"RedditScore", "score"}, {"NumComments", "num_comments"},
+    };
+
+    /**
+     * Runs a query against the "Body" field and builds the JSON response:
+     * {"totalHits": n, "results": [{"score", "URL", "PostId", "Title", "Body", "Comments", "Snippet", ...}, ...],
+     *  "timings": {"parseMs", "searchMs", "fetchMs"}}
+     * Only the requested fields are returned (null means all stored fields);
+     * "Snippet" is the best-matching passage of the body, at most snippetChars
+     * long, HTML-escaped with the query terms wrapped in <mark>.
+     * filters (see filterQuery) become non-scoring FILTER clauses and sort
+     * ("relevance", "newest", "top", "comments") sorts on doc values.
+     * QueryParser is not thread-safe, so a new one is built per call; the analyzer
+     * and searcher may be shared between threads.
+     */
+    @SuppressWarnings("unchecked")
+    static JSONObject search(IndexSearcher searcher, Analyzer analyzer, String queryStr, int topK,
+                             Set<String> fields, int snippetChars, JSONObject filters, String sort)
+            throws IOException, org.apache.lucene.queryparser.classic.ParseException {
+        long started = System.nanoTime();
         QueryParser parser = new QueryParser("Body", analyzer);
         Query query = parser.parse(queryStr);
 
-        TopDocs results = searcher.search(query, topK);
+        Query filtered = filterQuery(query, filters);
+        Sort order = sortOrder(sort);
+        long parsed = System.nanoTime();
+        TopDocs results = order == null
+            ? searcher.search(filtered, topK)
+            : searcher.search(filtered, topK, order, true);
+        long searched = System.nanoTime();
+
+        Set<String> terms = new HashSet<>();
+        boolean withSnippet = snippetChars > 0 && (fields == null || fields.contains("Snippet"));
+        if (withSnippet) {
+            // Terms of the user query only, filters are not highlighted.
+            // StandardAnalyzer keeps stop words, so they are skipped here
+            // (like utils/snippets.py does for BERT results).
+            Set<Term> queryTerms = new HashSet<>();
+            query.visit(QueryVisitor.termCollector(queryTerms));
+            for (Term term : queryTerms) {
+                if (!EnglishAnalyzer.ENGLISH_STOP_WORDS_SET.contains(term.text())) {
+                    terms.add(term.text());
+                }
+            }
+        }
 
-        // 4. Build JSON output
         JSONObject output = new JSONObject();
         output.put("totalHits", results.totalHits.value);
         JSONArray resultsArray = new JSONArray();
 
         for (ScoreDoc sd : results.scoreDocs) {
-            Document doc = reader.document(sd.doc);
+            Document doc = searcher.doc(sd.doc);
             JSONObject docJson = new JSONObject();
             docJson.put("score", sd.score);
             docJson.put("URL", doc.get("URL"));
-            docJson.put("Title", doc.get("Title"));
-            docJson.put("Body", doc.get("Body"));
-            docJson.put("Comments", doc.get("Comments"));
+            // Reddit post id, so hybrid search can match the post across engines
+            if (doc.get("id") != null) {
+                docJson.put("PostId", doc.get("id"));
+            }
+            for (String field : new String[] {"Title", "Body", "Comments"}) {
+                if (fields == null || fields.contains(field)) {
+                    docJson.put(field, doc.get(field));
+                }
+            }
+            for (String[] field : METADATA_FIELDS) {
+                IndexableField value = doc.getField(field[1]);
+                if (value != null && (fields == null || fields.contains(field[0]))) {
+                    docJson.put(field[0], value.numericValue() != null ? value.numericValue() : value.stringValue());
+                }
+            }
+            if (withSnippet) {
+                docJson.put("Snippet", snippet(analyzer, doc.get("Body"), terms, snippetChars));
+            }
             resultsArray.add(docJson);
         }
 
         output.put("results", resultsArray);
 
-        // 5. Print JSON output to stdout
-        System.out.println(output.toJSONString());
+        // Stage timings for the client's latency metrics
+        JSONObject timings = new JSONObject();
+        timings.put("parseMs", (parsed - started) / 1e6);
+        timings.put("searchMs", (searched - parsed) / 1e6);
+        timings.put("fetchMs", (System.nanoTime() - searched) / 1e6);
+        output.put("timings", timings);
+        return output;
+    }
 
-        reader.close();
+    /**
+     * Wraps the query with index-level filters on the metadata fields:
+     *   {"subreddit": "linux" or ["linux", "ubuntu"], "after": epochSeconds,
+     *    "before": epochSeconds, "minScore": n, "minComments": n, "over18": false}
+     * All given filters must match; they do not change the scores.
+     */
+    static Query filterQuery(Query query, JSONObject filters) {
+        if (filters == null || filters.isEmpty()) {
+            return query;
+        }
+        BooleanQuery.Builder builder = new BooleanQuery.Builder();
+        builder.add(query, BooleanClause.Occur.MUST);
+
+        Object subreddit = filters.get("subreddit");
+        if (subreddit instanceof String) {
+            builder.add(new TermQuery(new Term("subreddit", ((String) subreddit).toLowerCase(Locale.ROOT))), BooleanClause.Occur.FILTER);
+        } else if (subreddit instanceof JSONArray) {
+            List<BytesRef> names = new ArrayList<>();
+            for (Object name : (JSONArray) subreddit) {
+                names.add(new BytesRef(((String) name).toLowerCase(Locale.ROOT)));
+            }
+            builder.add(new TermInSetQuery("subreddit", names), BooleanClause.Occur.FILTER);
+        }
+
+        Object after = filters.get("after");
+        Object before = filters.get("before");
+        if (after instanceof Number || before instanceof Number) {
+            long from = after instanceof Number ? ((Number) after).longValue() : Long.MIN_VALUE;
+            long to = before instanceof Number ? ((Number) before).longValue() : Long.MAX_VALUE;
+            builder.add(LongPoint.newRangeQuery("created_utc", from, to), BooleanClause.Occur.FILTER);
+        }
+        if (filters.get("minScore") instanceof Number) {
+            long minScore = ((Number) filters.get("minScore")).longValue();
+            builder.add(LongPoint.newRangeQuery("score", minScore, Long.MAX_VALUE), BooleanClause.Occur.FILTER);
+        }
+        if (filters.get("minComments") instanceof Number) {
+            long minComments = ((Number) filters.get("minComments")).longValue();
+            builder.add(LongPoint.newRangeQuery("num_comments", minComments, Long.MAX_VALUE), BooleanClause.Occur.FILTER);
+        }
+        if (filters.get("over18") instanceof Boolean) {
+            builder.add(new TermQuery(new Term("over_18", filters.get("over18").toString())), BooleanClause.Occur.FILTER);
+        }
+        return builder.build();
+    }
+
+    // Doc-value sort for a sort name, or null to rank by relevance
+    static Sort sortOrder(String sort) {
+        if (sort == null || sort.isEmpty() || sort.equals("relevance")) {
+            return null;
+        }
+        switch (sort) {
+            case "newest":
+                return new Sort(new SortField("created_utc", SortField.Type.LONG, true), SortField.FIELD_SCORE);
+            case "top":
+                return new Sort(new SortField("score", SortField.Type.LONG, true), SortField.FIELD_SCORE);
+            case "comments":
+                return new Sort(new SortField("num_comments", SortField.Type.LONG, true), SortField.FIELD_SCORE);
+            default:
+                throw new IllegalArgumentException("Unknown sort order: " + sort);
+        }
+    }
+
+    /**
+     * Picks the window of at most maxChars characters containing the most query
+     * term occurrences and returns it HTML-escaped, with the terms highlighted.
+     */
+    static String snippet(Analyzer analyzer, String text, Set<String> terms, int maxChars) throws IOException {
+        if (text == null) {
+            return "";
+        }
+        List<int[]> matches = new ArrayList<>();
+        try (TokenStream stream = analyzer.tokenStream("Body", text)) {
+            CharTermAttribute term = stream.addAttribute(CharTermAttribute.class);
+            OffsetAttribute offset = stream.addAttribute(OffsetAttribute.class);
+            stream.reset();
+            while (stream.incrementToken()) {
+                if (terms.contains(term.toString())) {
+                    matches.add(new int[] {offset.startOffset(), offset.endOffset()});
+                }
+            }
+            stream.end();
+        }
+
+        int start = 0;
+        int best = 0;
+        for (int i = 0; i < matches.size(); i++) {
+            int windowStart = matches.get(i)[0];
+            int count = 0;
+            for (int j = i; j < matches.size() && matches.get(j)[1] <= windowStart + maxChars; j++) {
+                count++;
+            }
+            if (count > best) {
+                best = count;
+                start = windowStart;
+            }
+        }
+        // Leave some context before the first match, starting at a word boundary
+        start = Math.max(0, start - maxChars / 4);
+        int end = Math.min(text.length(), start + maxChars);
+        if (start > 0) {
+            int space = text.indexOf(' ', start);
+            if (space >= 0 && space < end) {
+                start = space + 1;
+            }
+        }
+
+        StringBuilder out = new StringBuilder();
+        if (start > 0) {
+            out.append("\u2026 ");
+        }
+        int position = start;
+        for (int[] match : matches) {
+            if (match[0] < position || match[1] > end) {
+                continue;
+            }
+            out.append(escapeHtml(text.substring(position, match[0])));
+            out.append("<mark>").append(escapeHtml(text.substring(match[0], match[1]))).append("</mark>");
+            position = match[1];
+        }
+        out.append(escapeHtml(text.substring(position, end)));
+        if (end < text.length()) {
+            out.append(" \u2026");
+        }
+        return out.toString();
+    }
+
+    static String escapeHtml(String text) {
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+                   .replace("\"", "&quot;").replace("'", "&#39;");
     }
 }
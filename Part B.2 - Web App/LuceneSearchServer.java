@@ -0,0 +1,141 @@
+import org.apache.lucene.analysis.Analyzer;
+import org.apache.lucene.analysis.standard.StandardAnalyzer;
+import org.apache.lucene.search.IndexSearcher;
+import org.apache.lucene.search.SearcherFactory;
+import org.apache.lucene.search.SearcherManager;
+import org.apache.lucene.store.FSDirectory;
+
+import java.io.BufferedReader;
+import java.io.BufferedWriter;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Paths;
+import java.util.HashSet;
+import java.util.Set;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.ScheduledExecutorService;
+import java.util.concurrent.TimeUnit;
+
+// JSON-simple imports
+import org.json.simple.JSONArray;
+import org.json.simple.JSONObject;
+import org.json.simple.parser.JSONParser;
+
+/**
+ * Long-lived Lucene search backend used by the web app.
+ *
+ * Keeps one SearcherManager open over the index and answers queries on a
+ * loopback socket, one JSON object per line in each direction:
+ *   request:  {"topK": 10, "query": "apple macos", "fields": ["Title", "Snippet"], "snippetChars": 300}
+ *   response: same JSON as LuceneSearch, or {"error": ..., "details": ...}
+ * "fields" and "snippetChars" are optional (all stored fields, no snippet), as are
+ * "filters" (e.g. {"subreddit": "linux", "after": 1609459200, "minScore": 100})
+ * and "sort" ("relevance", "newest", "top", "comments").
+ * Connections are persistent and served by a fixed pool of worker threads.
+ * The reader is refreshed in the background so a rebuilt index is picked up
+ * without a restart. On startup the bound port is printed as {"port": n};
+ * the server exits when its stdin is closed (i.e. the parent process died).
+ */
+public class LuceneSearchServer {
+    public static void main(String[] args) throws Exception {
+        JSONObject config = LuceneSearch.loadConfig(LuceneSearch.CONFIG_PATH);
+        // -DindexDir=... serves another index (e.g. the benchmark's)
+        String indexDir = System.getProperty("indexDir", (String) config.get("indexDir"));
+        int workers = LuceneSearch.intSetting(config, "serverWorkers", 4);
+        int refreshMs = LuceneSearch.intSetting(config, "refreshIntervalMs", 1000);
+        int port = args.length > 0 ? Integer.parseInt(args[0]) : 0;
+
+        FSDirectory directory = FSDirectory.open(Paths.get(indexDir));
+        SearcherManager manager = new SearcherManager(directory, new SearcherFactory());
+        Analyzer analyzer = new StandardAnalyzer();
+
+        // Reopen the reader when the index changes on disk
+        ScheduledExecutorService refresher = Executors.newSingleThreadScheduledExecutor(r -> {
+            Thread t = new Thread(r, "searcher-refresh");
+            t.setDaemon(true);
+            return t;
+        });
+        refresher.scheduleWithFixedDelay(() -> {
+            try {
+                manager.maybeRefresh();
+            } catch (IOException e) {
+                System.err.println("Error refreshing searcher: " + e.getMessage());
+            }
+        }, refreshMs, refreshMs, TimeUnit.MILLISECONDS);
+
+        // Shut down together with the parent process
+        Thread stdinWatcher = new Thread(() -> {
+            try {
+                while (System.in.read() != -1) {
+                    // Ignore any input, we only wait for EOF
+                }
+            } catch (IOException e) {
+                // Treat a broken pipe like EOF
+            }
+            System.exit(0);
+        }, "stdin-watcher");
+        stdinWatcher.setDaemon(true);
+        stdinWatcher.start();
+
+        ExecutorService pool = Executors.newFixedThreadPool(workers);
+        try (ServerSocket server = new ServerSocket(port, 50, InetAddress.getLoopbackAddress())) {
+            System.out.println("{\"port\": " + server.getLocalPort() + "}");
+            System.out.flush();
+            while (true) {
+                Socket socket = server.accept();
+                pool.submit(() -> serve(socket, manager, analyzer));
+            }
+        }
+    }
+
+    // Answers requests on one connection until the client closes it
+    @SuppressWarnings("unchecked")
+    private static void serve(Socket socket, SearcherManager manager, Analyzer analyzer) {
+        try (Socket s = socket;
+             BufferedReader in = new BufferedReader(new InputStreamReader(s.getInputStream(), StandardCharsets.UTF_8));
+             BufferedWriter out = new BufferedWriter(new OutputStreamWriter(s.getOutputStream(), StandardCharsets.UTF_8))) {
+            JSONParser jsonParser = new JSONParser();
+            String line;
+            while ((line = in.readLine()) != null) {
+                JSONObject response;
+                try {
+                    JSONObject request = (JSONObject) jsonParser.parse(line);
+                    int topK = ((Number) request.get("topK")).intValue();
+                    String queryStr = (String) request.get("query");
+                    Set<String> fields = null;
+                    if (request.get("fields") != null) {
+                        fields = new HashSet<>();
+                        for (Object field : (JSONArray) request.get("fields")) {
+                            fields.add((String) field);
+                        }
+                    }
+                    Object snippetChars = request.get("snippetChars");
+                    int snippetLength = snippetChars instanceof Number ? ((Number) snippetChars).intValue() : 0;
+
+                    IndexSearcher searcher = manager.acquire();
+                    try {
+                        response = LuceneSearch.search(searcher, analyzer, queryStr, topK, fields, snippetLength,
+                                                       (JSONObject) request.get("filters"), (String) request.get("sort"));
+                    } finally {
+                        manager.release(searcher);
+                    }
+                } catch (Exception e) {
+                    response = new JSONObject();
+                    response.put("error", "Error executing Lucene search");
+                    response.put("details", String.valueOf(e.getMessage()));
+                }
+                out.write(response.toJSONString());
+                out.write("\n");
+                out.flush();
+            }
+        } catch (IOException e) {
+            // Client went away, nothing to clean up beyond the socket
+        }
+    }
+}
@@ -1,73 +1,315 @@
 import os
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Set base directories.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(BASE_DIR, "utils", "config.json")
+
+with open(CONFIG_FILE, "r") as f:
+    config = json.load(f)
 
-os.environ["OMP_NUM_THREADS"] = "1"
-os.environ["MKL_NUM_THREADS"] = "1"
+# Encoder backend (torch, torch_int8, onnx) and its thread count come from config.json.
+# The thread count must be in the environment before torch is imported.
+model_config = config.get("bertModel", {})
+num_threads = str(model_config.get("numThreads", 1))
+os.environ.setdefault("OMP_NUM_THREADS", num_threads)
+os.environ.setdefault("MKL_NUM_THREADS", num_threads)
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
-import subprocess
-import json
-from flask import Flask, render_template, request
-import platform
+from flask import Flask, render_template, request, jsonify, Response
 import numpy as np
-from utils import query_bert
+from utils import fusion, snippets, search_filters, engines
+from utils.metrics import REGISTRY, timed
+from utils.profiler import SlowRequestProfiler
+from utils.response_cache import ResponseCache, lucene_version
+from utils.lucene_client import LuceneClient
 
 app = Flask(__name__)
 
-# Set base directories.
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-INDEX_FILE = os.path.join(BASE_DIR, "utils", "bert.index")
-DATA_DIR = os.path.join(BASE_DIR, "data")
-
-# Load resources at startup.
-# If the FAISS index file exists, load it; otherwise, reindex the data.
-if os.path.exists(INDEX_FILE):
-    faiss_index = query_bert.load_faiss_index(INDEX_FILE)
-    # For simplicity, we reload posts_data from the data files.
-    _, posts_data = query_bert.load_reddit_posts(DATA_DIR)
-else:
-    faiss_index, posts_data = query_bert.reindex_data(DATA_DIR)
-    # Save the index to the file for future use.
-    query_bert.faiss.write_index(faiss_index, INDEX_FILE)
-
-# Load the model and tokenizer.
-tokenizer, model = query_bert.load_transformers_model("sentence-transformers/all-distilroberta-v1")
-
-def search_lucene(query, top_k):
-    # Determine OS for correct classpath separator
-    separator = ";" if platform.system() == "Windows" else ":"
-
-    # Get the base directory dynamically (directory where this script is located)
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-
-    # Dependencies folder where Lucene & JSON-simple JARs are located
-    dependencies_dir = os.path.join(BASE_DIR, "dependencies")
-
-    # Java class to execute
-    lucene_search_class = "LuceneSearch"
-
-    # Construct the Java command
-    command = [
-        "java",
-        "-cp",
-        f"{BASE_DIR}{separator}{dependencies_dir}/*",
-        lucene_search_class,
-        str(top_k),
-        query  # Query as a single argument
-    ]
+MODEL_NAME = model_config.get("name", "sentence-transformers/all-distilroberta-v1")
+
+# Index type (flat, ivf_flat, ivf_pq, hnsw) and its parameters come from config.json.
+# Query-time settings (nprobe, ef_search) given here override the recorded ones.
+index_type = config.get("bertIndex", {}).get("type", "flat")
+index_params = config.get("bertIndex", {}).get("params", {})
+
+# Pre-fork serving (gunicorn.conf.py sets REDDIT_SEARCH_PREFORK): this module is
+# imported once in the master, the index is loaded memory-mapped so all workers
+# share its pages, and every worker loads its own model in init_worker().
+PREFORK = os.environ.get("REDDIT_SEARCH_PREFORK") == "1"
+serving_config = config.get("serving", {})
+
+# Engines start lazily: torch, transformers and faiss are only imported once the
+# BERT engine starts, the JVM once the Lucene engine starts. With initInBackground
+# both start on background threads right away, otherwise on their first query.
+engine_config = config.get("engines", {})
+ENABLED_ENGINES = engine_config.get("enabled", ["lucene", "bert"])
+WARMUP_QUERY = engine_config.get("warmupQuery")
+# How long a search waits for its engine to finish starting.
+ENGINE_WAIT_SECONDS = engine_config.get("waitMs", 30000) / 1000
+
+# Results carry a highlighted snippet instead of whole threads unless fields are requested.
+snippet_config = config.get("snippets", {})
+SNIPPET_CHARS = snippet_config.get("chars", 300)
+DEFAULT_FIELDS = snippet_config.get("fields", ["Title", "Snippet"])
+
+# The BERT index is served from versioned snapshots (see utils/snapshots.py).
+# Startup loads the last published snapshot right away while a rebuild runs in
+# its own process; a newly published snapshot is swapped in between requests.
+snapshot_config = config.get("snapshots", {})
+SNAPSHOTS_DIR = os.path.join(BASE_DIR, snapshot_config.get("dir", "./utils/snapshots"))
+exact_scan_max = config.get("bertFilters", {}).get("exactScanMax", 20000)
+# Concurrent BERT queries are encoded and searched in micro-batches.
+batching_config = config.get("bertBatching", {})
+
+tokenizer = model = None
+snapshot_manager = None
+bert_batcher = None
+
+def load_snapshot(snapshot_dir, version):
+    from utils import query_bert, snapshots, vector_filters
+    from utils.doc_store import DocStore
+    index_path = os.path.join(snapshot_dir, "bert.index")
+    return snapshots.Snapshot(
+        version,
+        query_bert.load_faiss_index(index_path, index_params, mmap=PREFORK and serving_config.get("mmapIndex", True)),
+        # Post fields are read lazily from the memory-mapped store, FAISS ids are its rows.
+        DocStore(os.path.join(snapshot_dir, "bert.docs")),
+        # Metadata bitmaps over the FAISS ids for filtered BERT search.
+        vector_filters.MetadataFilters.load(vector_filters.filters_path(index_path)))
+
+def prepare_bert():
+    """
+    Loads the last published index snapshot and starts a background rebuild.
+    Runs in the gunicorn master, so the workers share the mapped snapshot.
+    """
+    global snapshot_manager
+    if snapshot_manager is not None:
+        return
+    from utils import snapshots
+    manager = snapshots.SnapshotManager(
+        SNAPSHOTS_DIR, load_snapshot, BASE_DIR,
+        interval_ms=snapshot_config.get("reloadIntervalMs", 2000),
+        rebuild_interval_minutes=snapshot_config.get("rebuildIntervalMinutes", 0))
+    manager.check()
+    if snapshot_config.get("rebuildOnStart", True) or manager.current is None:
+        # Embeds new or changed posts from ./data and publishes a snapshot if anything changed.
+        manager.rebuild()
+    snapshot_manager = manager
+
+def init_bert():
+    """
+    Loads the encoder and starts the snapshot watcher and the query batcher.
+    """
+    global tokenizer, model, bert_batcher
+    from utils import query_bert
+    from utils.batcher import QueryBatcher
+    prepare_bert()
+    if model is None:
+        tokenizer, model = query_bert.load_transformers_model(
+            MODEL_NAME, backend=model_config.get("backend", "torch"), num_threads=int(num_threads))
+    snapshot_manager.start()
+    if batching_config.get("enabled", True) and bert_batcher is None:
+        # Every query is searched on the index of its own snapshot.
+        bert_batcher = QueryBatcher(None, tokenizer, model,
+                                    window_ms=batching_config.get("windowMs", 5),
+                                    max_batch=batching_config.get("maxBatch", 16))
+
+def bert_unavailable():
+    if snapshot_manager is None or snapshot_manager.current is not None:
+        return None
+    return snapshot_manager.last_error or "The first BERT index build is still running."
+
+def run_bert(query, top_k, fields=DEFAULT_FIELDS, filters=None):
+    from utils import query_bert
+    # The whole request runs on the snapshot current at its start, even if a new one is swapped in.
+    snapshot = snapshot_manager.current
+    # Filters restrict the FAISS search itself to the matching posts.
+    return query_bert.search_bert(query, top_k, snapshot.index, snapshot.posts_data, tokenizer, model,
+                                  fields=fields, snippet_chars=SNIPPET_CHARS, batcher=bert_batcher,
+                                  filters=filters, metadata_filters=snapshot.metadata_filters,
+                                  exact_scan_max=exact_scan_max)
+
+def warm_up_bert():
+    from utils import query_bert
+    if snapshot_manager.current is None:
+        query_bert.encode_query(WARMUP_QUERY, tokenizer, model)
+    else:
+        run_bert(WARMUP_QUERY, 10)
+
+# Persistent Lucene search backend (one per worker process).
+lucene_client = LuceneClient(BASE_DIR, pool_size=config.get("serverWorkers", 4))
+
+ENGINES = {
+    "lucene": engines.Engine(
+        "lucene", lucene_client.start, enabled="lucene" in ENABLED_ENGINES,
+        warmup=(lambda: lucene_client.search(WARMUP_QUERY, 10)) if WARMUP_QUERY else None),
+    "bert": engines.Engine(
+        "bert", init_bert, enabled="bert" in ENABLED_ENGINES,
+        warmup=warm_up_bert if WARMUP_QUERY else None, available=bert_unavailable),
+}
+
+def init_worker():
+    """
+    Starts the engines on background threads (unless they start on first
+    use). Runs at import for the development server and after the fork in
+    every gunicorn worker.
+    """
+    if engine_config.get("initInBackground", True):
+        for engine in ENGINES.values():
+            engine.start()
 
+if PREFORK and "bert" in ENABLED_ENGINES:
+    prepare_bert()
+if not PREFORK:
+    init_worker()
+
+def search_lucene(query, top_k, fields=DEFAULT_FIELDS, filters=None, sort=None):
     try:
-        # Run the Java program and capture output
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        if result.returncode != 0:
-            return {"error": "Error executing Java program", "details": result.stderr}
+        ENGINES["lucene"].wait(ENGINE_WAIT_SECONDS)
+        # Query the long-lived Lucene server instead of spawning a JVM per request.
+        # Metadata filters and sort orders run inside the index.
+        return lucene_client.search(query, top_k, fields=fields, snippet_chars=SNIPPET_CHARS,
+                                    filters=filters, sort=sort)
+    except engines.EngineUnavailable as e:
+        return {"error": "Lucene engine not available", "details": str(e)}
+    except Exception as e:
+        return {"error": "Exception occurred", "details": str(e)}
 
-        # Parse JSON output from Java program
-        output = result.stdout.strip()
-        return json.loads(output)
-    
+def search_bert(query, top_k, fields=DEFAULT_FIELDS, filters=None):
+    try:
+        ENGINES["bert"].wait(ENGINE_WAIT_SECONDS)
+        return run_bert(query, top_k, fields, filters)
+    except engines.EngineUnavailable as e:
+        return {"error": "BERT engine not available", "details": str(e)}
     except Exception as e:
         return {"error": "Exception occurred", "details": str(e)}
 
+# Hybrid search: both engines run concurrently, each bounded by its own timeout.
+hybrid_config = config.get("hybrid", {})
+hybrid_pool = ThreadPoolExecutor(max_workers=hybrid_config.get("workers", 8), thread_name_prefix="hybrid")
+HYBRID_ENGINES = {"lucene": search_lucene, "bert": search_bert}
+
+def search_hybrid(query, top_k, fields=DEFAULT_FIELDS, filters=None):
+    top_k = int(top_k)
+    # Each leg returns a deeper list so fusion has candidates to promote.
+    depth = top_k * hybrid_config.get("depthFactor", 2)
+    timeouts = hybrid_config.get("timeoutMs", {})
+    start = time.monotonic()
+    # Disabled engines are left out on purpose and not reported.
+    futures = {engine: hybrid_pool.submit(search, query, depth, fields, filters)
+               for engine, search in HYBRID_ENGINES.items() if ENGINES[engine].state != "disabled"}
+
+    ranked_lists = []
+    total_hits = 0
+    failed = {}
+    unavailable = {}
+    for engine, future in futures.items():
+        # Deadlines count from the fan-out, so waiting here overlaps with the other leg.
+        deadline = start + timeouts.get(engine, 5000) / 1000
+        try:
+            response = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            failed[engine] = "timed out"
+            continue
+        if "error" in response:
+            # An engine that is not up yet (still starting, no index built) is
+            # unavailable rather than failed: the result is complete for the
+            # engines that can serve and may be cached (see hybrid_version).
+            target = failed if ENGINES[engine].ready else unavailable
+            target[engine] = response.get("details", response["error"])
+            continue
+        ranked_lists.append((engine, response.get("results", [])))
+        total_hits = max(total_hits, int(response.get("totalHits", 0)))
+
+    if not ranked_lists:
+        reasons = dict(unavailable, **failed)
+        return {"error": "All engines failed", "details": "; ".join(f"{e}: {d}" for e, d in reasons.items())}
+
+    method = hybrid_config.get("fusion", "rrf")
+    weights = hybrid_config.get("weights", {})
+    if method == "rrf":
+        results = fusion.reciprocal_rank_fusion(ranked_lists, top_k, k=hybrid_config.get("rrfK", 60), weights=weights)
+    else:
+        results = fusion.score_blend(ranked_lists, top_k, weights=weights)
+    response = {"totalHits": total_hits, "results": results, "failedEngines": failed}
+    if unavailable:
+        response["unavailableEngines"] = unavailable
+    return response
+
+# Whole responses are cached until their index is rebuilt (see utils/response_cache.py).
+cache_config = config.get("responseCache", {})
+LUCENE_INDEX_DIR = os.path.join(BASE_DIR, config.get("indexDir", "./utils/pylucene_indexes"))
+
+def bert_version():
+    # Snapshots are immutable, so the served version identifies the index.
+    snapshot = snapshot_manager.current if snapshot_manager else None
+    return snapshot.version if snapshot else None
+
+def lucene_index_version():
+    return lucene_version(LUCENE_INDEX_DIR)
+
+def hybrid_version():
+    # An engine that cannot serve yet counts as version None, so hybrid
+    # results computed without it miss once it is up.
+    return [bert_version() if ENGINES["bert"].ready else None,
+            lucene_index_version() if ENGINES["lucene"].ready else None]
+
+response_cache = None
+if cache_config.get("enabled", True):
+    disk_path = cache_config.get("diskPath")
+    response_cache = ResponseCache(
+        {"bert": bert_version, "lucene": lucene_index_version,
+         "hybrid": hybrid_version},
+        max_entries=cache_config.get("maxEntries", 1024),
+        max_bytes=int(cache_config.get("maxMemoryMB", 64) * 1024 * 1024),
+        ttl=cache_config.get("ttlSeconds"),
+        disk_path=os.path.join(BASE_DIR, disk_path) if disk_path else None,
+        disk_max_entries=cache_config.get("diskMaxEntries", 100000),
+        # Settings that shape responses invalidate the disk tier when they change.
+        namespace=hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest())
+
+SEARCH_ENGINES = {"lucene": search_lucene, "bert": search_bert, "hybrid": search_hybrid}
+
+def cached_search(engine, query, top_k, fields, filters, sort):
+    search = SEARCH_ENGINES[engine]
+    # Only Lucene sorts; the other engines rank by relevance.
+    args = (query, top_k, fields, filters, sort) if engine == "lucene" else (query, top_k, fields, filters)
+    start = time.perf_counter()
+    cache = "off"
+    if response_cache is None:
+        results = search(*args)
+    else:
+        key = response_cache.key(engine, query, top_k, fields, filters, sort if engine == "lucene" else None)
+        # Read once before searching: the index may change while the search runs.
+        version = response_cache.version(engine)
+        results = response_cache.get(engine, key, version)
+        cache = "hit" if results is not None else "miss"
+        if results is None:
+            results = search(*args)
+            # Errors and partial hybrid results are recomputed next time.
+            if "error" not in results and not results.get("failedEngines"):
+                response_cache.put(engine, key, results, version)
+    REGISTRY.histogram("reddit_search_request_seconds", "Search latency per engine, without rendering.",
+                       engine=engine, cache=cache).observe(time.perf_counter() - start)
+    REGISTRY.counter("reddit_search_requests_total", "Searches per engine and outcome.",
+                     engine=engine, status="error" if "error" in results else "ok").inc()
+    return results
+
+# Optional: stacks of slow requests are sampled to ./profiles (see utils/profiler.py).
+profiling_config = config.get("profiling", {})
+profiler = None
+if profiling_config.get("enabled", False):
+    profiler = SlowRequestProfiler(
+        os.path.join(BASE_DIR, profiling_config.get("dir", "./profiles")),
+        slow_ms=profiling_config.get("slowMs", 500),
+        interval_ms=profiling_config.get("intervalMs", 5),
+        sample_rate=profiling_config.get("sampleRate", 1.0),
+        max_files=profiling_config.get("maxFiles", 100))
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     results = {}
@@ -75,13 +317,64 @@ def index():
         query = request.form['query']
         top_k = request.form.get('top_k', 10)  # Default: 10
         index_type = request.form['index_type']
+        # Comma separated, e.g. "Title,Body,Comments"; defaults to the config.
+        fields = snippets.parse_fields(request.form.get('fields')) or DEFAULT_FIELDS
+        filters = search_filters.parse_filters(request.form)
         
-        if index_type == 'lucene':
-            results = search_lucene(query, top_k)
-        elif index_type == 'bert':
-            results = query_bert.search_bert(query, top_k, faiss_index, posts_data, tokenizer, model)
+        if index_type in SEARCH_ENGINES:
+            sort = search_filters.parse_sort(request.form)
+            if profiler is not None:
+                with profiler.profile(index_type):
+                    results = cached_search(index_type, query, top_k, fields, filters, sort)
+            else:
+                results = cached_search(index_type, query, top_k, fields, filters, sort)
+
+    engine = request.form.get('index_type') if request.method == 'POST' else None
+    with timed(engine if engine in SEARCH_ENGINES else "none", "render"):
+        return render_template('index.html', results=results)
+
+@app.route('/stats')
+def stats():
+    # Query batching histograms, embedding and response cache counters
+    query_bert = sys.modules.get("utils.query_bert")
+    return jsonify({
+        "bertBatching": bert_batcher.stats() if bert_batcher else None,
+        "queryCache": query_bert.query_cache.info() if query_bert else None,
+        "responseCache": response_cache.info() if response_cache else None,
+        "snapshot": snapshot_manager.info() if snapshot_manager else None,
+    })
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text format: stage and request latency histograms, request counters
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+def engine_states():
+    states = {name: engine.info() for name, engine in ENGINES.items()}
+    # Hybrid search serves as long as one of its engines does.
+    states["hybrid"] = {"ready": any(states[name]["ready"] for name in HYBRID_ENGINES)}
+    return states
+
+@app.route('/health')
+def health():
+    # Liveness: the process answers; engine states are for information.
+    return jsonify({"status": "ok", "engines": engine_states()})
 
-    return render_template('index.html', results=results)
+@app.route('/ready')
+@app.route('/ready/<engine>')
+def ready(engine=None):
+    """
+    Readiness for load balancers: 200 if the engine (or, without one, every
+    enabled engine) can serve searches, 503 otherwise.
+    """
+    states = engine_states()
+    if engine is None:
+        is_ready = all(states[name]["ready"] for name in ENABLED_ENGINES if name in ENGINES)
+    elif engine in states:
+        is_ready = states[engine]["ready"]
+    else:
+        return jsonify({"error": f"Unknown engine {engine!r}"}), 404
+    return jsonify({"ready": is_ready, "engines": states}), 200 if is_ready else 503
 
 
 if __name__ == '__main__':
@@ -0,0 +1,30 @@
+import os
+import json
+
+# Production serving: python -m gunicorn -c gunicorn.conf.py app:app
+#
+# Layout: one master process imports app.py once (preload_app), starting a
+# background index rebuild and memory-mapping the current BERT index snapshot
+# together with its document store. The workers are forked from it and share
+# those pages (a newly published snapshot is mapped by each worker); each worker
+# then loads its own encoder (bertModel.numThreads torch threads) and serves
+# `threads` requests concurrently, coalesced by its query batcher. Keep
+# workers * numThreads at or below the number of cores.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(BASE_DIR, "utils", "config.json"), "r") as f:
+    serving = json.load(f).get("serving", {})
+
+os.environ["REDDIT_SEARCH_PREFORK"] = "1"
+
+bind = serving.get("bind", "127.0.0.1:8000")
+workers = serving.get("workers", 2)
+threads = serving.get("threads", 4)
+worker_class = "gthread"
+preload_app = True
+# Loading the encoder can take a while on the first request of a new worker.
+timeout = 120
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker()
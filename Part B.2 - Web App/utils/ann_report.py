@@ -0,0 +1,130 @@
+"""
+Recall@k vs. latency (and memory) report for the BERT engine's FAISS index types.
+
+Vectors are taken from an existing exact index (utils/bert.index). A random
+sample is held out as queries, every candidate index is built over the rest,
+and its results are compared with exact inner-product search.
+
+Usage (from the web app directory):
+    python -m utils.ann_report --index utils/bert.index --types ivf_flat,ivf_pq,hnsw -k 10
+    python -m utils.ann_report --types sq_fp16,sq8,pq --params '{"refine": "flat"}'
+"""
+import time
+import json
+import argparse
+import faiss
+import numpy as np
+from utils import query_bert
+
+# Query-time settings swept for each index type.
+SWEEPS = {
+    "flat": [{}],
+    "ivf_flat": [{"nprobe": n} for n in (1, 4, 16, 64, 256)],
+    "ivf_pq": [{"nprobe": n} for n in (1, 4, 16, 64, 256)],
+    "hnsw": [{"ef_search": ef} for ef in (16, 32, 64, 128, 256)],
+    "sq_fp16": [{}],
+    "sq8": [{}],
+    "pq": [{}],
+}
+
+def sweep_settings(index_type, index_params):
+    """
+    Query-time settings to try; refined indexes also sweep k_factor.
+    """
+    settings = SWEEPS[index_type]
+    if (index_params or {}).get("refine"):
+        settings = [dict(setting, k_factor=k) for setting in settings for k in (1, 2, 4, 8)]
+    return settings
+
+def load_vectors(index_path):
+    """
+    Reads back all vectors stored in an index that supports reconstruction
+    (e.g. the default flat index, also behind the incremental id map).
+    """
+    index = faiss.read_index(index_path)
+    if isinstance(index, faiss.IndexIVF):
+        # The incremental IVF index keeps post ids, not positions.
+        return index.reconstruct_batch(query_bert.index_ids(index))
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    return index.reconstruct_n(0, index.ntotal)
+
+def index_size_bytes(index):
+    """
+    Size of the serialized index, a close proxy for its resident memory.
+    """
+    return int(faiss.serialize_index(index).nbytes)
+
+def measure(index, queries, ground_truth, k):
+    """
+    Runs the queries one at a time (as the web app does) and returns
+    recall@k against the exact results plus mean/p95 latency in ms.
+    """
+    latencies = []
+    found = 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, indices = index.search(queries[i:i+1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += len(set(indices[0]) & set(ground_truth[i]))
+    return {
+        "recall_at_k": found / (len(queries) * k),
+        "mean_ms": float(np.mean(latencies)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+def run_report(vectors, index_types, k=10, num_queries=200, index_params=None, seed=0):
+    """
+    Builds each index type over the non-query vectors and sweeps its
+    query-time parameters. Returns one row per (index type, setting).
+    """
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(vectors), min(num_queries, len(vectors) // 10 or 1), replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[query_ids] = False
+    queries = np.ascontiguousarray(vectors[query_ids])
+    base = np.ascontiguousarray(vectors[mask])
+
+    exact = query_bert.build_faiss_index(base, "flat")
+    _, ground_truth = exact.search(queries, k)
+    exact_size = index_size_bytes(exact)
+
+    rows = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = query_bert.build_faiss_index(base, index_type, index_params)
+        build_s = time.perf_counter() - start
+        size = index_size_bytes(index)
+        for setting in sweep_settings(index_type, index_params):
+            query_bert.set_search_params(index, setting)
+            row = {"index_type": index_type, "setting": setting, "build_s": build_s,
+                   "bytes": size, "bytes_vs_flat": size / exact_size,
+                   "memory_saved_bytes": exact_size - size}
+            row.update(measure(index, queries, ground_truth, k))
+            row["recall_lost"] = 1.0 - row["recall_at_k"]
+            rows.append(row)
+    return rows
+
+def print_report(rows, k):
+    print(f"{'index':<10} {'setting':<24} {'recall@' + str(k):>9} {'mean ms':>9} {'p95 ms':>9} {'MB':>9} {'vs flat':>8}")
+    for row in rows:
+        setting = ",".join(f"{key}={value}" for key, value in row["setting"].items()) or "-"
+        print(f"{row['index_type']:<10} {setting:<24} {row['recall_at_k']:>9.3f} {row['mean_ms']:>9.3f} "
+              f"{row['p95_ms']:>9.3f} {row['bytes'] / 2**20:>9.1f} {row['bytes_vs_flat']:>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs. latency for FAISS index types")
+    parser.add_argument("--index", default="utils/bert.index", help="exact index to take vectors from")
+    parser.add_argument("--types", default="flat,ivf_flat,ivf_pq,hnsw,sq_fp16,sq8,pq", help="comma separated index types")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--params", default="{}", help="JSON build parameters, e.g. '{\"nlist\": 1024}'")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.index)
+    rows = run_report(vectors, args.types.split(","), args.k, args.queries, json.loads(args.params))
+    print_report(rows, args.k)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
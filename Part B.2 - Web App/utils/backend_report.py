@@ -0,0 +1,93 @@
+"""
+Parity and speed comparison of the encoder inference backends.
+
+Every backend embeds the same sample of posts and queries. Embeddings are
+compared with the fp32 PyTorch baseline by cosine similarity, and query
+latency / corpus throughput are measured with the given thread count.
+
+Usage (from the web app directory):
+    python -m utils.backend_report --backends torch,torch_int8,onnx --threads 4
+"""
+import os
+import time
+import json
+import argparse
+import numpy as np
+from utils import query_bert
+
+def embed_corpus(texts, tokenizer, model, batch_size):
+    start = time.perf_counter()
+    embeddings = query_bert.normalize_embeddings(
+        query_bert.generate_embeddings_batch(texts, tokenizer, model, batch_size=batch_size))
+    return embeddings, len(texts) / (time.perf_counter() - start)
+
+def embed_queries(queries, tokenizer, model):
+    vectors = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        vector = query_bert.convert_to_embedding(query, tokenizer, model).cpu().numpy()
+        latencies.append((time.perf_counter() - start) * 1000)
+        vectors.append(vector / np.linalg.norm(vector))
+    return np.array(vectors), latencies
+
+def cosine_parity(embeddings, baseline):
+    cosines = np.sum(embeddings * baseline, axis=1)
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+
+def run_report(texts, queries, backends, model_name, num_threads, batch_size=32, k=10):
+    """
+    Returns one row per backend with parity against fp32 torch
+    (cosine similarity, top-k overlap) and latency/throughput figures.
+    """
+    rows = []
+    baseline = None
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        tokenizer, model = query_bert.load_transformers_model(model_name, backend, num_threads)
+        corpus, docs_per_sec = embed_corpus(texts, tokenizer, model, batch_size)
+        query_vectors, latencies = embed_queries(queries, tokenizer, model)
+        ranking = np.argsort(-(query_vectors @ corpus.T), axis=1)[:, :k]
+        if baseline is None:
+            baseline = (corpus, query_vectors, ranking)
+        row = {
+            "backend": backend,
+            "threads": num_threads,
+            "query_mean_ms": float(np.mean(latencies)),
+            "query_p95_ms": float(np.percentile(latencies, 95)),
+            "corpus_docs_per_sec": docs_per_sec,
+            "corpus": cosine_parity(corpus, baseline[0]),
+            "queries": cosine_parity(query_vectors, baseline[1]),
+            "top_k_overlap": float(np.mean([
+                len(set(ranking[i]) & set(baseline[2][i])) / ranking.shape[1] for i in range(len(queries))
+            ])),
+        }
+        if backend in backends:
+            rows.append(row)
+    return rows
+
+def print_report(rows):
+    print(f"{'backend':<11} {'query ms':>9} {'p95 ms':>8} {'docs/sec':>9} {'min cos':>8} {'overlap':>8}")
+    for row in rows:
+        print(f"{row['backend']:<11} {row['query_mean_ms']:>9.2f} {row['query_p95_ms']:>8.2f} "
+              f"{row['corpus_docs_per_sec']:>9.1f} {min(row['corpus']['min_cosine'], row['queries']['min_cosine']):>8.4f} "
+              f"{row['top_k_overlap']:>8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare encoder inference backends")
+    parser.add_argument("--backends", default=",".join(query_bert.BACKENDS))
+    parser.add_argument("--model", default="sentence-transformers/all-distilroberta-v1")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--docs", type=int, default=256, help="number of posts to embed")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    texts, posts = query_bert.load_reddit_posts(os.path.join(base_dir, "data"))
+    texts = texts[:args.docs]
+    # Post titles make realistic short queries.
+    queries = [post["title"] for post in posts[:args.docs]]
+    rows = run_report(texts, queries, args.backends.split(","), args.model, args.threads)
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,128 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+try:
+    from utils import query_bert
+    from utils.metrics import Histogram, timed
+except ImportError:
+    # Run directly as a script from the utils folder.
+    import query_bert
+    from metrics import Histogram, timed
+
+# --------------------------
+# Query Micro-batching
+# --------------------------
+# Concurrent BERT requests would otherwise run one batch-size-1 forward pass
+# each. The batcher collects the queries that arrive within a short window
+# (up to max_batch), encodes them in one padded forward pass, runs one
+# batched index.search and hands every caller its own row.
+
+# Histogram bucket bounds.
+QUEUE_WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class _Pending:
+    __slots__ = ("query", "k", "index", "enqueued", "future")
+
+    def __init__(self, query, k, index):
+        self.query = query
+        self.k = k
+        self.index = index
+        self.enqueued = time.monotonic()
+        self.future = Future()
+
+class QueryBatcher:
+    """
+    Runs BERT query encoding and FAISS search for concurrent callers in
+    micro-batches on a single background thread.
+
+    window_ms is how long the first query of a batch waits for others to
+    join; max_batch caps the batch size. `index` is searched unless a
+    query names its own (e.g. the snapshot its request is serving from).
+    """
+
+    def __init__(self, index, tokenizer, model, window_ms=5, max_batch=16):
+        self.index = index
+        self.tokenizer = tokenizer
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_batch = max(1, int(max_batch))
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="bert-batcher", daemon=True)
+        self._thread.start()
+
+    def search(self, query, k, index=None):
+        """
+        Encodes the query and searches the index for its k nearest neighbors.
+        Blocks until the batch containing the query has run and returns
+        (query_embedding (1, d), distances (1, k), indices (1, k)).
+        """
+        pending = _Pending(query, int(k), index if index is not None else self.index)
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first.enqueued + self.window
+            closed = False
+            while len(batch) < self.max_batch:
+                try:
+                    # After the deadline only already-queued queries are taken.
+                    pending = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if pending is None:
+                    closed = True
+                    break
+                batch.append(pending)
+            self._process(batch)
+            if closed:
+                return
+
+    def _process(self, batch):
+        started = time.monotonic()
+        for pending in batch:
+            self.queue_wait_ms.observe((started - pending.enqueued) * 1000)
+        self.batch_size.observe(len(batch))
+        try:
+            embeddings = query_bert.encode_queries([p.query for p in batch], self.tokenizer, self.model)
+            # One search per index; during a snapshot swap a batch can span two.
+            groups = {}
+            for row, pending in enumerate(batch):
+                groups.setdefault(id(pending.index), []).append(row)
+            results = {}
+            for rows in groups.values():
+                index = batch[rows[0]].index
+                with timed("bert", "faiss_search"):
+                    distances, indices = index.search(embeddings[rows], max(batch[row].k for row in rows))
+                for position, row in enumerate(rows):
+                    results[row] = (distances[position:position+1], indices[position:position+1])
+        except Exception as e:
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        for row, pending in enumerate(batch):
+            distances, indices = results[row]
+            pending.future.set_result((embeddings[row:row+1], distances[:, :pending.k], indices[:, :pending.k]))
+
+    def stats(self):
+        return {
+            "windowMs": self.window * 1000,
+            "maxBatch": self.max_batch,
+            "queueWaitMs": self.queue_wait_ms.snapshot(),
+            "batchSize": self.batch_size.snapshot(),
+        }
+
+    def close(self):
+        """
+        Stops the background thread after the queued queries have run.
+        """
+        self._queue.put(None)
+        self._thread.join()
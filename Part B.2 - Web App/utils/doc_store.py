@@ -0,0 +1,100 @@
+import os
+import json
+import mmap
+import numpy as np
+
+# --------------------------
+# Memory-Mapped Document Store
+# --------------------------
+# Layout on disk (written at index time, row i == FAISS id i):
+#   <path>      concatenated UTF-8 JSON records
+#   <path>.idx  uint64 byte offsets, one per record plus the end offset
+# Nothing is parsed up front; a record is decoded only when it is accessed.
+
+class DocStoreWriter:
+    """
+    Appends post records to a document store. Each add() returns the row id
+    of the record, which is the id to use for its vector in the FAISS index.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        mode = "ab" if append and os.path.exists(path) else "wb"
+        self._blob = open(path, mode)
+        self._offsets = open(path + ".idx", mode)
+        self._position = self._blob.tell()
+        if self._position == 0:
+            self._offsets.write(np.uint64(0).tobytes())
+            self.count = 0
+        else:
+            self.count = os.path.getsize(path + ".idx") // 8 - 1
+
+    def add(self, record):
+        data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        self._blob.write(data)
+        self._position += len(data)
+        self._offsets.write(np.uint64(self._position).tobytes())
+        self.count += 1
+        return self.count - 1
+
+    def close(self):
+        self._blob.close()
+        self._offsets.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_doc_store(path, records):
+    """
+    Writes a new document store from an iterable of post dictionaries.
+    The files are written next to the target and renamed into place, so a
+    reader never sees a half-written store.
+    """
+    tmp_path = path + ".tmp"
+    with DocStoreWriter(tmp_path) as writer:
+        for record in records:
+            writer.add(record)
+    os.replace(tmp_path + ".idx", path + ".idx")
+    os.replace(tmp_path, path)
+
+class DocStore:
+    """
+    Read-only view over a document store. Behaves like the old posts_data
+    list (len() and indexing by FAISS id) but keeps the records on disk and
+    only decodes the ones that are requested.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Document store not found at {path}")
+        self.path = path
+        self._offsets = np.memmap(path + ".idx", dtype=np.uint64, mode="r")
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, doc_id):
+        if not 0 <= doc_id < len(self):
+            raise IndexError(f"Document {doc_id} out of range")
+        start, end = int(self._offsets[doc_id]), int(self._offsets[doc_id + 1])
+        return json.loads(self._blob[start:end])
+
+    def get(self, doc_id, fields=None):
+        """
+        Returns the record for doc_id, limited to the given fields if any.
+        """
+        record = self[doc_id]
+        if fields is None:
+            return record
+        return {field: record[field] for field in fields if field in record}
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
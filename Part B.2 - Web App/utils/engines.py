@@ -0,0 +1,90 @@
+import time
+import threading
+
+# --------------------------
+# Lazy Engine Initialization
+# --------------------------
+# Each search engine starts on its own background thread (or on first use)
+# so the web app comes up without waiting for models, indexes or the JVM.
+# States: disabled, idle (not started), starting, ready, failed.
+
+class EngineUnavailable(Exception):
+    pass
+
+class Engine:
+    """
+    A search engine whose setup runs at most once at a time. init() does
+    the setup (heavy imports included); warmup(), if given, then runs a
+    first query before the engine reports ready. A failed engine is started
+    again on its next use. `available()`, if given, returns why an otherwise
+    started engine cannot serve yet (e.g. no index built), or None.
+    """
+
+    def __init__(self, name, init, warmup=None, enabled=True, available=None):
+        self.name = name
+        self.state = "idle" if enabled else "disabled"
+        self.error = None
+        self.init_seconds = None
+        self._init = init
+        self._warmup = warmup
+        self._available = available
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self):
+        """
+        Starts initialization on a background thread unless the engine is
+        disabled, already starting or ready.
+        """
+        with self._lock:
+            if self.state not in ("idle", "failed"):
+                return
+            self.state = "starting"
+            self.error = None
+            self._done.clear()
+        threading.Thread(target=self._run, name=f"init-{self.name}", daemon=True).start()
+
+    def _run(self):
+        started = time.monotonic()
+        try:
+            self._init()
+            if self._warmup is not None:
+                self._warmup()
+        except Exception as e:
+            print(f"Initializing the {self.name} engine failed: {e}")
+            state, self.error = "failed", str(e)
+        else:
+            state = "ready"
+        self.init_seconds = time.monotonic() - started
+        with self._lock:
+            self.state = state
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        Starts the engine if needed and waits up to `timeout` seconds for it.
+        Raises EngineUnavailable unless it is ready.
+        """
+        if self.ready:
+            return
+        if self.state == "disabled":
+            raise EngineUnavailable(f"The {self.name} engine is disabled")
+        self.start()
+        self._done.wait(timeout)
+        if self.state == "failed":
+            raise EngineUnavailable(f"The {self.name} engine failed to start: {self.error}")
+        if self.state != "ready":
+            raise EngineUnavailable(f"The {self.name} engine is still starting")
+        reason = self._available() if self._available is not None else None
+        if reason:
+            raise EngineUnavailable(reason)
+
+    @property
+    def ready(self):
+        return self.state == "ready" and (self._available is None or self._available() is None)
+
+    def info(self):
+        info = {"state": self.state, "ready": self.ready, "error": self.error, "initSeconds": self.init_seconds}
+        if self.state == "ready" and not info["ready"]:
+            info["waitingFor"] = self._available()
+        return info
@@ -0,0 +1,95 @@
+import re
+from urllib.parse import urlsplit
+
+# --------------------------
+# Result Fusion (hybrid search)
+# --------------------------
+# Each engine returns {"totalHits", "results"} with its own result shape:
+# Lucene results carry "Comments", BERT results carry "doc_id". Fusion merges
+# ranked lists from several engines into one list of the common shape
+# {"Title", "Body", "URL", "score", "engines"}, keeping the extra fields.
+
+# Post id in a Reddit permalink: /r/<subreddit>/comments/<id>/<slug>/
+PERMALINK_ID = re.compile(r"/comments/([a-z0-9]+)", re.IGNORECASE)
+
+def result_key(result):
+    """
+    Key used to detect the same post coming from different engines: the
+    Reddit post id ("PostId", or the id in a reddit.com permalink URL).
+    Lucene's URL is the post's link while BERT's is its permalink, so the
+    URL (without scheme, "www.", query string or trailing slash) is only a
+    fallback for results without an id.
+    """
+    url = (result.get("URL") or "").strip()
+    post_id = result.get("PostId")
+    if not post_id and "reddit.com" in url:
+        match = PERMALINK_ID.search(url)
+        post_id = match.group(1) if match else None
+    if post_id:
+        return ("id", str(post_id).lower())
+    if not url or url in ("No URL", "Unknown"):
+        return ("title", result.get("Title", ""))
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return ("url", host, parts.path.rstrip("/"))
+
+def _merge(fused, engine, result):
+    key = result_key(result)
+    if key not in fused:
+        merged = dict(result)
+        merged["engines"] = []
+        fused[key] = merged
+    merged = fused[key]
+    merged["engines"].append(engine)
+    # Keep whatever fields the other engine had (e.g. Comments and doc_id).
+    for field, value in result.items():
+        merged.setdefault(field, value)
+    return merged
+
+def reciprocal_rank_fusion(ranked_lists, top_k, k=60, weights=None):
+    """
+    Reciprocal rank fusion: score(d) = sum over engines of w / (k + rank(d)).
+    ranked_lists is a list of (engine_name, results) pairs.
+    """
+    weights = weights or {}
+    fused = {}
+    scores = {}
+    for engine, results in ranked_lists:
+        for rank, result in enumerate(results, start=1):
+            merged = _merge(fused, engine, result)
+            key = result_key(merged)
+            scores[key] = scores.get(key, 0.0) + weights.get(engine, 1.0) / (k + rank)
+    return _ranked(fused, scores, top_k)
+
+def score_blend(ranked_lists, top_k, weights=None):
+    """
+    Normalized score blending: each engine's scores are min-max scaled to
+    [0, 1] and summed with per-engine weights.
+    """
+    weights = weights or {}
+    fused = {}
+    scores = {}
+    for engine, results in ranked_lists:
+        if not results:
+            continue
+        raw = [float(result.get("score", 0.0)) for result in results]
+        low, high = min(raw), max(raw)
+        for result, score in zip(results, raw):
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            merged = _merge(fused, engine, result)
+            key = result_key(merged)
+            scores[key] = scores.get(key, 0.0) + weights.get(engine, 1.0) * normalized
+    return _ranked(fused, scores, top_k)
+
+def _ranked(fused, scores, top_k):
+    ordered = sorted(fused, key=lambda key: scores[key], reverse=True)[:top_k]
+    results = []
+    for key in ordered:
+        result = fused[key]
+        result["score"] = scores[key]
+        results.append(result)
+    return results
+
+FUSION_METHODS = {"rrf": reciprocal_rank_fusion, "blend": score_blend}
@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import hashlib
+import faiss
+import numpy as np
+from utils import query_bert, parallel_embed, reddit_reader, vector_filters
+from utils.doc_store import DocStore, DocStoreWriter
+
+# --------------------------
+# Incremental BERT Indexing
+# --------------------------
+# The incremental index holds document store rows as ids, so posts can be
+# appended and removed without touching the others: IVF indexes store the ids
+# themselves (with a hashtable direct map for reconstruct/remove by id), the
+# other types sit behind a faiss.IndexIDMap2. hnsw and refined indexes cannot
+# remove vectors; an update that needs to is done as a full rebuild.
+# Next to <index_path> it keeps:
+#   <index_path>.manifest.json  processed batch files (size/mtime) and, per
+#                               post id, its content hash, doc row and file
+#   <index_path>.embcache       float32 embeddings of the posts seen since the
+#   <index_path>.embcache.json  last full build, keyed by "<post id>:<content hash>"
+#   <index_path>.filters.npz    metadata for filtered search (vector_filters)
+# Edited and removed posts leave dead document store rows (and cached
+# embeddings) behind. Once they pass COMPACT_DEAD_FRACTION of the rows, the
+# index is rebuilt from the embedding cache, which renumbers the live posts
+# and drops the rest; --full does the same.
+
+# Share of dead document store rows that triggers a compaction.
+COMPACT_DEAD_FRACTION = 0.25
+
+def content_hash(post_text, post_data):
+    """
+    Hash of everything that ends up in the index for a post.
+    """
+    payload = post_text + "\0" + json.dumps(post_data, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+# Post fields that, with the text, determine its embedding; metadata such as
+# the score can change without re-embedding the post.
+EMBEDDING_KEY_FIELDS = ("title", "body", "permalink")
+
+def embedding_key(post_id, post_text, post_data):
+    """
+    Embedding cache key of a post: "<post id>:<hash of the embedded content>".
+    """
+    embedded = {field: post_data.get(field) for field in EMBEDDING_KEY_FIELDS}
+    return f"{post_id}:{content_hash(post_text, embedded)}"
+
+def scan_batch_files(data_dir):
+    """
+    Returns {filename: {"size", "mtime_ns"}} for the reddit_batch_*.txt files.
+    """
+    files = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if filename.startswith("reddit_batch_") and filename.endswith(".txt"):
+            stat = os.stat(os.path.join(data_dir, filename))
+            files[filename] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return files
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+class EmbeddingCache:
+    """
+    Append-only on-disk cache of post embeddings keyed by post id and content
+    hash, so unchanged posts are never run through the model again (also not
+    after the FAISS index itself has been rebuilt). Tied to one model name.
+    """
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self.keys_path = path + ".json"
+        state = load_json(self.keys_path, {})
+        if state.get("model") != model_name:
+            state = {"model": model_name, "dimension": None, "keys": {}}
+            if os.path.exists(path):
+                os.remove(path)
+        self.state = state
+
+    def get(self, keys):
+        """
+        Returns {key: vector} for the keys present in the cache.
+        """
+        rows = {key: self.state["keys"][key] for key in keys if key in self.state["keys"]}
+        if not rows:
+            return {}
+        vectors = np.memmap(self.path, dtype=np.float32, mode="r").reshape(-1, self.state["dimension"])
+        return {key: np.array(vectors[row]) for key, row in rows.items()}
+
+    def add(self, keys, vectors):
+        if not keys:
+            return
+        self.state["dimension"] = vectors.shape[1]
+        start = os.path.getsize(self.path) // (4 * vectors.shape[1]) if os.path.exists(self.path) else 0
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for offset, key in enumerate(keys):
+            self.state["keys"][key] = start + offset
+
+    def save(self):
+        write_json(self.keys_path, self.state)
+
+    def compact(self, keys, chunk_size=65536):
+        """
+        Keeps only the embeddings of `keys` (the posts of a freshly built index).
+        """
+        keep = [key for key in dict.fromkeys(keys) if key in self.state["keys"]]
+        if len(keep) == len(self.state["keys"]):
+            return
+        rows = [self.state["keys"][key] for key in keep]
+        # Forget every key first: a crash while the vectors are swapped
+        # leaves an empty cache instead of keys pointing at the wrong rows.
+        self.state["keys"] = {}
+        self.save()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            if rows:
+                vectors = np.memmap(self.path, dtype=np.float32, mode="r").reshape(-1, self.state["dimension"])
+                for start in range(0, len(rows), chunk_size):
+                    f.write(np.ascontiguousarray(vectors[rows[start:start + chunk_size]]).tobytes())
+                del vectors
+        os.replace(tmp_path, self.path)
+        self.state["keys"] = {key: row for row, key in enumerate(keep)}
+        self.save()
+
+def save_metadata_filters(index, docs_path, index_path):
+    """
+    Rebuilds the filtered-search bitmaps (vector_filters) for the ids in the index.
+    """
+    posts_data = DocStore(docs_path)
+    try:
+        filters = vector_filters.MetadataFilters.build(query_bert.index_ids(index), posts_data)
+    finally:
+        posts_data.close()
+    filters.save(vector_filters.filters_path(index_path))
+
+def supports_removal(index_type, index_params=None):
+    """
+    Whether remove_ids works on the incremental index of this type. IVF
+    removes by its own ids and the flat-code types (flat, sq_fp16, sq8, pq)
+    renumber what they keep, as IndexIDMap2 requires; HNSW graphs and
+    IndexRefine cannot remove at all.
+    """
+    return index_type != "hnsw" and not query_bert.resolve_index_params(index_type, index_params)["refine"]
+
+def new_id_index(dimension, index_type="flat", index_params=None, training_vectors=None):
+    """
+    Creates an empty index that takes document store rows as ids (add_with_ids).
+    """
+    index = query_bert.new_faiss_index(dimension, index_type, index_params, training_vectors)
+    if isinstance(index, faiss.IndexIVF):
+        # An IVF index keeps its own ids; IndexIDMap2.remove_ids would desync
+        # them because IVF does not renumber the vectors it keeps.
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(index)
+
+def update_index(data_dir, index_path, docs_path, tokenizer, model,
+                 model_name="sentence-transformers/all-distilroberta-v1",
+                 index_type="flat", index_params=None, batch_size=32,
+                 workers=1, threads_per_worker=1, shard_size=2048, backend="torch", full=False):
+    """
+    Brings the FAISS index and document store up to date with data_dir.
+
+      - Batch files whose size and mtime are unchanged are skipped entirely.
+      - Posts from new/changed files are compared by content hash; only new
+        or changed posts are embedded (or taken from the embedding cache),
+        appended to the document store and added to the index.
+      - Posts that disappeared from changed/removed files, and the old
+        versions of changed posts, are removed from the index by id.
+
+    A missing manifest (or a different model / index type, or full=True)
+    starts a fresh index, as does an update that has to remove vectors from
+    an index type that cannot (see supports_removal), and an update that
+    leaves more than COMPACT_DEAD_FRACTION of the document rows dead.
+    With workers > 1 the posts to embed are sharded across a process pool
+    (see parallel_embed); only call that from a __main__-guarded entry point.
+    The workers load their own model, so tokenizer and model may then be None.
+    Returns the up-to-date index.
+    """
+    manifest_path = index_path + ".manifest.json"
+    manifest = load_json(manifest_path, None)
+    fresh = (
+        full
+        or manifest is None
+        or manifest.get("model") != model_name
+        or manifest.get("index_type") != index_type
+        or not os.path.exists(index_path)
+        or not os.path.exists(docs_path)
+    )
+    if fresh:
+        manifest = {"model": model_name, "index_type": index_type, "files": {}, "posts": {}}
+
+    current_files = scan_batch_files(data_dir)
+    if manifest.get("post_fields", []) != list(query_bert.POST_FIELDS):
+        # The stored post fields changed: every file is re-read, posts get new doc
+        # rows, and their embeddings come from the cache.
+        changed = list(current_files)
+    else:
+        changed = [name for name, stat in current_files.items() if manifest["files"].get(name) != stat]
+    removed = [name for name in manifest["files"] if name not in current_files]
+    if not fresh and not changed and not removed:
+        print("BERT index is up to date.")
+        index = query_bert.load_faiss_index(index_path, index_params)
+        if not os.path.exists(vector_filters.filters_path(index_path)):
+            save_metadata_filters(index, docs_path, index_path)
+        return index
+
+    index = None
+    if not fresh:
+        index = query_bert.load_faiss_index(index_path, index_params)
+        if isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexIVF):
+            # Written before IVF indexes kept their own ids; removals may have corrupted it.
+            print("Rebuilding the BERT index: its IVF id map is from an older layout.")
+            return update_index(data_dir, index_path, docs_path, tokenizer, model, model_name, index_type,
+                                index_params, batch_size, workers, threads_per_worker, shard_size, backend, full=True)
+
+    # Parse only the files that changed.
+    seen = {}
+    read_stats = reddit_reader.ReadStats()
+    paths = [os.path.join(data_dir, name) for name in changed]
+    for path, records in reddit_reader.iter_file_records(paths, query_bert.POST_FIELDS, stats=read_stats):
+        for record in records:
+            post_text, post_data = query_bert.post_to_text_and_data(record)
+            post_id = record.get("id") or content_hash(post_text, post_data)
+            seen[post_id] = (os.path.basename(path), post_text, post_data)
+    print(read_stats)
+
+    posts = manifest["posts"]
+    touched_files = set(changed) | set(removed)
+    gone = [pid for pid, entry in posts.items() if entry["file"] in touched_files and pid not in seen]
+    updates = []
+    for pid, (name, post_text, post_data) in seen.items():
+        post_hash = content_hash(post_text, post_data)
+        if pid in posts and posts[pid]["hash"] == post_hash:
+            posts[pid]["file"] = name
+            continue
+        updates.append((pid, post_hash, post_text, post_data, name))
+
+    stale_rows = [posts[pid]["row"] for pid in gone]
+    stale_rows += [posts[pid]["row"] for pid, *_ in updates if pid in posts]
+    if not fresh:
+        # Rows added by an interrupted earlier run that never reached the manifest.
+        known_rows = {entry["row"] for entry in posts.values()}
+        stale_rows += [int(row) for row in query_bert.index_ids(index) if int(row) not in known_rows]
+    if stale_rows and not supports_removal(index_type, index_params):
+        # Decided before anything is embedded or written.
+        print(f"Index type {index_type!r} cannot remove vectors; rebuilding the BERT index from scratch.")
+        return update_index(data_dir, index_path, docs_path, tokenizer, model, model_name, index_type,
+                            index_params, batch_size, workers, threads_per_worker, shard_size, backend, full=True)
+
+    # Embeddings: cache first, then the model for whatever is left.
+    cache = EmbeddingCache(index_path + ".embcache", model_name)
+    keys = [embedding_key(pid, post_text, post_data) for pid, _, post_text, post_data, _ in updates]
+    vectors = cache.get(keys)
+    missing = [i for i, key in enumerate(keys) if key not in vectors]
+    if missing:
+        texts = [updates[i][2] for i in missing]
+        if workers > 1:
+            normalized = parallel_embed.embed_texts_parallel(
+                texts, index_path + ".shards", model_name, workers=workers,
+                threads_per_worker=threads_per_worker, shard_size=shard_size, batch_size=batch_size,
+                backend=backend)
+        else:
+            embeddings = query_bert.generate_embeddings_batch(texts, tokenizer, model, batch_size=batch_size)
+            normalized = query_bert.normalize_embeddings(embeddings)
+        cache.add([keys[i] for i in missing], normalized)
+        vectors.update(zip((keys[i] for i in missing), normalized))
+    if fresh:
+        # A fresh index holds exactly these posts; older embeddings are dead.
+        cache.compact(keys)
+    cache.save()
+    parallel_embed.clear_shards(index_path + ".shards")
+
+    # Document store rows double as FAISS ids.
+    new_rows = []
+    with DocStoreWriter(docs_path, append=not fresh) as writer:
+        for pid, post_hash, _, post_data, name in updates:
+            new_rows.append(writer.add(post_data))
+        doc_rows = writer.count
+
+    new_vectors = np.array([vectors[key] for key in keys], dtype=np.float32)
+    if fresh:
+        if len(new_vectors):
+            dimension = new_vectors.shape[1]
+        elif model is not None:
+            dimension = model.config.hidden_size
+        else:
+            dimension = query_bert.model_dimension(model_name)
+        index = new_id_index(dimension, index_type, index_params, new_vectors if len(new_vectors) else None)
+
+    if stale_rows:
+        index.remove_ids(np.array(stale_rows, dtype=np.int64))
+    if len(new_vectors):
+        index.add_with_ids(new_vectors, np.array(new_rows, dtype=np.int64))
+
+    for pid in gone:
+        del posts[pid]
+    for (pid, post_hash, _, _, name), row in zip(updates, new_rows):
+        posts[pid] = {"hash": post_hash, "row": row, "file": name}
+    manifest["files"] = current_files
+    manifest["post_fields"] = list(query_bert.POST_FIELDS)
+    manifest["live_posts"] = len(posts)
+    manifest["doc_rows"] = doc_rows
+
+    # The manifest is written last: if anything above fails, the next run redoes this update
+    # and drops the orphaned rows.
+    query_bert.save_faiss_index(index, index_path, index_type, index_params)
+    save_metadata_filters(index, docs_path, index_path)
+    write_json(manifest_path, manifest)
+    print(f"BERT index updated: {len(updates)} added/changed ({len(missing)} embedded), "
+          f"{len(gone)} removed, {index.ntotal} total.")
+
+    dead = doc_rows - len(posts)
+    if not fresh and doc_rows and dead / doc_rows > COMPACT_DEAD_FRACTION:
+        # Every live post is in the embedding cache, so nothing is re-embedded.
+        print(f"Compacting the BERT index: {dead} of {doc_rows} document rows are dead.")
+        return update_index(data_dir, index_path, docs_path, tokenizer, model, model_name, index_type,
+                            index_params, batch_size, workers, threads_per_worker, shard_size, backend, full=True)
+    return index
+
+if __name__ == "__main__":
+    # Brings the BERT index up to date without starting the web app. With
+    # --publish the result becomes a new snapshot for the running app to load
+    # (see snapshots.py).
+    import argparse
+    from utils import snapshots
+    parser = argparse.ArgumentParser(description="Incrementally update the BERT index")
+    parser.add_argument("--publish", action="store_true", help="publish the updated index as a snapshot")
+    parser.add_argument("--full", action="store_true", help="rebuild the index from scratch")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(base_dir, "utils", "config.json"), "r") as f:
+        config = json.load(f)
+    bert_index = config.get("bertIndex", {})
+    model_config = config.get("bertModel", {})
+    snapshot_config = config.get("snapshots", {})
+    snapshots_dir = os.path.join(base_dir, snapshot_config.get("dir", "./utils/snapshots"))
+    model_name = model_config.get("name", "sentence-transformers/all-distilroberta-v1")
+    index_path = os.path.join(base_dir, "utils", "bert.index")
+    docs_path = os.path.join(base_dir, "utils", "bert.docs")
+
+    with snapshots.rebuild_lock(snapshots_dir) as acquired:
+        if not acquired:
+            print("Another BERT index rebuild is running.")
+            sys.exit(0)
+        tokenizer, model = query_bert.load_transformers_model(
+            model_name, backend=model_config.get("backend", "torch"), num_threads=model_config.get("numThreads"))
+        update_index(
+            os.path.join(base_dir, "data"), index_path, docs_path, tokenizer, model, model_name=model_name,
+            index_type=bert_index.get("type", "flat"), index_params=bert_index.get("params", {}),
+            backend=model_config.get("backend", "torch"), full=args.full)
+        if args.publish:
+            snapshots.publish_snapshot(index_path, docs_path, snapshots_dir, keep=snapshot_config.get("keep", 2))
@@ -0,0 +1,231 @@
+import os
+import json
+import queue
+import shutil
+import socket
+import platform
+import tempfile
+import threading
+import subprocess
+try:
+    from utils.metrics import observe_stage, timed
+except ImportError:
+    # Run directly as a script from the utils folder.
+    from metrics import observe_stage, timed
+
+# --------------------------
+# Persistent Lucene Search Client
+# --------------------------
+# Java sources of the server, compiled next to them when their classes are
+# missing or older than the sources.
+JAVA_SOURCES = ("LuceneSearch.java", "LuceneSearchServer.java")
+
+# Document schema the server expects (indexer.INDEX_SCHEMA); older indexes
+# lack the metadata fields used by filters and sorting.
+INDEX_SCHEMA = 2
+
+class LuceneClient:
+    """
+    Talks to a long-lived LuceneSearchServer JVM instead of starting
+    `java LuceneSearch` for every query.
+
+    The server is started lazily on first use (and restarted if it dies),
+    compiling it first if needed.
+    Sockets are kept in a bounded pool and reused across requests; at most
+    `pool_size` queries are in flight at once, matching the server's worker
+    threads. Responses have the same JSON shape as LuceneSearch.java.
+    `index_dir` serves another index than indexDir in utils/config.json.
+    """
+
+    def __init__(self, base_dir, pool_size=4, timeout=30.0, index_dir=None):
+        self.base_dir = base_dir
+        self.index_dir = index_dir
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._process = None
+        self._port = None
+        self._start_lock = threading.Lock()
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _classpath(self):
+        # Determine OS for correct classpath separator
+        separator = ";" if platform.system() == "Windows" else ":"
+        dependencies_dir = os.path.join(self.base_dir, "dependencies")
+        return f"{self.base_dir}{separator}{dependencies_dir}/*"
+
+    def _command(self):
+        # index_dir overrides indexDir from the config.
+        options = [f"-DindexDir={os.path.abspath(self.index_dir)}"] if self.index_dir else []
+        return ["java"] + options + ["-cp", self._classpath(), "LuceneSearchServer"]
+
+    def _compile(self):
+        """
+        Compiles the server when a class file is missing or older than its
+        source. Classes are built in a scratch directory and moved into
+        place, so workers starting at the same time never load a half
+        written class.
+        """
+        sources = [os.path.join(self.base_dir, name) for name in JAVA_SOURCES]
+        classes = [source[:-len(".java")] + ".class" for source in sources]
+        if all(os.path.exists(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(source)
+               for source, compiled in zip(sources, classes)):
+            return
+        build_dir = tempfile.mkdtemp(prefix=".javac-", dir=self.base_dir)
+        try:
+            try:
+                result = subprocess.run(["javac", "-cp", self._classpath(), "-d", build_dir] + sources,
+                                        capture_output=True, text=True)
+            except FileNotFoundError:
+                raise RuntimeError("javac not found: a JDK is needed to compile the Lucene server") from None
+            if result.returncode != 0:
+                raise RuntimeError(f"Compiling the Lucene server failed:\n{result.stderr}")
+            for name in os.listdir(build_dir):
+                os.replace(os.path.join(build_dir, name), os.path.join(self.base_dir, name))
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def _check_index(self):
+        """
+        Fails with the command that builds the index when it is missing or
+        was built before the metadata fields existed, instead of returning
+        unfiltered results.
+        """
+        index_dir = self.index_dir
+        if index_dir is None:
+            # The server resolves indexDir from ./utils/config.json in base_dir.
+            with open(os.path.join(self.base_dir, "utils", "config.json"), "r") as f:
+                index_dir = json.load(f).get("indexDir", "./utils/pylucene_indexes")
+        index_dir = os.path.normpath(os.path.join(os.path.abspath(self.base_dir), index_dir))
+        manifest_path = index_dir + ".manifest.json"
+        schema = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                schema = json.load(f).get("schema")
+        if schema != INDEX_SCHEMA:
+            indexer = os.path.join(os.path.dirname(os.path.abspath(self.base_dir)),
+                                   "Part A.2 - Indexing using PyLucene", "indexer.py")
+            data_dir = os.path.join(os.path.abspath(self.base_dir), "data")
+            raise RuntimeError(
+                f"The Lucene index at {index_dir} is missing or was built by an older indexer "
+                f"(schema {schema}, expected {INDEX_SCHEMA}). Build it with: "
+                f'python "{indexer}" --full --index-only --data-dir "{data_dir}" --index-dir "{index_dir}"')
+
+    def _ensure_server(self):
+        """
+        Starts the Java server if it is not running and returns its port.
+        """
+        with self._start_lock:
+            if self._process is not None and self._process.poll() is None:
+                return self._port
+            self._drain_idle()
+            self._check_index()
+            self._compile()
+            # The server reads ./utils/config.json, so run it from the app directory.
+            # stdin stays open for the server's lifetime; it exits when we go away.
+            with timed("lucene", "start"):
+                self._process = subprocess.Popen(
+                    self._command(),
+                    cwd=self.base_dir,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                )
+                ready_line = self._process.stdout.readline()
+            try:
+                self._port = int(json.loads(ready_line)["port"])
+            except (ValueError, KeyError, TypeError):
+                self._process.kill()
+                self._process = None
+                raise RuntimeError(f"Lucene server failed to start: {ready_line!r}")
+            return self._port
+
+    def start(self):
+        """
+        Starts the server now instead of on the first query.
+        """
+        self._ensure_server()
+
+    def _drain_idle(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+    def _connect(self):
+        port = self._ensure_server()
+        sock = socket.create_connection(("127.0.0.1", port), timeout=self.timeout)
+        return sock, sock.makefile("rwb")
+
+    @staticmethod
+    def _close(conn):
+        sock, stream = conn
+        try:
+            stream.close()
+            sock.close()
+        except OSError:
+            pass
+
+    def _request(self, conn, payload):
+        _, stream = conn
+        stream.write(json.dumps(payload).encode("utf-8") + b"\n")
+        stream.flush()
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("Lucene server closed the connection")
+        return json.loads(line)
+
+    def search(self, query, top_k, fields=None, snippet_chars=0, filters=None, sort=None):
+        """
+        Runs a query on the server. Returns the parsed JSON response:
+          {"totalHits": <int>, "results": [{"score", "URL", "Title", "Body", "Comments", "Snippet"}, ...]}
+        `fields` limits the returned fields (None means all stored fields) and
+        "Snippet" is only built when requested with snippet_chars > 0.
+        `filters` (e.g. {"subreddit": "linux", "after": <epoch seconds>, "minScore": 10})
+        and `sort` ("relevance", "newest", "top", "comments") are applied in the index.
+        """
+        payload = {"topK": int(top_k), "query": query}
+        if fields is not None:
+            payload["fields"] = list(fields)
+        if snippet_chars > 0:
+            payload["snippetChars"] = int(snippet_chars)
+        if filters:
+            payload["filters"] = filters
+        if sort:
+            payload["sort"] = sort
+        with self._slots:
+            # One retry covers stale pooled sockets after a server restart.
+            for attempt in range(2):
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                try:
+                    with timed("lucene", "roundtrip"):
+                        response = self._request(conn, payload)
+                except (OSError, ConnectionError):
+                    self._close(conn)
+                    if attempt == 1:
+                        raise
+                    continue
+                self._idle.put_nowait(conn)
+                # Server-side stages, measured in the JVM.
+                for stage, ms in response.pop("timings", {}).items():
+                    observe_stage("lucene", stage[:-len("Ms")], ms / 1000)
+                return response
+
+    def close(self):
+        """
+        Closes pooled connections and stops the server process.
+        """
+        with self._start_lock:
+            self._drain_idle()
+            if self._process is not None:
+                self._process.stdin.close()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+                self._process = None
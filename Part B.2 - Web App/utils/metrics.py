@@ -0,0 +1,147 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# --------------------------
+# Metrics
+# --------------------------
+# Histograms and counters for /stats and the Prometheus /metrics endpoint.
+# Stage timings go to reddit_search_stage_seconds{engine, stage}:
+#   bert    tokenize, forward, faiss_search, threshold, results
+#   lucene  start (JVM), roundtrip, and the server's parse, search, fetch
+#   any     render (template)
+
+class Histogram:
+    """
+    Thread-safe histogram with fixed upper bucket bounds, Prometheus style:
+    snapshot() returns cumulative counts per bound (values above the last
+    bound only show up in "+Inf"), plus the total count and sum.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[position] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self._count, self._sum
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"buckets": cumulative, "count": count, "sum": total,
+                "mean": total / count if count else 0.0}
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._count = 0
+            self._sum = 0.0
+
+class Counter:
+    """
+    Thread-safe monotonically increasing counter.
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+# Stage and request latencies, in seconds as Prometheus expects.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Registry:
+    """
+    Named metrics with labels, rendered in the Prometheus text format.
+    histogram() and counter() return the existing metric for a name and
+    label set, creating it on first use.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = factory()
+                    self._help.setdefault(name, (kind, help))
+        return metric
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self._get("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def counter(self, name, help, **labels):
+        return self._get("counter", name, help, labels, Counter)
+
+    def render(self):
+        lines = []
+        # Copy both dicts under the lock: a metric created mid-render would
+        # otherwise change their size during iteration.
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+            helps = sorted(self._help.items())
+        for name, (kind, help) in helps:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric_name, labels), metric in metrics:
+                if metric_name != name:
+                    continue
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {metric.value}")
+                    continue
+                snapshot = metric.snapshot()
+                for bound, count in snapshot["buckets"].items():
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {snapshot['sum']}")
+                lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+REGISTRY = Registry()
+
+def observe_stage(engine, stage, seconds):
+    REGISTRY.histogram("reddit_search_stage_seconds", "Time spent in one stage of a search.",
+                       engine=engine, stage=stage).observe(seconds)
+
+@contextmanager
+def timed(engine, stage):
+    """
+    Records the duration of the block as a stage of the engine's searches.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(engine, stage, time.perf_counter() - start)
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# --------------------------
+# Multi-Process Sharded Embedding
+# --------------------------
+# Texts are split into fixed-size shards and embedded by a pool of worker
+# processes, each with its own tokenizer/model and torch thread count. Every
+# finished shard is written to <shard_dir>/shard_<n>.npy, so a crashed run
+# resumes with the shards that are missing. Shards are read back in order.
+
+# Per-process model, set up once by _init_worker.
+_tokenizer = None
+_model = None
+
+def _init_worker(model_name, backend, num_threads):
+    global _tokenizer, _model
+    from utils import query_bert
+    _tokenizer, _model = query_bert.load_transformers_model(model_name, backend, num_threads)
+
+def _embed_shard(shard_id, texts, shard_path, batch_size):
+    from utils import query_bert
+    embeddings = query_bert.generate_embeddings_batch(texts, _tokenizer, _model, batch_size=batch_size)
+    normalized = query_bert.normalize_embeddings(embeddings).astype(np.float32)
+    # Write under a temporary name so a half-written shard is never picked up.
+    tmp_path = shard_path + ".tmp.npy"
+    np.save(tmp_path, normalized)
+    os.replace(tmp_path, shard_path)
+    return shard_id, len(texts)
+
+def corpus_fingerprint(texts, model_name, shard_size):
+    """
+    Identifies the work a shard directory belongs to; shards are only
+    reused when the texts, model and shard size are unchanged.
+    """
+    digest = hashlib.sha1(f"{model_name}\0{shard_size}\0{len(texts)}".encode("utf-8"))
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def shard_path(shard_dir, shard_id):
+    return os.path.join(shard_dir, f"shard_{shard_id:05d}.npy")
+
+def embed_texts_parallel(texts, shard_dir, model_name="sentence-transformers/all-distilroberta-v1",
+                         workers=4, threads_per_worker=1, shard_size=2048, batch_size=32, backend="torch"):
+    """
+    Embeds texts across `workers` processes and returns the normalized
+    embeddings as a float32 array of shape (len(texts), hidden_dim), in order.
+    Prints progress per shard and a final docs/sec summary.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    fingerprint = corpus_fingerprint(texts, model_name, shard_size)
+    state_path = os.path.join(shard_dir, "shards.json")
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+    if state.get("fingerprint") != fingerprint:
+        # Different corpus: the old shards are useless.
+        shutil.rmtree(shard_dir)
+        os.makedirs(shard_dir)
+        with open(state_path, "w") as f:
+            json.dump({"fingerprint": fingerprint, "num_texts": len(texts), "shard_size": shard_size}, f)
+
+    num_shards = (len(texts) + shard_size - 1) // shard_size
+    pending = [i for i in range(num_shards) if not os.path.exists(shard_path(shard_dir, i))]
+    resumed_docs = len(texts) - sum(min(shard_size, len(texts) - i * shard_size) for i in pending)
+    if resumed_docs:
+        print(f"Resuming: {num_shards - len(pending)}/{num_shards} shards ({resumed_docs} docs) already embedded.")
+
+    start_time = time.time()
+    embedded_docs = 0
+    if pending:
+        # spawn: torch and tokenizers do not survive a fork with threads running.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(model_name, backend, threads_per_worker)) as pool:
+            futures = [
+                pool.submit(_embed_shard, i, texts[i * shard_size:(i + 1) * shard_size],
+                            shard_path(shard_dir, i), batch_size)
+                for i in pending
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                _, count = future.result()
+                embedded_docs += count
+                elapsed = max(time.time() - start_time, 1e-9)
+                rate = embedded_docs / elapsed
+                remaining = len(texts) - resumed_docs - embedded_docs
+                print(f"[{done}/{len(pending)} shards] {embedded_docs} docs, {rate:.1f} docs/sec, "
+                      f"ETA {remaining / rate if rate else 0:.0f}s", flush=True)
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    print(f"Embedded {embedded_docs} docs in {elapsed:.1f}s with {workers} workers x {threads_per_worker} threads: "
+          f"{embedded_docs / elapsed:.1f} docs/sec ({resumed_docs} docs resumed from shards).")
+
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate([np.load(shard_path(shard_dir, i)) for i in range(num_shards)], axis=0)
+
+def clear_shards(shard_dir):
+    """
+    Removes the shard directory once its embeddings are safely merged.
+    """
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full parallel reindex of the BERT engine")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--shard-size", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    from utils import incremental_index
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    index_path = os.path.join(base_dir, "utils", "bert.index")
+    docs_path = os.path.join(base_dir, "utils", "bert.docs")
+    with open(os.path.join(base_dir, "utils", "config.json"), "r") as f:
+        config = json.load(f)
+    bert_index = config.get("bertIndex", {})
+    model_config = config.get("bertModel", {})
+    model_name = model_config.get("name", "sentence-transformers/all-distilroberta-v1")
+
+    # Dropping the manifest makes update_index rebuild every post; embeddings
+    # still come from the cache when possible, the rest from the worker pool.
+    manifest_path = index_path + ".manifest.json"
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    # Only the workers encode, so the parent never loads the model weights.
+    index = incremental_index.update_index(
+        os.path.join(base_dir, "data"), index_path, docs_path, None, None,
+        model_name=model_name, backend=model_config.get("backend", "torch"), index_type=bert_index.get("type", "flat"), index_params=bert_index.get("params", {}),
+        batch_size=args.batch_size, workers=args.workers, threads_per_worker=args.threads,
+        shard_size=args.shard_size)
+    print("Index built. Number of vectors:", index.ntotal)
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# --------------------------
+# Slow Request Profiler
+# --------------------------
+# While a profiled request runs, a sampler thread records the Python stacks
+# of the request thread and of the threads doing work on its behalf (query
+# batcher, hybrid pool) every interval_ms. Requests slower than slow_ms are
+# written out in the folded format of flamegraph.pl / speedscope:
+#   <thread>;<outermost frame>;...;<innermost frame> <samples>
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+class _Sampler(threading.Thread):
+
+    def __init__(self, target_ident, thread_prefixes, interval):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.target_ident = target_ident
+        self.thread_prefixes = thread_prefixes
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident != self.target_ident and not name.startswith(self.thread_prefixes):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append("request" if ident == self.target_ident else name)
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+class SlowRequestProfiler:
+    """
+    Samples a fraction (sample_rate) of requests and keeps the profiles of
+    those that take at least slow_ms, as <out_dir>/<time>-<label>-<ms>ms.folded.
+    At most max_files profiles are kept, the oldest are deleted first.
+    """
+
+    def __init__(self, out_dir, slow_ms=500, interval_ms=5, sample_rate=1.0, max_files=100,
+                 thread_prefixes=("bert-batcher", "hybrid")):
+        self.out_dir = out_dir
+        self.slow = slow_ms / 1000
+        self.interval = interval_ms / 1000
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.written = 0
+
+    @contextmanager
+    def profile(self, label):
+        if random.random() >= self.sample_rate:
+            yield
+            return
+        sampler = _Sampler(threading.get_ident(), self.thread_prefixes, self.interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+            if elapsed >= self.slow and sampler.samples:
+                self._write(label, elapsed, sampler.samples)
+
+    def _write(self, label, elapsed, samples):
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}-{elapsed * 1000:.0f}ms.folded"
+        with open(os.path.join(self.out_dir, name), "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.written += 1
+        profiles = sorted(entry for entry in os.listdir(self.out_dir) if entry.endswith(".folded"))
+        for old in profiles[:-self.max_files]:
+            try:
+                os.remove(os.path.join(self.out_dir, old))
+            except OSError:
+                pass
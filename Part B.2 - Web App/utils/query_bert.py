@@ -1,18 +1,34 @@
 import os
 import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
 import faiss
 import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoConfig, AutoTokenizer, AutoModel
+try:
+    from utils import reddit_reader, snippets, vector_filters
+    from utils.metrics import timed
+except ImportError:
+    # Run directly as a script from the utils folder.
+    import reddit_reader
+    import snippets
+    import vector_filters
+    from metrics import timed
 
 # --------------------------
 # Data Loading
 # --------------------------
-def load_reddit_posts(data_dir):
+def load_reddit_posts(data_dir, workers=1):
     """
     Loads Reddit posts from all files in the specified directory.
     Assumes each file (e.g., reddit_batch_1.txt) contains one JSON record per line.
     Each record must have at least 'title' and 'body', and optionally 'permalink'.
+    Files are streamed through reddit_reader (in `workers` processes) and only
+    the fields needed here are materialized.
     
     Returns:
       posts_texts: List of combined post texts (for embedding)
@@ -20,62 +36,103 @@ def load_reddit_posts(data_dir):
     """
     posts_texts = []
     posts_data = []
-    for filename in sorted(os.listdir(data_dir)):
-        if filename.startswith("reddit_batch_") and filename.endswith(".txt"):
-            file_path = os.path.join(data_dir, filename)
-            with open(file_path, "r", encoding="utf-8") as f:
-                for line in f.readlines():
-                    try:
-                        post = json.loads(line.strip())
-                        # Combine title and body (add comments if desired)
-                        post_text = post['title'] + " " + post['body']
-                        for comment in post.get('comments', []):
-                            post_text += " " + comment.get('body', "")
-                        posts_texts.append(post_text)
-                        posts_data.append({
-                            "title": post.get("title", "Untitled"),
-                            "body": post.get("body", ""),
-                            "permalink": post.get("permalink", "")
-                        })
-                    except Exception as e:
-                        print(f"Error processing line in {filename}: {e}")
+    paths = reddit_reader.batch_files(data_dir)
+    for record in reddit_reader.iter_records(paths, POST_FIELDS, workers):
+        post_text, post_data = post_to_text_and_data(record)
+        posts_texts.append(post_text)
+        posts_data.append(post_data)
     return posts_texts, posts_data
 
+# Fields read from the crawler records ("text" is built by reddit_reader).
+POST_FIELDS = ("id", "title", "body", "permalink", "text",
+               "subreddit", "created_utc", "score", "num_comments", "over_18")
+
+def post_to_text_and_data(record):
+    """
+    Splits a post record (projected to POST_FIELDS) into the text to embed
+    and the metadata to keep (also used for filtered search).
+    """
+    post_data = {
+        "id": record.get("id", ""),
+        "title": record.get("title", "Untitled"),
+        "body": record.get("body", ""),
+        "permalink": record.get("permalink", ""),
+        "subreddit": (record.get("subreddit") or "").lower(),
+        "created_utc": int(record.get("created_utc") or 0),
+        "score": int(record.get("score") or 0),
+        "num_comments": int(record.get("num_comments") or 0),
+        "over_18": bool(record.get("over_18")),
+    }
+    return record["text"], post_data
+
 # --------------------------
 # Embedding Generation
 # --------------------------
-def generate_embeddings_batch(texts, tokenizer, model, batch_size=32):
+def mean_pool(last_hidden_state, attention_mask):
+    """
+    Averages token embeddings over the non-padding positions.
+    Returns a torch.Tensor of shape (batch, hidden_dim).
+    """
+    mask = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
+    masked_embeddings = last_hidden_state * mask
+    summed = torch.sum(masked_embeddings, dim=1)
+    summed_mask = torch.clamp(mask.sum(dim=1), min=1e-9)
+    return summed / summed_mask
+
+def pad_token_ids(input_ids, pad_token_id):
+    """
+    Right-pads a list of token id lists to the longest one in the list.
+    Returns the (input_ids, attention_mask) tensors expected by the model.
+    """
+    max_len = max(len(ids) for ids in input_ids)
+    padded = torch.full((len(input_ids), max_len), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(input_ids), max_len), dtype=torch.long)
+    for row, ids in enumerate(input_ids):
+        padded[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+    return padded, attention_mask
+
+def generate_embeddings_batch(texts, tokenizer, model, batch_size=32, bucket_batches=64, max_length=512):
     """
     Generates embeddings for a list of texts in batches using mean pooling.
+
+    Texts are tokenized in windows of `batch_size * bucket_batches` with a single
+    fast tokenizer call per window, sorted by token length inside the window and
+    padded only to the longest text of each batch, so short posts are not run
+    through the model at 512 tokens. Embeddings are returned in the original order
+    and the throughput (tokens/sec) is printed at the end.
+
     Returns a torch.Tensor of shape (num_texts, hidden_dim).
     """
-    all_embeddings = []
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        tokens = {"input_ids": [], "attention_mask": []}
-        for text in batch:
-            new_tokens = tokenizer.encode_plus(
-                text,
-                max_length=512,
-                truncation=True,
-                padding='max_length',
-                return_tensors='pt'
-            )
-            tokens["input_ids"].append(new_tokens["input_ids"][0])
-            tokens["attention_mask"].append(new_tokens["attention_mask"][0])
-        tokens["input_ids"] = torch.stack(tokens["input_ids"])
-        tokens["attention_mask"] = torch.stack(tokens["attention_mask"])
-        with torch.no_grad():
-            outputs = model(**tokens)
-        embeddings = outputs.last_hidden_state  # (batch, seq_len, hidden_dim)
-        attention_mask = tokens["attention_mask"]  # (batch, seq_len)
-        mask = attention_mask.unsqueeze(-1).expand(embeddings.size()).float()
-        masked_embeddings = embeddings * mask
-        summed = torch.sum(masked_embeddings, dim=1)
-        summed_mask = torch.clamp(mask.sum(dim=1), min=1e-9)
-        mean_pooled = summed / summed_mask  # (batch, hidden_dim)
-        all_embeddings.append(mean_pooled)
-    all_embeddings = torch.cat(all_embeddings, dim=0)
+    if not texts:
+        return torch.empty((0, model.config.hidden_size))
+
+    chunks = []
+    positions = []
+    total_tokens = 0
+    start_time = time.time()
+    window = batch_size * bucket_batches
+    for w in range(0, len(texts), window):
+        encoded = tokenizer(texts[w:w+window], max_length=max_length, truncation=True)["input_ids"]
+        # Bucket by length so each batch is padded to similar-length neighbours.
+        order = sorted(range(len(encoded)), key=lambda j: len(encoded[j]))
+        for b in range(0, len(order), batch_size):
+            batch_order = order[b:b+batch_size]
+            input_ids, attention_mask = pad_token_ids([encoded[j] for j in batch_order], tokenizer.pad_token_id)
+            with torch.no_grad():
+                outputs = model(input_ids=input_ids, attention_mask=attention_mask)
+            chunks.append(mean_pool(outputs.last_hidden_state, attention_mask))
+            positions.extend(w + j for j in batch_order)
+            total_tokens += int(attention_mask.sum())
+
+    # Restore the original order of the texts.
+    embeddings = torch.cat(chunks, dim=0)
+    all_embeddings = torch.empty_like(embeddings)
+    all_embeddings[torch.tensor(positions)] = embeddings
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    print(f"Embedded {len(texts)} texts ({total_tokens} tokens) in {elapsed:.2f}s: "
+          f"{total_tokens / elapsed:.0f} tokens/sec")
     return all_embeddings
 
 def normalize_embeddings(embeddings):
@@ -90,19 +147,189 @@ def normalize_embeddings(embeddings):
 # --------------------------
 # FAISS Indexing
 # --------------------------
-def build_faiss_index(embeddings):
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq8", "pq")
+
+# Defaults for the approximate/quantized index types. nlist defaults to ~4*sqrt(N);
+# pq_m must divide the embedding dimension (768 for distilroberta).
+# refine ("flat" or "sq_fp16") re-scores the top k * k_factor candidates of the
+# base index with exact (or fp16) vectors.
+DEFAULT_INDEX_PARAMS = {
+    "nlist": None,
+    "pq_m": 64,
+    "pq_nbits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "train_size": 100000,
+    "nprobe": 16,
+    "ef_search": 64,
+    "refine": None,
+    "k_factor": 4,
+}
+
+def resolve_index_params(index_type="flat", params=None, num_vectors=None):
+    """
+    Validates the index type and fills in default parameters.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    resolved = dict(DEFAULT_INDEX_PARAMS)
+    resolved.update(params or {})
+    if resolved["nlist"] is None and num_vectors:
+        resolved["nlist"] = max(1, int(4 * np.sqrt(num_vectors)))
+    return resolved
+
+def new_faiss_index(dimension, index_type="flat", params=None, training_vectors=None):
+    """
+    Creates an empty FAISS index (using inner product) ready for add().
+
+    index_type selects the structure:
+      - "flat":     exact brute-force search (IndexFlatIP)
+      - "ivf_flat": inverted lists over a coarse k-means quantizer
+      - "ivf_pq":   inverted lists with product-quantized vectors
+      - "hnsw":     HNSW graph
+      - "sq_fp16":  vectors stored as float16 (half the memory of flat)
+      - "sq8":      vectors scalar-quantized to int8 (a quarter)
+      - "pq":       product-quantized vectors, pq_m bytes each
+    Indexes that need training are trained on a random sample of
+    `train_size` rows of training_vectors. With params["refine"] set, the
+    index is wrapped in an IndexRefine that re-scores candidates exactly.
+    """
+    num_vectors = 0 if training_vectors is None else len(training_vectors)
+    params = resolve_index_params(index_type, params, num_vectors)
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"], metric)
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type in ("sq_fp16", "sq8"):
+        qtype = faiss.ScalarQuantizer.QT_fp16 if index_type == "sq_fp16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(dimension, qtype, metric)
+    elif index_type == "pq":
+        index = faiss.IndexPQ(dimension, params["pq_m"], params["pq_nbits"], metric)
+    else:
+        nlist = min(params["nlist"] or 1, max(num_vectors, 1))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, params["pq_m"], params["pq_nbits"], metric)
+
+    if params["refine"] == "flat":
+        index = faiss.IndexRefine(index, faiss.IndexFlatIP(dimension))
+    elif params["refine"] == "sq_fp16":
+        index = faiss.IndexRefine(index, faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric))
+
+    if not index.is_trained:
+        if not num_vectors:
+            raise ValueError(f"Index type {index_type!r} needs training vectors")
+        rng = np.random.default_rng(0)
+        sample_size = min(params["train_size"], num_vectors)
+        sample = training_vectors[rng.choice(num_vectors, sample_size, replace=False)]
+        index.train(np.ascontiguousarray(sample))
+    set_search_params(index, params)
+    return index
+
+def build_faiss_index(embeddings, index_type="flat", params=None):
     """
     Builds a FAISS index (using inner product) from the given normalized embeddings.
+    See new_faiss_index for the available index types.
     """
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dimension)
+    index = new_faiss_index(embeddings.shape[1], index_type, params, embeddings)
     index.add(embeddings)
     return index
 
-def load_faiss_index(index_path):
+def index_ids(index):
+    """
+    Returns the ids of the vectors in the index: the id map of an
+    IndexIDMap2, the inverted list ids of an IVF index that holds its own
+    ids, and 0..ntotal-1 for anything else.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    if isinstance(index, faiss.IndexIVF):
+        lists = index.invlists
+        ids = [faiss.rev_swig_ptr(lists.get_ids(i), lists.list_size(i)).copy()
+               for i in range(index.nlist) if lists.list_size(i)]
+        return np.sort(np.concatenate(ids)).astype(np.int64) if ids else np.zeros(0, dtype=np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+def set_search_params(index, params):
+    """
+    Applies query-time parameters (nprobe for IVF, efSearch for HNSW,
+    k_factor for refined indexes). Parameters that do not apply to the
+    index are ignored.
+    """
+    space = faiss.ParameterSpace()
+    for name, key in (("nprobe", "nprobe"), ("efSearch", "ef_search"), ("k_factor_rf", "k_factor")):
+        if params.get(key) is None:
+            continue
+        try:
+            space.set_index_parameter(index, name, params[key])
+        except RuntimeError:
+            pass
+
+def save_faiss_index(index, index_path, index_type="flat", params=None):
+    """
+    Writes the index and records its type and parameters next to it
+    (<index_path>.json) so it can be loaded with the same search settings.
+    """
+    tmp_path = index_path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+    meta = {
+        "index_type": index_type,
+        "params": resolve_index_params(index_type, params, index.ntotal),
+        "dimension": index.d,
+        "ntotal": index.ntotal,
+    }
+    with open(index_path + ".json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+def load_index_meta(index_path):
+    """
+    Returns the recorded index type and parameters, or the flat defaults
+    for indexes written before the metadata file existed.
+    """
+    meta_path = index_path + ".json"
+    if not os.path.exists(meta_path):
+        return {"index_type": "flat", "params": resolve_index_params("flat")}
+    with open(meta_path, "r") as f:
+        return json.load(f)
+
+# mmap flags tried in order: flat codes mapped in place, then IVF inverted lists.
+MMAP_IO_FLAGS = tuple(getattr(faiss, name) for name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP") if hasattr(faiss, name))
+
+def read_faiss_index_mmap(index_path):
+    """
+    Reads an index read-only and memory-mapped, so processes serving the same
+    file share its pages through the page cache instead of each holding a
+    private copy. Falls back to a normal read when the index type (or the
+    FAISS build) does not support mmap.
+    """
+    for flag in MMAP_IO_FLAGS:
+        try:
+            return faiss.read_index(index_path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    print(f"Memory-mapping {index_path} is not supported, loading it into memory.")
+    return faiss.read_index(index_path)
+
+def load_faiss_index(index_path, search_params=None, mmap=False):
+    """
+    Loads a FAISS index and applies its recorded query-time parameters.
+    search_params (e.g. {"nprobe": 32}) override the recorded values.
+    With mmap=True the index is memory-mapped read-only (see read_faiss_index_mmap)
+    and must not be modified.
+    """
     if not os.path.exists(index_path):
         raise FileNotFoundError(f"FAISS index not found at {index_path}")
-    index = faiss.read_index(index_path)
+    index = read_faiss_index_mmap(index_path) if mmap else faiss.read_index(index_path)
+    params = dict(load_index_meta(index_path)["params"])
+    params.update(search_params or {})
+    set_search_params(index, params)
     return index
 
 # --------------------------
@@ -111,81 +338,162 @@ def load_faiss_index(index_path):
 def convert_to_embedding(query, tokenizer, model):
     """
     Converts a query string into an embedding using mean pooling.
-    Follows the same procedure as used during indexing.
+    Follows the same procedure as used during indexing, but pads nothing:
+    the query runs through the model at its real token length.
     
     Returns:
       A torch.Tensor of shape (hidden_dim,).
     """
-    tokens = tokenizer.encode_plus(
-        query,
-        max_length=512,
-        truncation=True,
-        padding='max_length',
-        return_tensors='pt'
-    )
-    with torch.no_grad():
-        outputs = model(**tokens)
-    embeddings = outputs.last_hidden_state  # (1, seq_len, hidden_dim)
-    attention_mask = tokens['attention_mask']  # (1, seq_len)
-    mask = attention_mask.unsqueeze(-1).expand(embeddings.size()).float()
-    masked_embeddings = embeddings * mask
-    summed = torch.sum(masked_embeddings, dim=1)
-    summed_mask = torch.clamp(mask.sum(dim=1), min=1e-9)
-    mean_pooled = summed / summed_mask
+    with timed("bert", "tokenize"):
+        tokens = tokenizer(
+            query,
+            max_length=512,
+            truncation=True,
+            return_tensors='pt'
+        )
+    with timed("bert", "forward"), torch.no_grad():
+        outputs = model(input_ids=tokens['input_ids'], attention_mask=tokens['attention_mask'])
+        mean_pooled = mean_pool(outputs.last_hidden_state, tokens['attention_mask'])
     return mean_pooled[0]
 
+def normalize_query(query):
+    """
+    Collapses whitespace so trivially different spellings share a cache entry.
+    """
+    return " ".join(query.split())
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of normalized query embeddings,
+    keyed by the normalized query text. Tracks hit/miss counters.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._entries), "maxsize": self.maxsize}
+
+query_cache = QueryEmbeddingCache()
+
+def encode_query(query, tokenizer, model, cache=query_cache):
+    """
+    Returns the unit-length embedding of a query as a float32 array of shape
+    (1, hidden_dim). Repeated queries are served from the LRU cache without
+    running the model.
+    """
+    text = normalize_query(query)
+    # Keyed per model so a reloaded/different model never sees stale vectors.
+    key = (id(model), text)
+    embedding = cache.get(key)
+    if embedding is None:
+        embedding = convert_to_embedding(text, tokenizer, model).cpu().numpy().reshape(1, -1)
+        embedding = (embedding / np.linalg.norm(embedding)).astype(np.float32)
+        embedding.setflags(write=False)
+        cache.put(key, embedding)
+    return embedding
+
+def encode_queries(queries, tokenizer, model, cache=query_cache):
+    """
+    Batched encode_query: returns a float32 array of shape (len(queries), hidden_dim).
+    Queries missing from the cache run through the model in one forward pass,
+    padded to the longest of them (padding is masked out by mean pooling).
+    """
+    texts = [normalize_query(query) for query in queries]
+    embeddings = [cache.get((id(model), text)) for text in texts]
+    missing = sorted({text for text, embedding in zip(texts, embeddings) if embedding is None})
+    if missing:
+        with timed("bert", "tokenize"):
+            tokens = tokenizer(missing, max_length=512, truncation=True, padding=True, return_tensors='pt')
+        with timed("bert", "forward"), torch.no_grad():
+            outputs = model(input_ids=tokens['input_ids'], attention_mask=tokens['attention_mask'])
+            pooled = mean_pool(outputs.last_hidden_state, tokens['attention_mask']).cpu().numpy()
+        pooled = (pooled / np.linalg.norm(pooled, axis=1, keepdims=True)).astype(np.float32)
+        computed = {}
+        for text, vector in zip(missing, pooled):
+            embedding = vector.reshape(1, -1).copy()
+            embedding.setflags(write=False)
+            cache.put((id(model), text), embedding)
+            computed[text] = embedding
+        embeddings = [embedding if embedding is not None else computed[text]
+                      for text, embedding in zip(texts, embeddings)]
+    return np.vstack(embeddings)
+
 # --------------------------
 # Searching
 # --------------------------
-def search_bert(query, top_k, index, posts_data, tokenizer, model):
+def dynamic_threshold(max_sim):
     """
-    Converts the query to an embedding (using the same mean pooling),
-    normalizes it, performs a FAISS search over a large set of neighbors,
-    filters results by a similarity threshold, and returns the top_k results
-    along with the total number of hits that exceed the threshold.
-
-    Returns a dictionary in the format:
-      {
-          "totalHits": <int>,
-          "results": [
-             { "doc_id": <int>, "Title": <str>, "Body": <str>, "URL": <str>, "score": <float> },
-             ...
-          ]
-      }
+    Similarity cut-off relative to the best hit: the stronger the top match,
+    the wider the band of results that still count as hits.
     """
-    top_k = int(top_k)
-    # For total hit count, search over all indexed vectors
-    top_n = index.ntotal
-    
-    # Compute query embedding.
-    query_embedding = convert_to_embedding(query, tokenizer, model)
-    query_embedding_np = query_embedding.cpu().numpy().reshape(1, -1)
-    query_embedding_normalized = query_embedding_np / np.linalg.norm(query_embedding_np)
-    
-    # Perform FAISS search for top_n results.
-    distances, indices = index.search(query_embedding_normalized, top_n)
-    
-    # Debug: Print the top similarity score.
-    max_sim = distances[0][0]
-    # Dynamic Threshold
     cut_off = 0.5 if max_sim > 0.9 else 0.4 if max_sim > 0.8 else 0.3 if max_sim > 0.6 else 0.2 if max_sim > 0.4 else 0.1 if max_sim > 0.2 else 0.05
+    return max_sim - cut_off
 
-    threshold = max_sim - cut_off
-    print(f"Max similarity: {distances[0][0]} and Threshold: {threshold}")
-    
-    # Filter results by threshold.
-    filtered_results = []
-    for i in range(len(distances[0])):
-        if distances[0][i] >= threshold:
-            filtered_results.append((indices[0][i], distances[0][i]))
-    
-    total_hits = len(filtered_results)
-    
-    # Only take the top_k filtered results for display.
-    filtered_results = filtered_results[:top_k]
-    
+def count_hits(index, query_embedding, threshold):
+    """
+    Counts the indexed vectors whose similarity to the query is >= threshold,
+    without sorting the whole index. Returns (count, exact).
+
+    Exhaustive index types answer with an exact FAISS range search. On IVF
+    and HNSW the range search only sees the probed lists / visited graph
+    nodes, so its cost stays bounded like the search itself and the count is
+    approximate (a lower bound). Scanning every stored vector instead would
+    make each query linear in the corpus size.
+    """
+    # For inner product, range search keeps results strictly above the radius.
+    radius = float(np.nextafter(np.float32(threshold), np.float32(-np.inf)))
+    base = vector_filters.base_index(index)
+    exact = not isinstance(base, (faiss.IndexIVF, faiss.IndexHNSW))
+    top = faiss.downcast_index(index)
+    if isinstance(top, faiss.IndexIDMap2):
+        top = faiss.downcast_index(top.index)
+    if isinstance(top, faiss.IndexRefine):
+        # IndexRefine finds nothing in a range search; count on its
+        # (compressed) base index instead.
+        index, exact = base, False
+    lims, _, _ = index.range_search(query_embedding, radius)
+    return int(lims[1]), exact
+
+def build_results(hits, posts_data, fields=None, query="", snippet_chars=0):
+    """
+    Turns (doc_id, score) pairs into the result dictionaries returned to the UI.
+    Only the requested fields are included (None means Title and Body); a
+    "Snippet" of at most snippet_chars characters is built around the query terms.
+    """
+    fields = ("Title", "Body") if fields is None else fields
+    terms = snippets.query_terms(query) if "Snippet" in fields and snippet_chars > 0 else None
     results = []
-    for doc_id, score in filtered_results:
+    for doc_id, score in hits:
         if doc_id < len(posts_data):
             post = posts_data[doc_id]
             title = post.get("title", "No Title")
@@ -195,46 +503,218 @@ def search_bert(query, top_k, index, posts_data, tokenizer, model):
                 url = f"https://www.reddit.com{permalink}"
             else:
                 url = post.get("url", "No URL")
+            post_id = post.get("id", "")
         else:
-            title, body, url = "Unknown", "Unknown", "Unknown"
-        results.append({
-            "doc_id": int(doc_id),
-            "Title": title,
-            "Body": body,
-            "URL": url,
-            "score": float(score)
-        })
+            title, body, url, post_id = "Unknown", "Unknown", "Unknown", ""
+        result = {"doc_id": int(doc_id), "URL": url, "score": float(score)}
+        if post_id:
+            result["PostId"] = post_id
+        if "Title" in fields:
+            result["Title"] = title
+        if "Body" in fields:
+            result["Body"] = body
+        if terms is not None:
+            result["Snippet"] = snippets.make_snippet(body, terms, snippet_chars)
+        results.append(result)
+    return results
+
+def search_bert(query, top_k, index, posts_data, tokenizer, model, fields=None, snippet_chars=0, batcher=None,
+                filters=None, metadata_filters=None, exact_scan_max=20000):
+    """
+    Converts the query to an embedding (using the same mean pooling),
+    normalizes it, fetches only the first page of neighbors from FAISS,
+    derives the similarity threshold from the best hit and counts the
+    total number of hits above it without ranking the whole index.
+
+    Returns a dictionary in the format:
+      {
+          "totalHits": <int>,
+          "results": [
+             { "doc_id": <int>, "PostId": <str>, "Title": <str>, "Body": <str>, "URL": <str>, "score": <float> },
+             ...
+          ]
+      }
+    "totalHitsApproximate": true is added when totalHits is only a lower
+    bound (see count_hits).
+    `fields` and `snippet_chars` select the returned fields (see build_results).
+    With a QueryBatcher, encoding and the FAISS search run batched with other
+    concurrent queries.
+    `filters` (see search_filters) restrict the search to matching posts using
+    the precomputed vector_filters.MetadataFilters of the index.
+    """
+    top_k = int(top_k)
+    if index.ntotal == 0:
+        return {"totalHits": 0, "results": []}
+    
+    # Only the first page is ranked; the best hit fixes the threshold.
+    page_size = max(1, min(top_k, index.ntotal))
+    selected = metadata_filters.select(filters) if filters and metadata_filters is not None else None
+    count = None
+    if selected is not None:
+        # Filtered: the FAISS search itself only considers the selected ids.
+        query_embedding_normalized = encode_query(query, tokenizer, model)
+        with timed("bert", "faiss_search"):
+            distances, indices, count = vector_filters.filtered_search(
+                index, query_embedding_normalized, page_size, selected, metadata_filters.size, exact_scan_max)
+    elif batcher is not None:
+        query_embedding_normalized, distances, indices = batcher.search(query, page_size, index)
+    else:
+        # Compute (or fetch the cached) normalized query embedding.
+        query_embedding_normalized = encode_query(query, tokenizer, model)
+        with timed("bert", "faiss_search"):
+            distances, indices = index.search(query_embedding_normalized, page_size)
+    
+    # FAISS marks neighbors it could not fill with -1, anywhere in the row
+    # (IVF with a selector can leave gaps), so drop them before ranking.
+    found = indices[0] >= 0
+    if not found.any():
+        return {"totalHits": 0, "results": []}
+    distances, indices = distances[:, found], indices[:, found]
+
+    with timed("bert", "threshold"):
+        # The top similarity score fixes the threshold (stage timings replace the old debug print).
+        max_sim = distances[0][0]
+        threshold = dynamic_threshold(max_sim)
+        
+        # Filter the page by threshold.
+        keep = distances[0] >= threshold
+        filtered_results = list(zip(indices[0][keep], distances[0][keep]))[:top_k]
+        
+        matching, exact = (count(threshold) if count is not None
+                           else count_hits(index, query_embedding_normalized, threshold))
+        total_hits = max(matching, len(filtered_results))
     
-    return {"totalHits": total_hits, "results": results}
+    with timed("bert", "results"):
+        results = build_results(filtered_results, posts_data, fields, query, snippet_chars)
+    response = {"totalHits": total_hits, "results": results}
+    if not exact:
+        response["totalHitsApproximate"] = True
+    return response
 
 
 # --------------------------
 # Model Loading
 # --------------------------
-def load_transformers_model(model_name="sentence-transformers/all-distilroberta-v1"):
+BACKENDS = ("torch", "torch_int8", "onnx")
+
+def load_transformers_model(model_name="sentence-transformers/all-distilroberta-v1", backend="torch",
+                            num_threads=None, onnx_dir=None):
     """
     Loads the Hugging Face AutoTokenizer and AutoModel.
+
+    backend selects how the encoder runs on CPU:
+      - "torch":      eager PyTorch in fp32
+      - "torch_int8": dynamic int8 quantization of the Linear layers
+      - "onnx":       the model exported to ONNX and run by onnxruntime
+                      (exported once into onnx_dir, default utils/onnx)
+    num_threads sets the intra-op thread count of the chosen runtime.
     """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if num_threads:
+        torch.set_num_threads(num_threads)
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    if backend == "torch_int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        onnx_dir = onnx_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx")
+        onnx_path = os.path.join(onnx_dir, model_name.strip("/").replace("/", "__") + ".onnx")
+        model = OnnxEncoder(model, onnx_path, num_threads)
     return tokenizer, model
 
+def model_dimension(model_name="sentence-transformers/all-distilroberta-v1"):
+    """
+    Returns the embedding size of a model from its config, without loading
+    the weights.
+    """
+    return AutoConfig.from_pretrained(model_name).hidden_size
+
+class OnnxEncoder:
+    """
+    Runs an exported encoder with onnxruntime behind the same call signature
+    as the PyTorch model: model(input_ids=..., attention_mask=...) returns an
+    object with a torch `last_hidden_state`.
+    """
+
+    def __init__(self, model, onnx_path, num_threads=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The 'onnx' backend needs onnxruntime: pip install onnxruntime") from e
+        self.config = model.config
+        if not os.path.exists(onnx_path):
+            export_onnx(model, onnx_path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask):
+        outputs = self.session.run(
+            ["last_hidden_state"],
+            {"input_ids": input_ids.numpy(), "attention_mask": attention_mask.numpy()},
+        )
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(outputs[0]))
+
+def export_onnx(model, onnx_path):
+    """
+    Exports the encoder to ONNX with dynamic batch and sequence axes.
+    """
+    class _Encoder(torch.nn.Module):
+        # Fixes the traced signature to (input_ids, attention_mask) -> last_hidden_state.
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    # A temp file per process: parallel workers may export the same model.
+    fd, tmp_path = tempfile.mkstemp(suffix=".onnx.tmp", dir=os.path.dirname(onnx_path))
+    os.close(fd)
+    try:
+        torch.onnx.export(
+            _Encoder(model),
+            (dummy, dummy),
+            tmp_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+            dynamo=False,
+        )
+        os.replace(tmp_path, onnx_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 # --------------------------
 # Reindexing Function
 # --------------------------
-def reindex_data(data_dir, model_name="sentence-transformers/all-distilroberta-v1", batch_size=32):
+def reindex_data(data_dir, model_name="sentence-transformers/all-distilroberta-v1", batch_size=32,
+                 index_type="flat", index_params=None):
     """
     Reindexes all Reddit posts from the data directory.
       - Loads posts and their texts.
       - Generates embeddings in batches.
       - Normalizes the embeddings.
-      - Builds and returns a FAISS index along with the posts metadata.
+      - Builds and returns a FAISS index (of the given index_type) along with the posts metadata.
     """
     tokenizer, model = load_transformers_model(model_name)
     posts_texts, posts_data = load_reddit_posts(data_dir)
     embeddings = generate_embeddings_batch(posts_texts, tokenizer, model, batch_size=batch_size)
     normalized = normalize_embeddings(embeddings)
-    index = build_faiss_index(normalized)
+    index = build_faiss_index(normalized, index_type, index_params)
     return index, posts_data
 
 # --------------------------
@@ -251,7 +731,7 @@ if __name__ == "__main__":
     print("Index built. Number of vectors:", index.ntotal)
     
     # Save the FAISS index to disk.
-    faiss.write_index(index, index_save_path)
+    save_faiss_index(index, index_save_path)
     print("Index saved to:", index_save_path)
     
     # Load the model for query processing.
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import multiprocessing
+
+# --------------------------
+# Streaming Reddit Batch Reader
+# --------------------------
+# Shared by the BERT indexer (query_bert / incremental_index) and the PyLucene
+# indexer. The crawler writes one JSON post per line followed by ",", so lines
+# are parsed leniently. Files can be parsed in parallel worker processes;
+# records are yielded in file order either way.
+
+# Computed fields that can be requested next to the raw post keys.
+#   text:          title, body and all comment bodies (what BERT embeds)
+#   comments_text: all comment bodies (what Lucene indexes as Comments)
+VIRTUAL_FIELDS = ("text", "comments_text")
+
+class ReadStats:
+    """
+    Counters for one read: files, records, unparsable lines, bytes and time.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.records = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.first_error = None
+
+    def add_file(self, records, errors, size, first_error):
+        self.files += 1
+        self.records += records
+        self.errors += errors
+        self.bytes += size
+        if self.first_error is None:
+            self.first_error = first_error
+
+    def __str__(self):
+        seconds = max(self.seconds, 1e-9)
+        summary = (f"Parsed {self.records} records from {self.files} files "
+                   f"({self.bytes / 2**20:.1f} MB) in {self.seconds:.2f}s: "
+                   f"{self.records / seconds:.0f} records/sec, {self.bytes / 2**20 / seconds:.1f} MB/sec, "
+                   f"{self.errors} errors")
+        if self.first_error:
+            summary += f" (first: {self.first_error})"
+        return summary
+
+def batch_files(data_dir, prefix="reddit_batch_", extensions=(".txt",)):
+    """
+    Returns the sorted paths of the crawler's batch files in data_dir.
+    """
+    return [
+        os.path.join(data_dir, filename)
+        for filename in sorted(os.listdir(data_dir))
+        if filename.startswith(prefix) and filename.endswith(extensions)
+    ]
+
+def parse_line(line):
+    """
+    Parses one line of a batch file. Returns None for lines without a record
+    (blank lines, array brackets) and raises ValueError for malformed JSON.
+    """
+    line = line.strip()
+    if line.endswith(","):
+        line = line[:-1].rstrip()
+    if not line or line in ("[", "]"):
+        return None
+    return json.loads(line)
+
+def project(post, fields):
+    """
+    Keeps only the requested fields of a post. Virtual fields are built with
+    joins, so posts with thousands of comments stay linear.
+    """
+    if fields is None:
+        return post
+    record = {}
+    for field in fields:
+        if field == "text":
+            parts = [post["title"], post["body"]]
+            parts.extend(comment.get("body", "") for comment in post.get("comments", []))
+            record["text"] = " ".join(parts)
+        elif field == "comments_text":
+            record["comments_text"] = " ".join(comment.get("body", "") for comment in post.get("comments", []))
+        elif field in post:
+            record[field] = post[field]
+    return record
+
+def read_file(file_path, fields=None):
+    """
+    Parses one batch file line by line.
+    Returns (records, errors, size_in_bytes, first_error).
+    """
+    records = []
+    errors = 0
+    first_error = None
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            try:
+                post = parse_line(line)
+                if post is not None:
+                    records.append(project(post, fields))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                errors += 1
+                if first_error is None:
+                    first_error = f"{os.path.basename(file_path)}:{line_number}: {e!r}"
+    return records, errors, os.path.getsize(file_path), first_error
+
+def _read_file_task(args):
+    return read_file(*args)
+
+def iter_file_records(paths, fields=None, workers=1, stats=None, start_method=None):
+    """
+    Yields (file_path, records) per file, in the order of paths. With
+    workers > 1 the files are parsed in a process pool started with
+    `start_method` (the platform default when None; pass "spawn" once a JVM
+    or other threads are running, which a forked child would inherit broken).
+    """
+    stats = stats if stats is not None else ReadStats()
+    start_time = time.time()
+    tasks = [(path, fields) for path in paths]
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.get_context(start_method).Pool(min(workers, len(tasks))) as pool:
+            for path, (records, errors, size, first_error) in zip(paths, pool.imap(_read_file_task, tasks)):
+                stats.add_file(len(records), errors, size, first_error)
+                stats.seconds = time.time() - start_time
+                yield path, records
+    else:
+        for path, task in zip(paths, tasks):
+            records, errors, size, first_error = _read_file_task(task)
+            stats.add_file(len(records), errors, size, first_error)
+            stats.seconds = time.time() - start_time
+            yield path, records
+
+def iter_records(paths, fields=None, workers=1, stats=None, report=True):
+    """
+    Streams every record of the given batch files, optionally projected to
+    `fields`. Prints a throughput/error summary at the end unless report=False.
+    """
+    stats = stats if stats is not None else ReadStats()
+    for _, records in iter_file_records(paths, fields, workers, stats):
+        yield from records
+    if report:
+        print(stats)
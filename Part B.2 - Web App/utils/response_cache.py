@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --------------------------
+# Search Response Cache
+# --------------------------
+# Whole search responses are cached per (engine, normalized query, top_k,
+# fields, filters, sort). Every entry records the version of the index it was
+# computed from; an entry whose index has since been rebuilt is a miss.
+#   bert    the version of the BERT snapshot being served (utils/snapshots.py)
+#   lucene  the newest segments_N commit point in the index directory
+#   hybrid  both of the above
+# The optional disk tier is a SQLite file, shared by the gunicorn workers
+# and kept across restarts.
+
+# The disk tier is trimmed to disk_max_entries every this many writes.
+DISK_PRUNE_EVERY = 100
+
+def normalize_query(query):
+    return " ".join(query.split())
+
+def file_version(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def lucene_version(index_dir):
+    """
+    Every Lucene commit writes a new segments_N file, N growing by one.
+    """
+    try:
+        commits = [name for name in os.listdir(index_dir) if name.startswith("segments_")]
+    except OSError:
+        return None
+    if not commits:
+        return None
+    latest = max(commits, key=lambda name: int(name[len("segments_"):], 36))
+    return [latest, file_version(os.path.join(index_dir, latest))]
+
+class ResponseCache:
+    """
+    Thread-safe LRU of search responses, bounded by entry count and by the
+    size of the JSON-encoded responses (used as their memory estimate), with
+    an optional TTL and disk tier.
+
+    `versions` maps an engine to a function returning its index version.
+    `namespace` is part of every key, e.g. a hash of the settings that
+    shape responses, so a config change does not serve old disk entries.
+    """
+
+    def __init__(self, versions, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=None,
+                 disk_path=None, disk_max_entries=100000, namespace=""):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.namespace = namespace
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_pid = None
+        self._disk_lock = threading.Lock()
+        self._disk_puts = 0
+
+    def key(self, engine, query, top_k, fields=None, filters=None, sort=None):
+        parts = [self.namespace, engine, normalize_query(query), str(top_k).strip(),
+                 list(fields) if fields is not None else None, filters or {}, sort or "relevance"]
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def version(self, engine):
+        return json.dumps(self.versions[engine]())
+
+    def get(self, engine, key, version=None):
+        """
+        Returns the cached response, or None on a miss. Responses are shared
+        between callers and must not be modified. `version` is the engine's
+        index version (read now when None).
+        """
+        version = self.version(engine) if version is None else version
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires, response, size = entry
+                if entry_version == version and (expires is None or expires > now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                self._remove(key)
+                if entry_version != version:
+                    self.invalidated += 1
+
+        stored = self._disk_get(key, version, now)
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        response, expires, encoded = stored
+        self._put_memory(key, version, expires, response, len(encoded))
+        return response
+
+    def put(self, engine, key, response, version=None):
+        """
+        Stores a response under `version`: the index version read before the
+        search ran, so a result computed while the index changed is stored
+        under the old version (and misses) rather than the new one.
+        """
+        version = self.version(engine) if version is None else version
+        expires = time.time() + self.ttl if self.ttl else None
+        encoded = json.dumps(response)
+        self._put_memory(key, version, expires, response, len(encoded))
+        self._disk_put(key, version, expires, encoded)
+
+    def _put_memory(self, key, version, expires, response, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, expires, response, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def _connection(self):
+        # Opened per process: a SQLite connection must not cross a fork.
+        if self._disk is None or self._disk_pid != os.getpid():
+            self._disk = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                               "version TEXT, expires REAL, accessed REAL, response TEXT)")
+            self._disk_pid = os.getpid()
+        return self._disk
+
+    def _disk_get(self, key, version, now):
+        if not self.disk_path:
+            return None
+        with self._disk_lock:
+            try:
+                db = self._connection()
+                row = db.execute("SELECT version, expires, response FROM responses WHERE key = ?",
+                                 (key,)).fetchone()
+                if row is None:
+                    return None
+                entry_version, expires, encoded = row
+                if entry_version != version or (expires is not None and expires <= now):
+                    with db:
+                        db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                with db:
+                    db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                print(f"Response cache disk read failed: {e}")
+                return None
+        return json.loads(encoded), expires, encoded
+
+    def _disk_put(self, key, version, expires, encoded):
+        if not self.disk_path:
+            return
+        with self._disk_lock:
+            try:
+                db = self._connection()
+                with db:
+                    db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (key, version, expires, time.time(), encoded))
+                self._disk_puts += 1
+                if self._disk_puts % DISK_PRUNE_EVERY:
+                    return
+                with db:
+                    # Least recently used rows beyond the limit are dropped.
+                    db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                               "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.disk_max_entries,))
+            except sqlite3.Error as e:
+                print(f"Response cache disk write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.disk_hits = self.misses = self.invalidated = 0
+        if self.disk_path:
+            with self._disk_lock:
+                with self._connection() as db:
+                    db.execute("DELETE FROM responses")
+
+    def info(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            info = {
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "hitRatio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "memoryBytes": self._bytes,
+                "maxMemoryBytes": self.max_bytes,
+                "ttlSeconds": self.ttl,
+            }
+        if self.disk_path:
+            info["diskPath"] = self.disk_path
+            info["diskBytes"] = sum(file_version(self.disk_path + suffix)[0] for suffix in ("", "-wal")
+                                    if os.path.exists(self.disk_path + suffix))
+        return info
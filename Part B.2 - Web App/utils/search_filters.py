@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+# --------------------------
+# Metadata Filters and Sorting
+# --------------------------
+# Filters use the Lucene server's protocol keys:
+#   {"subreddit": "linux" or ["linux", "ubuntu"], "after": <epoch seconds>,
+#    "before": <epoch seconds>, "minScore": <int>, "minComments": <int>, "over18": <bool>}
+
+SORT_ORDERS = ("relevance", "newest", "top", "comments")
+
+def date_to_epoch(value, end_of_day=False):
+    """
+    Converts a "YYYY-MM-DD" date (UTC) to epoch seconds.
+    """
+    day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(day.timestamp()) + (86399 if end_of_day else 0)
+
+def parse_filters(form):
+    """
+    Builds the filter dictionary from search form values (subreddit as a
+    comma separated list, after/before dates, min_score, min_comments,
+    over_18 "yes"/"no"). Empty or invalid values are ignored.
+    """
+    filters = {}
+    subreddits = [name.strip().lower() for name in form.get("subreddit", "").split(",") if name.strip()]
+    if subreddits:
+        filters["subreddit"] = subreddits[0] if len(subreddits) == 1 else subreddits
+    for key, name, end_of_day in (("after", "after", False), ("before", "before", True)):
+        try:
+            filters[key] = date_to_epoch(form[name], end_of_day)
+        except (KeyError, ValueError):
+            pass
+    for key, name in (("minScore", "min_score"), ("minComments", "min_comments")):
+        try:
+            filters[key] = int(form[name])
+        except (KeyError, ValueError):
+            pass
+    if form.get("over_18") in ("yes", "no"):
+        filters["over18"] = form["over_18"] == "yes"
+    return filters
+
+def parse_sort(form):
+    sort = form.get("sort", "relevance")
+    return sort if sort in SORT_ORDERS else "relevance"
@@ -0,0 +1,152 @@
+"""
+Per-worker memory and throughput of the pre-fork serving mode as workers scale.
+
+For every worker count, gunicorn is started with gunicorn.conf.py, loaded
+with concurrent BERT searches for a fixed duration, and the RSS and PSS
+(proportional set size: shared pages such as the memory-mapped index and
+document store are split between the processes mapping them) of each
+worker are read from /proc. Linux only.
+
+Usage (from the web app directory):
+    python -m utils.serving_report --workers 1,2,4 --concurrency 16 --duration 20
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils.doc_store import DocStore
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def memory_kb(pid):
+    """
+    Returns {"rss_kb", "pss_kb"} of a process.
+    """
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                usage[name.lower() + "_kb"] = int(rest.split()[0])
+    return usage
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The ppid is the second field after the parenthesized command.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+def post_search(url, query, top_k, engine):
+    data = urllib.parse.urlencode({"query": query, "top_k": top_k, "index_type": engine}).encode()
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, data=data, timeout=120) as response:
+        response.read()
+    return (time.perf_counter() - start) * 1000
+
+def wait_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return
+        except OSError:
+            time.sleep(1)
+    raise TimeoutError(f"Server at {url} did not start within {timeout}s")
+
+def measure(num_workers, queries, bind, concurrency, duration, top_k=10, engine="bert", startup_timeout=600):
+    """
+    Starts num_workers gunicorn workers, warms every worker up and runs the
+    load for `duration` seconds. Returns one report row.
+    """
+    url = f"http://{bind}/"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(num_workers), "-b", bind, "app:app"],
+        cwd=BASE_DIR)
+    try:
+        wait_ready(url, startup_timeout)
+        # Each worker loads its model on its first search.
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(lambda q: post_search(url, q, top_k, engine), queries[:concurrency * 2]))
+
+        latencies = []
+        errors = 0
+        stop = time.monotonic() + duration
+
+        def client(offset):
+            nonlocal errors
+            i = offset
+            while time.monotonic() < stop:
+                try:
+                    latencies.append(post_search(url, queries[i % len(queries)], top_k, engine))
+                except OSError:
+                    errors += 1
+                i += concurrency
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(client, range(concurrency)))
+        elapsed = time.monotonic() - start
+
+        workers = [memory_kb(pid) for pid in child_pids(server.pid)]
+        master = memory_kb(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+    return {
+        "workers": num_workers,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_sec": len(latencies) / elapsed,
+        "mean_ms": float(np.mean(latencies)) if latencies else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+        "worker_rss_mb": [w["rss_kb"] / 1024 for w in workers],
+        "worker_pss_mb": [w["pss_kb"] / 1024 for w in workers],
+        "total_pss_mb": (master["pss_kb"] + sum(w["pss_kb"] for w in workers)) / 1024,
+    }
+
+def print_report(rows):
+    print(f"{'workers':>7} {'req/s':>8} {'mean ms':>9} {'p95 ms':>9} {'RSS/worker':>11} {'PSS/worker':>11} {'total PSS':>10}")
+    for row in rows:
+        print(f"{row['workers']:>7} {row['req_per_sec']:>8.1f} {row['mean_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{np.mean(row['worker_rss_mb']):>9.0f}MB {np.mean(row['worker_pss_mb']):>9.0f}MB "
+              f"{row['total_pss_mb']:>8.0f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-worker RSS and requests/sec of the gunicorn serving mode")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    parser.add_argument("--bind", default="127.0.0.1:8765")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--engine", default="bert", choices=("bert", "lucene", "hybrid"))
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    # Post titles make realistic short queries.
+    docs = DocStore(os.path.join(BASE_DIR, "utils", "bert.docs"))
+    queries = [docs[i]["title"] for i in range(min(len(docs), 500))]
+    docs.close()
+
+    rows = [measure(int(n), queries, args.bind, args.concurrency, args.duration, engine=args.engine)
+            for n in args.workers.split(",")]
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+import subprocess
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # Windows: rebuilds are not serialized across processes.
+    fcntl = None
+
+# --------------------------
+# Versioned Index Snapshots
+# --------------------------
+# incremental_index keeps its working files (bert.index, bert.docs, ...) in
+# utils/. After a rebuild they are copied into a new snapshot directory:
+#   <snapshots_dir>/<version>/bert.index, bert.index.json, bert.index.filters.npz,
+#                             bert.docs, bert.docs.idx, snapshot.json
+#   <snapshots_dir>/CURRENT    name of the snapshot to serve
+# CURRENT is replaced atomically, so readers see either the old or the new
+# snapshot. The web app serves CURRENT and switches when it changes; a
+# snapshot is never modified after it is published.
+
+INDEX_FILES = ("bert.index", "bert.index.json", "bert.index.filters.npz")
+DOCS_FILES = ("bert.docs", "bert.docs.idx")
+
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def current_version(snapshots_dir):
+    """
+    Returns the name of the published snapshot, or None if there is none.
+    """
+    try:
+        with open(os.path.join(snapshots_dir, "CURRENT"), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def publish_snapshot(index_path, docs_path, snapshots_dir, keep=2):
+    """
+    Copies the working index and document store into a new snapshot and
+    makes it CURRENT. Nothing is published when the working files are the
+    ones the current snapshot was made from. Older snapshots beyond `keep`
+    are deleted. Returns the name of the current snapshot.
+    """
+    sources = {name: os.path.join(os.path.dirname(index_path), name) for name in INDEX_FILES}
+    sources.update({name: os.path.join(os.path.dirname(docs_path), name) for name in DOCS_FILES})
+    source_stats = {name: _stat(path) for name, path in sources.items()}
+
+    current = current_version(snapshots_dir)
+    if current is not None:
+        try:
+            with open(os.path.join(snapshots_dir, current, "snapshot.json"), "r") as f:
+                if json.load(f).get("sources") == source_stats:
+                    return current
+        except (OSError, ValueError):
+            pass
+
+    os.makedirs(snapshots_dir, exist_ok=True)
+    version = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+    tmp_dir = os.path.join(snapshots_dir, "." + version + ".tmp")
+    os.makedirs(tmp_dir)
+    for name, path in sources.items():
+        # Copied, not linked: the working document store is appended to in place.
+        shutil.copyfile(path, os.path.join(tmp_dir, name))
+    with open(os.path.join(tmp_dir, "snapshot.json"), "w") as f:
+        json.dump({"version": version, "created": time.time(), "sources": source_stats}, f)
+    os.rename(tmp_dir, os.path.join(snapshots_dir, version))
+
+    pointer = os.path.join(snapshots_dir, "CURRENT.tmp")
+    with open(pointer, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(snapshots_dir, "CURRENT"))
+    print(f"Published BERT index snapshot {version}.")
+
+    # Processes still serving an older snapshot keep their open files.
+    versions = sorted(name for name in os.listdir(snapshots_dir)
+                      if os.path.isdir(os.path.join(snapshots_dir, name)) and not name.startswith("."))
+    for old in versions[:-max(keep, 1)]:
+        shutil.rmtree(os.path.join(snapshots_dir, old), ignore_errors=True)
+    return version
+
+@contextmanager
+def rebuild_lock(snapshots_dir):
+    """
+    Yields True if this process may rebuild, False if another rebuild holds the lock.
+    """
+    os.makedirs(snapshots_dir, exist_ok=True)
+    with open(os.path.join(snapshots_dir, ".rebuild.lock"), "w") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class Snapshot:
+    """
+    A loaded snapshot: the FAISS index, document store and metadata filters
+    of one version. Requests keep a reference for their whole duration.
+    """
+
+    def __init__(self, version, index, posts_data, metadata_filters):
+        self.version = version
+        self.index = index
+        self.posts_data = posts_data
+        self.metadata_filters = metadata_filters
+
+class SnapshotManager:
+    """
+    Serves the CURRENT snapshot and switches to a newly published one.
+
+    `load(snapshot_dir, version)` returns a Snapshot. `current` is replaced
+    in a single assignment after the new snapshot is fully loaded, so a
+    request that already took the old one finishes on it. check() runs on a
+    background thread every interval_ms once start() is called; rebuild()
+    starts `python -m utils.incremental_index --publish` in its own process.
+    """
+
+    def __init__(self, snapshots_dir, load, base_dir, interval_ms=2000, rebuild_interval_minutes=0):
+        self.snapshots_dir = snapshots_dir
+        self.base_dir = base_dir
+        self.interval = interval_ms / 1000
+        self.rebuild_interval = rebuild_interval_minutes * 60
+        self.current = None
+        self.last_error = None
+        self.on_swap = []
+        self._load = load
+        self._lock = threading.Lock()
+        self._rebuild = None
+        self._last_rebuild = time.monotonic()
+        self._thread = None
+
+    def check(self):
+        """
+        Loads CURRENT if it is not the snapshot being served. A snapshot that
+        fails to load is reported and the previous one stays in service.
+        Returns True if a new snapshot was swapped in.
+        """
+        with self._lock:
+            version = current_version(self.snapshots_dir)
+            if version is None or (self.current is not None and self.current.version == version):
+                return False
+            try:
+                snapshot = self._load(os.path.join(self.snapshots_dir, version), version)
+            except Exception as e:
+                self.last_error = f"Loading snapshot {version} failed: {e}"
+                print(self.last_error)
+                return False
+            self.current = snapshot
+            self.last_error = None
+            for callback in self.on_swap:
+                callback(snapshot)
+            print(f"Serving BERT index snapshot {version}.")
+            return True
+
+    def rebuild(self):
+        """
+        Starts a background rebuild unless one started by this process is
+        still running. Returns the process.
+        """
+        if self._rebuild is not None and self._rebuild.poll() is None:
+            return self._rebuild
+        self._last_rebuild = time.monotonic()
+        self._rebuild = subprocess.Popen([sys.executable, "-m", "utils.incremental_index", "--publish"],
+                                         cwd=self.base_dir, start_new_session=True)
+        return self._rebuild
+
+    def rebuilding(self):
+        return self._rebuild is not None and self._rebuild.poll() is None
+
+    def start(self):
+        """
+        Starts the thread that picks up new snapshots (and triggers periodic
+        rebuilds). Call it in the serving process, after any fork.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._watch, name="snapshot-watcher", daemon=True)
+            self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+            if self.rebuild_interval and time.monotonic() - self._last_rebuild >= self.rebuild_interval:
+                self.rebuild()
+
+    def info(self):
+        return {
+            "version": self.current.version if self.current else None,
+            "published": current_version(self.snapshots_dir),
+            "rebuilding": self.rebuilding(),
+            "lastError": self.last_error,
+        }
@@ -0,0 +1,75 @@
+import re
+from html import escape
+
+# --------------------------
+# Query-aware Snippets
+# --------------------------
+# Mirrors LuceneSearch.snippet for the BERT engine: the window of at most
+# max_chars characters with the most query term occurrences is returned
+# HTML-escaped, with the terms wrapped in <mark>.
+
+WORD_RE = re.compile(r"\w+")
+
+# Lucene's English stop words (EnglishAnalyzer.ENGLISH_STOP_WORDS_SET). The
+# server's StandardAnalyzer keeps stop words (an empty stop set since Lucene
+# 8), so LuceneSearch.java skips this same set when highlighting; both
+# engines then highlight the same terms.
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for if in into is it no not of on or such "
+    "that the their then there these they this to was will with".split()
+)
+
+# Fields a caller may ask for; "URL" and "score" are always returned.
+RESULT_FIELDS = ("Title", "Body", "Comments", "Snippet")
+
+def query_terms(query):
+    """
+    Lowercased words of the query without stop words.
+    """
+    return {word for word in (w.lower() for w in WORD_RE.findall(query)) if word not in STOP_WORDS}
+
+def make_snippet(text, terms, max_chars=300):
+    if not text:
+        return ""
+    matches = [m.span() for m in WORD_RE.finditer(text) if m.group().lower() in terms]
+
+    start = 0
+    best = 0
+    for i, (window_start, _) in enumerate(matches):
+        count = 0
+        for _, match_end in matches[i:]:
+            if match_end > window_start + max_chars:
+                break
+            count += 1
+        if count > best:
+            best, start = count, window_start
+    # Leave some context before the first match, starting at a word boundary
+    start = max(0, start - max_chars // 4)
+    end = min(len(text), start + max_chars)
+    if start > 0:
+        space = text.find(" ", start, end)
+        if space >= 0:
+            start = space + 1
+
+    parts = ["… "] if start > 0 else []
+    position = start
+    for match_start, match_end in matches:
+        if match_start < position or match_end > end:
+            continue
+        parts.append(escape(text[position:match_start]))
+        parts.append(f"<mark>{escape(text[match_start:match_end])}</mark>")
+        position = match_end
+    parts.append(escape(text[position:end]))
+    if end < len(text):
+        parts.append(" …")
+    return "".join(parts)
+
+def parse_fields(value):
+    """
+    Parses a comma separated field list (e.g. from a form) into the known
+    result fields. Returns None, meaning all fields, when nothing is given.
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",")]
+    return [field for field in RESULT_FIELDS if field in fields]
@@ -0,0 +1,293 @@
+import os
+import faiss
+import numpy as np
+
+# --------------------------
+# Metadata-filtered Vector Search
+# --------------------------
+# Filters (see search_filters) are resolved to the sorted FAISS ids (doc
+# store rows) they match, and the search only considers those ids. The
+# candidates come from the most selective filter alone: a subreddit's id
+# list, the ids with over_18 set, or a slice of the ids sorted by a numeric
+# field (a range is two binary searches). The other filters are then checked
+# on per-id columns, so a selective query costs about the size of its
+# smallest filter, not of the corpus. Broad selections are handed to FAISS as
+# an IDSelectorBitmap. Everything is saved next to the index as
+# <index_path>.filters.npz.
+#
+# Bitmaps use FAISS's IDSelectorBitmap layout: bit i is bitmap[i >> 3] >> (i & 7).
+
+# Numeric metadata with range filters: filter key -> (field, bound)
+RANGE_FILTERS = {
+    "after": ("created_utc", "min"),
+    "before": ("created_utc", "max"),
+    "minScore": ("score", "min"),
+    "minComments": ("num_comments", "min"),
+}
+NUMERIC_FIELDS = ("created_utc", "score", "num_comments")
+
+def filters_path(index_path):
+    return index_path + ".filters.npz"
+
+def ids_to_bitmap(ids, size):
+    mask = np.zeros(size, dtype=bool)
+    mask[ids] = True
+    return np.packbits(mask, bitorder="little")
+
+def bitmap_to_ids(bitmap, size):
+    return np.flatnonzero(np.unpackbits(bitmap, count=size, bitorder="little")).astype(np.int64)
+
+def _in_range(column, low, high):
+    def check(ids):
+        values = column[ids]
+        mask = np.ones(len(ids), dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+    return check
+
+class MetadataFilters:
+    """
+    Precomputed filter structures over the ids in the index: id lists per
+    subreddit and for over_18, ids sorted by each numeric field, and per-id
+    columns of the same metadata (indexed by FAISS id, up to `size`).
+    """
+
+    def __init__(self, arrays):
+        if "subreddit_bitmaps" in arrays:
+            arrays = self._from_bitmaps(arrays)
+        self.size = int(arrays["size"])
+        self.ids = arrays["ids"]
+        self.subreddits = {str(name): row for row, name in enumerate(arrays["subreddits"])}
+        self.subreddit_offsets = arrays["subreddit_offsets"]
+        self.subreddit_ids = arrays["subreddit_ids"]
+        self.subreddit_codes = arrays["subreddit_codes"]
+        self.over18_ids = arrays["over18_ids"]
+        self.over18 = arrays["over18"]
+        self.sorted_ids = {field: arrays[field + "_ids"] for field in NUMERIC_FIELDS}
+        self.sorted_values = {field: arrays[field + "_values"] for field in NUMERIC_FIELDS}
+        self.columns = {field: arrays[field] for field in NUMERIC_FIELDS}
+        self._arrays = arrays
+
+    @staticmethod
+    def _columns(size, ids, names, codes, over18, values):
+        """
+        The arrays for `ids` (sorted) given each id's row in the subreddit
+        `names`, its over_18 flag and its numeric values.
+        """
+        arrays = {"size": np.int64(size), "ids": ids, "subreddits": np.array(names, dtype=str)}
+        order = np.argsort(codes, kind="stable")
+        arrays["subreddit_ids"] = ids[order]
+        arrays["subreddit_offsets"] = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        arrays["subreddit_codes"] = np.full(size, -1, dtype=np.int32)
+        arrays["subreddit_codes"][ids] = codes
+        arrays["over18_ids"] = ids[over18]
+        arrays["over18"] = np.zeros(size, dtype=bool)
+        arrays["over18"][ids] = over18
+        for field in NUMERIC_FIELDS:
+            order = np.argsort(values[field], kind="stable")
+            arrays[field + "_ids"] = ids[order]
+            arrays[field + "_values"] = values[field][order]
+            arrays[field] = np.zeros(size, dtype=np.int64)
+            arrays[field][ids] = values[field]
+        return arrays
+
+    @classmethod
+    def _from_bitmaps(cls, arrays):
+        # Files written before the per-id columns held one bitmap per subreddit.
+        size = int(arrays["size"])
+        ids = bitmap_to_ids(arrays["live"], size)
+        codes = np.zeros(size, dtype=np.int32)
+        for row, bitmap in enumerate(arrays["subreddit_bitmaps"]):
+            codes[bitmap_to_ids(bitmap, size)] = row
+        over18 = np.unpackbits(arrays["over18"], count=size, bitorder="little").astype(bool)
+        values = {}
+        for field in NUMERIC_FIELDS:
+            column = np.zeros(size, dtype=np.int64)
+            column[arrays[field + "_ids"]] = arrays[field + "_values"]
+            values[field] = column[ids]
+        return cls._columns(size, ids, arrays["subreddits"], codes[ids], over18[ids], values)
+
+    @classmethod
+    def build(cls, ids, posts_data):
+        """
+        Builds the filters for the given FAISS ids from their doc store records.
+        """
+        ids = np.sort(np.asarray(ids, dtype=np.int64))
+        size = int(ids[-1]) + 1 if len(ids) else 0
+        records = [posts_data[int(doc_id)] for doc_id in ids]
+
+        subreddits = [(record.get("subreddit") or "").lower() for record in records]
+        names = sorted(set(subreddits))
+        rows = {name: row for row, name in enumerate(names)}
+        codes = np.array([rows[name] for name in subreddits], dtype=np.int32)
+        over18 = np.array([bool(record.get("over_18")) for record in records], dtype=bool)
+        values = {field: np.array([int(record.get(field) or 0) for record in records], dtype=np.int64)
+                  for field in NUMERIC_FIELDS}
+        return cls(cls._columns(size, ids, names, codes, over18, values))
+
+    def save(self, path):
+        # np.savez appends ".npz" to names without it.
+        tmp_path = path[:-len(".npz")] + ".tmp.npz"
+        np.savez(tmp_path, **self._arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def select(self, filters):
+        """
+        Returns the sorted ids matching all supported filters, or None when
+        none of the filters apply to the vector index.
+        """
+        # Each filter is (candidate count, candidates(), check(ids) -> mask).
+        parts = []
+        subreddit = filters.get("subreddit")
+        if subreddit:
+            names = [subreddit] if isinstance(subreddit, str) else subreddit
+            rows = sorted({self.subreddits[name.lower()] for name in names if name.lower() in self.subreddits})
+            offsets = self.subreddit_offsets
+            parts.append((sum(int(offsets[row + 1] - offsets[row]) for row in rows),
+                          lambda: np.concatenate([self.subreddit_ids[offsets[row]:offsets[row + 1]] for row in rows]
+                                                 or [np.zeros(0, dtype=np.int64)]),
+                          lambda ids: np.isin(self.subreddit_codes[ids], rows)))
+        if isinstance(filters.get("over18"), bool):
+            wanted = filters["over18"]
+            parts.append((len(self.over18_ids) if wanted else len(self.ids) - len(self.over18_ids),
+                          lambda: self.over18_ids if wanted else self.ids[~self.over18[self.ids]],
+                          lambda ids: self.over18[ids] == wanted))
+
+        bounds = {}
+        for key, (field, bound) in RANGE_FILTERS.items():
+            if isinstance(filters.get(key), (int, float)):
+                low, high = bounds.get(field, (None, None))
+                bounds[field] = (filters[key], high) if bound == "min" else (low, filters[key])
+        for field, (low, high) in bounds.items():
+            values = self.sorted_values[field]
+            start = 0 if low is None else int(np.searchsorted(values, low, side="left"))
+            end = len(values) if high is None else int(np.searchsorted(values, high, side="right"))
+            parts.append((max(end - start, 0),
+                          lambda field=field, start=start, end=end: self.sorted_ids[field][start:end],
+                          _in_range(self.columns[field], low, high)))
+        if not parts:
+            return None
+
+        parts.sort(key=lambda part: part[0])
+        ids = parts[0][1]()
+        for _, _, check in parts[1:]:
+            if len(ids) == 0:
+                break
+            ids = ids[check(ids)]
+        return np.sort(ids)
+
+def _base_params(index, selector):
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def base_index(index):
+    """
+    The index that stores the vectors, below an IndexIDMap2 and an IndexRefine.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexRefine):
+        index = faiss.downcast_index(index.base_index)
+    return index
+
+def supports_selector(index):
+    # IndexPQ rejects any SearchParameters, so it cannot take an IDSelector.
+    return not isinstance(base_index(index), faiss.IndexPQ)
+
+def selector_params(index, selector):
+    """
+    SearchParameters restricting a search of `index` (any of the INDEX_TYPES
+    but pq, optionally behind an IndexIDMap2) to the ids accepted by
+    `selector`, keeping the index's own nprobe / efSearch / k_factor.
+    Returns (params, references); FAISS only holds raw pointers, so the
+    caller keeps `references` alive while params is in use.
+    """
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(base, faiss.IndexRefine):
+        # The id map only translates a top-level selector, while IndexRefine
+        # hands its base index the selector of base_index_params.
+        if base is not index:
+            selector = faiss.IDSelectorTranslated(index.id_map, selector)
+        inner = _base_params(faiss.downcast_index(base.base_index), selector)
+        params = faiss.IndexRefineSearchParameters(k_factor=base.k_factor, base_index_params=inner)
+        return params, (selector, inner)
+    return _base_params(base, selector), (selector,)
+
+def subset_scores(index, ids, query_embedding, chunk_size=65536):
+    """
+    Inner products of the query with the stored vectors of `ids`, decoded in
+    chunks. Raises RuntimeError when the index cannot reconstruct by id
+    (an IVF index without a direct map).
+    """
+    scores = np.empty(len(ids), dtype=np.float32)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        scores[start:start + len(chunk)] = index.reconstruct_batch(chunk) @ query_embedding[0]
+    return scores
+
+def filtered_search(index, query_embedding, k, ids, size, exact_scan_max=20000):
+    """
+    Searches only the (sorted) `ids`, e.g. from MetadataFilters.select.
+    Returns (distances, indices, count_hits) where count_hits(threshold)
+    returns (count, exact) for the matching ids scoring >= threshold. Rows
+    FAISS could not fill are -1.
+
+    Selective filters (at most exact_scan_max ids) are scored exactly over
+    just those vectors, so latency follows the size of the subset. Broader
+    filters run the index's own search with an IDSelectorBitmap over the
+    `size` ids, except on pq, which takes no selector and is always scored
+    over the subset.
+    """
+    if len(ids) == 0:
+        empty = np.full((1, k), -1, dtype=np.int64)
+        return np.full((1, k), -np.inf, dtype=np.float32), empty, lambda threshold: (0, True)
+
+    selectable = supports_selector(index)
+    if len(ids) <= exact_scan_max or not selectable:
+        try:
+            scores = subset_scores(index, ids, query_embedding)
+        except RuntimeError:
+            if not selectable:
+                raise
+            scores = None
+        if scores is not None:
+            top = np.argsort(-scores, kind="stable")[:k]
+            distances = np.full((1, k), -np.inf, dtype=np.float32)
+            indices = np.full((1, k), -1, dtype=np.int64)
+            distances[0, :len(top)] = scores[top]
+            indices[0, :len(top)] = ids[top]
+            return distances, indices, lambda threshold: (int(np.count_nonzero(scores >= threshold)), True)
+
+    bitmap = ids_to_bitmap(ids, size)
+    selector = faiss.IDSelectorBitmap(bitmap)
+    params, references = selector_params(index, selector)
+    distances, indices = index.search(query_embedding, k, params=params)
+
+    def count_hits(threshold):
+        top = faiss.downcast_index(index)
+        if isinstance(top, faiss.IndexIDMap2):
+            top = faiss.downcast_index(top.index)
+        if isinstance(top, faiss.IndexRefine):
+            # IndexRefine finds nothing in a range search. Lower bound: the hits on this page.
+            return int(np.count_nonzero((distances[0] >= threshold) & (indices[0] >= 0))), False
+        # Like query_bert.count_hits: exact on flat and sq storage, bounded
+        # (and approximate) on IVF and HNSW, which only count what they visit.
+        radius = float(np.nextafter(np.float32(threshold), np.float32(-np.inf)))
+        lims, _, _ = index.range_search(query_embedding, radius, params=params)
+        return int(lims[1]), not isinstance(base_index(index), (faiss.IndexIVF, faiss.IndexHNSW))
+
+    # Keep the selector objects alive as long as count_hits can use params.
+    count_hits.references = (bitmap, selector, references)
+    return distances, indices, count_hits
@@ -0,0 +1,346 @@
+"""
+Reproducible search benchmarks on a synthetic corpus.
+
+Generates a corpus (see synthetic_corpus.py), then runs each phase in its own
+process so peak memory (max RSS) is per phase:
+  bert_index    query_bert.reindex_data: model load, reading, embedding, FAISS
+  lucene_index  indexer.create_index (full build)
+  bert_query    search_bert through a QueryBatcher at each --concurrency
+  lucene_query  LuceneClient (the web app's LuceneSearchServer) at each --concurrency
+Query phases report latency percentiles (ms) and QPS per concurrency level.
+Phases whose dependencies are missing (e.g. PyLucene, a JDK) are reported as skipped.
+
+Results go to a JSON file together with the git commit, machine and
+arguments, so runs can be compared over time:
+    python benchmarks/run_benchmarks.py --posts 5000 --model tiny
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+
+--model tiny builds a small random encoder (see tiny_model.py) so nothing is
+downloaded; pass a model name or path to benchmark the real one.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+WEB_APP_DIR = os.path.join(REPO_DIR, "Part B.2 - Web App")
+LUCENE_DIR = os.path.join(REPO_DIR, "Part A.2 - Indexing using PyLucene")
+PHASES = ("bert_index", "lucene_index", "bert_query", "lucene_query")
+
+sys.path.insert(0, BENCH_DIR)
+import synthetic_corpus
+
+class PhaseSkipped(Exception):
+    pass
+
+# --------------------------
+# Measurements
+# --------------------------
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+def percentile(sorted_values, q):
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+def run_load(search, queries, concurrency, initializer=None):
+    """
+    Runs every query once on `concurrency` threads. Returns latency
+    percentiles in milliseconds and the overall queries per second.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(query):
+        start = time.perf_counter()
+        try:
+            search(query)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, initializer=initializer) as pool:
+        list(pool.map(run, queries))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "queries": len(latencies),
+        "errors": len(errors),
+        "firstError": errors[0] if errors else None,
+        "seconds": wall,
+        "qps": len(latencies) / wall if wall else 0.0,
+        "meanMs": sum(latencies) / len(latencies) if latencies else None,
+        "p50Ms": percentile(latencies, 50),
+        "p95Ms": percentile(latencies, 95),
+        "p99Ms": percentile(latencies, 99),
+        "maxMs": latencies[-1] if latencies else None,
+    }
+
+# --------------------------
+# Phases (each runs in its own process)
+# --------------------------
+def _import_query_bert():
+    sys.path.insert(0, WEB_APP_DIR)
+    try:
+        from utils import query_bert
+    except ImportError as e:
+        raise PhaseSkipped(f"BERT dependencies are missing: {e}")
+    return query_bert
+
+def _import_indexer():
+    sys.path.insert(0, LUCENE_DIR)
+    try:
+        import lucene
+        import indexer
+    except ImportError as e:
+        raise PhaseSkipped(f"PyLucene is not available: {e}")
+    lucene.initVM(vmargs=["-Djava.awt.headless=true"])
+    return lucene, indexer
+
+def phase_bert_index(args):
+    query_bert = _import_query_bert()
+    from utils import doc_store
+    start = time.perf_counter()
+    index, posts_data = query_bert.reindex_data(args.corpus, args.model, batch_size=args.batch_size,
+                                                index_type=args.index_type)
+    seconds = time.perf_counter() - start
+    query_bert.save_faiss_index(index, os.path.join(args.work_dir, "bert.index"), args.index_type)
+    doc_store.write_doc_store(os.path.join(args.work_dir, "bert.docs"), posts_data)
+    return {"documents": index.ntotal, "seconds": seconds, "docsPerSecond": index.ntotal / seconds}
+
+def phase_lucene_index(args):
+    lucene, indexer = _import_indexer()
+    index_dir = os.path.join(args.work_dir, "lucene_index")
+    # create_index writes indexing_time.txt to the working directory.
+    os.chdir(args.work_dir)
+    start = time.perf_counter()
+    indexer.create_index(index_dir, args.corpus, threads=args.index_threads, full=True)
+    seconds = time.perf_counter() - start
+    return {"documents": args.posts, "seconds": seconds, "docsPerSecond": args.posts / seconds}
+
+def phase_bert_query(args):
+    query_bert = _import_query_bert()
+    from utils import doc_store
+    from utils.batcher import QueryBatcher
+    index_path = os.path.join(args.work_dir, "bert.index")
+    if not os.path.exists(index_path):
+        raise PhaseSkipped("no BERT index was built")
+    tokenizer, model = query_bert.load_transformers_model(args.model)
+    index = query_bert.load_faiss_index(index_path)
+    posts_data = doc_store.DocStore(os.path.join(args.work_dir, "bert.docs"))
+    batcher = QueryBatcher(index, tokenizer, model) if args.batching else None
+
+    def search(query):
+        query_bert.search_bert(query, args.top_k, index, posts_data, tokenizer, model, batcher=batcher)
+
+    queries = synthetic_corpus.make_queries(args.queries, args.seed)
+    for query in queries[:args.warmup]:
+        search(query)
+    levels = []
+    for concurrency in args.concurrency:
+        # Every level encodes its queries instead of hitting the embedding cache.
+        query_bert.query_cache.clear()
+        levels.append(run_load(search, queries, concurrency))
+    posts_data.close()
+    return {"batching": args.batching, "levels": levels}
+
+def phase_lucene_query(args):
+    # Queries go through the socket server the web app uses, not PyLucene.
+    sys.path.insert(0, WEB_APP_DIR)
+    from utils.lucene_client import LuceneClient
+    index_dir = os.path.join(args.work_dir, "lucene_index")
+    if not os.path.isdir(index_dir):
+        raise PhaseSkipped("no Lucene index was built")
+    if shutil.which("java") is None:
+        raise PhaseSkipped("Java is not available")
+    with open(os.path.join(WEB_APP_DIR, "utils", "config.json"), "r") as f:
+        config = json.load(f)
+    snippet_config = config.get("snippets", {})
+    fields = snippet_config.get("fields", ["Title", "Snippet"])
+    snippet_chars = snippet_config.get("chars", 300)
+    client = LuceneClient(WEB_APP_DIR, pool_size=config.get("serverWorkers", 4), index_dir=index_dir)
+
+    def search(query):
+        response = client.search(query, args.top_k, fields=fields, snippet_chars=snippet_chars)
+        if "error" in response:
+            raise RuntimeError(response.get("details") or response["error"])
+
+    try:
+        queries = synthetic_corpus.make_queries(args.queries, args.seed)
+        for query in queries[:args.warmup]:
+            search(query)
+        return {"levels": [run_load(search, queries, concurrency) for concurrency in args.concurrency]}
+    finally:
+        client.close()
+
+def run_phase(args):
+    """
+    Runs one phase in this process and prints its result as one JSON line.
+    """
+    try:
+        result = globals()["phase_" + args.phase](args)
+        result["status"] = "ok"
+    except PhaseSkipped as e:
+        result = {"status": "skipped", "reason": str(e)}
+    result["peakMemoryMB"] = peak_memory_mb()
+    print("RESULT " + json.dumps(result), flush=True)
+
+# --------------------------
+# Orchestration
+# --------------------------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def phase_args(args, phase):
+    argv = [sys.executable, os.path.abspath(__file__), "--phase", phase,
+            "--work-dir", args.work_dir, "--corpus", args.corpus, "--model", args.model]
+    for name in ("posts", "seed", "queries", "warmup", "top_k", "batch_size", "index_type", "index_threads"):
+        argv += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+    argv += ["--concurrency", ",".join(map(str, args.concurrency))]
+    if not args.batching:
+        argv.append("--no-batching")
+    return argv
+
+def run_suite(args):
+    own_work_dir = args.work_dir is None
+    args.work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix="reddit-bench-"))
+    os.makedirs(args.work_dir, exist_ok=True)
+    try:
+        args.corpus = os.path.join(args.work_dir, "corpus")
+        shutil.rmtree(args.corpus, ignore_errors=True)
+        print(f"Generating {args.posts} posts with ~{args.comments} comments each...", flush=True)
+        corpus = synthetic_corpus.write_corpus(args.corpus, args.posts, args.comments, args.seed)
+        model_name = args.model
+        if args.model == "tiny":
+            import tiny_model
+            args.model = tiny_model.make_tiny_model(os.path.join(args.work_dir, "tiny-model"))
+
+        results = {}
+        for phase in args.phases:
+            print(f"Running {phase}...", flush=True)
+            proc = subprocess.run(phase_args(args, phase), capture_output=True, text=True)
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("RESULT ")]
+            if proc.returncode != 0 or not lines:
+                results[phase] = {"status": "failed", "returncode": proc.returncode,
+                                  "error": proc.stderr.strip().splitlines()[-1:] or None}
+            else:
+                results[phase] = json.loads(lines[-1][len("RESULT "):])
+            print(f"  {summarize(results[phase])}", flush=True)
+    finally:
+        if own_work_dir and not args.keep:
+            shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "gitCommit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            "corpus": corpus,
+            "args": dict({name: getattr(args, name) for name in ("posts", "comments", "seed", "queries",
+                                                                 "concurrency", "top_k", "batch_size", "index_type",
+                                                                 "index_threads", "batching")}, model=model_name),
+        },
+        "results": results,
+    }
+
+def summarize(result):
+    if result["status"] != "ok":
+        return f"{result['status']}: {result.get('reason') or result.get('error')}"
+    if "levels" in result:
+        return "; ".join(f"c={level['concurrency']} {level['qps']:.1f} qps p50 {level['p50Ms']:.1f} "
+                         f"p99 {level['p99Ms']:.1f} ms" for level in result["levels"] if level["queries"])
+    return f"{result['docsPerSecond']:.1f} docs/sec, peak {result['peakMemoryMB']:.0f} MB"
+
+def compare(old_path, new_path):
+    """
+    Prints the change of every throughput, latency and memory figure between two result files.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'metric':<44}{'old':>12}{'new':>12}{'change':>10}")
+    for phase in PHASES:
+        before, after = old["results"].get(phase, {}), new["results"].get(phase, {})
+        if before.get("status") != "ok" or after.get("status") != "ok":
+            continue
+        rows = [(f"{phase} {name}", before.get(name), after.get(name))
+                for name in ("docsPerSecond", "peakMemoryMB")]
+        old_levels = {level["concurrency"]: level for level in before.get("levels", [])}
+        for level in after.get("levels", []):
+            previous = old_levels.get(level["concurrency"], {})
+            rows += [(f"{phase} c={level['concurrency']} {name}", previous.get(name), level.get(name))
+                     for name in ("qps", "p50Ms", "p95Ms", "p99Ms")]
+        for name, a, b in rows:
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.1f}%" if a else ""
+            print(f"{name:<44}{a:>12.2f}{b:>12.2f}{change:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark indexing and search on a synthetic Reddit corpus")
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=5, help="mean comments per post")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model", default="tiny",
+                        help='"tiny" for an offline stand-in, or a Hugging Face model name or path')
+    parser.add_argument("--queries", type=int, default=200, help="distinct queries per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", default="1,4,16", type=lambda s: [int(c) for c in s.split(",")])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32, help="BERT embedding batch size")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--index-threads", type=int, default=4, help="Lucene indexing threads")
+    parser.add_argument("--no-batching", dest="batching", action="store_false",
+                        help="run BERT queries without the QueryBatcher")
+    parser.add_argument("--phases", default=",".join(PHASES), type=lambda s: s.split(","))
+    parser.add_argument("--work-dir", help="keep corpus and indexes here instead of a temporary directory")
+    parser.add_argument("--keep", action="store_true", help="do not delete the temporary work directory")
+    parser.add_argument("--output", help="results file (default benchmarks/results/bench-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    parser.add_argument("--phase", choices=PHASES, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.phase:
+        run_phase(args)
+    else:
+        report = run_suite(args)
+        output = args.output or os.path.join(BENCH_DIR, "results", time.strftime("bench-%Y%m%d-%H%M%S.json"))
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=4)
+            f.write("\n")
+        print(f"Results written to {output}.")
@@ -0,0 +1,159 @@
+"""
+Synthetic Reddit corpus in the crawler's format, for benchmarks.
+
+Writes reddit_batch_<n>.txt files like crawl_reddit.py does (one JSON post
+per line followed by ",", a new file once FILE_SIZE_THRESHOLD is reached),
+with the same post and comment fields. Text is drawn from per-subreddit
+vocabularies with a Zipf-like word distribution, so keyword and semantic
+queries both have something to match. The same seed gives the same corpus.
+
+Usage (from the repository root):
+    python benchmarks/synthetic_corpus.py --out /tmp/corpus --posts 10000 --comments 8
+"""
+import os
+import json
+import random
+import itertools
+import argparse
+
+# Same rotation size as the crawler.
+FILE_SIZE_THRESHOLD = 9.5 * 1024 * 1024
+
+SUBREDDIT_WORDS = {
+    "technology": "privacy startup chip battery smartphone regulation antitrust broadband satellite robot",
+    "Android": "pixel samsung rom launcher root bootloader widget apk notification oneplus",
+    "iOS": "iphone ipad siri shortcut widget jailbreak airdrop icloud beta update",
+    "gadgets": "headphones smartwatch charger drone keyboard monitor speaker camera tablet earbuds",
+    "programming": "compiler refactor rust haskell closure recursion garbage collector concurrency lambda",
+    "learnprogramming": "beginner tutorial loop array function variable bootcamp project syntax debugging",
+    "webdev": "css javascript react frontend backend api deploy framework responsive browser",
+    "Python": "pandas numpy django flask virtualenv pip decorator generator asyncio typing",
+    "cybersecurity": "malware phishing ransomware firewall exploit vulnerability encryption breach patch audit",
+    "techsupport": "driver bios crash bluescreen reinstall boot ssd overheating wifi troubleshoot",
+    "DevOps": "kubernetes docker terraform pipeline ansible monitoring helm cluster rollout incident",
+    "DataScience": "regression dataset visualization notebook feature clustering statistics sql dashboard outlier",
+    "MachineLearning": "transformer gradient embedding pretraining benchmark dropout attention inference finetuning loss",
+    "ArtificialIntelligence": "agent reasoning alignment chatbot model agi prompt robotics vision language",
+    "Linux": "kernel distro ubuntu arch terminal bash systemd wayland package desktop",
+}
+COMMON_WORDS = ("the a to and of is in it for that this with on you have be are just not but what my how "
+                "can so if about there like from when would any use one new get anyone really help think "
+                "question problem time work best way need know people good thanks looking").split()
+
+def vocabulary():
+    """
+    All words the generator can emit (e.g. for a tiny offline tokenizer).
+    """
+    words = set(COMMON_WORDS)
+    for topic in SUBREDDIT_WORDS.values():
+        words.update(topic.split())
+    words.update(name.lower() for name in SUBREDDIT_WORDS)
+    return sorted(words)
+
+def _zipf_weights(count):
+    # Cumulative weights: rank r is picked with weight 1 / (r + 1).
+    return list(itertools.accumulate(1 / (rank + 1) for rank in range(count)))
+
+COMMON_WEIGHTS = _zipf_weights(len(COMMON_WORDS))
+
+def _text(rng, topic_words, length):
+    topic = rng.choices(topic_words, cum_weights=_zipf_weights(len(topic_words)), k=length)
+    common = rng.choices(COMMON_WORDS, cum_weights=COMMON_WEIGHTS, k=length)
+    return " ".join(t if rng.random() < 0.35 else c for t, c in zip(topic, common))
+
+def make_post(rng, index, comments, start_utc=1_600_000_000):
+    """
+    One post in the crawler's schema with `comments` comments.
+    """
+    subreddit = rng.choice(sorted(SUBREDDIT_WORDS))
+    topic_words = SUBREDDIT_WORDS[subreddit].split()
+    post_id = f"s{index:07x}"
+    title = _text(rng, topic_words, rng.randint(4, 12)).capitalize()
+    permalink = f"/r/{subreddit}/comments/{post_id}/{'_'.join(title.lower().split()[:6])}/"
+    created = start_utc + rng.randint(0, 4 * 365 * 86400)
+    post = {
+        "subreddit": subreddit,
+        "id": post_id,
+        "title": title,
+        "author": f"user{rng.randint(1, 50000)}",
+        "body": _text(rng, topic_words, rng.randint(20, 300)),
+        "comments": [],
+        "flair_text": None,
+        "permalink": permalink,
+        "url": "https://www.reddit.com" + permalink,
+        "image_path": None,
+        "created_utc": float(created),
+        "score": int(rng.paretovariate(1.2)),
+        "upvote_ratio": round(rng.uniform(0.5, 1.0), 2),
+        "num_comments": comments,
+        "is_self": True,
+        "over_18": rng.random() < 0.02,
+        "spoiler": False,
+        "locked": False,
+        "stickied": False,
+    }
+    for c in range(comments):
+        comment_id = f"{post_id}c{c:x}"
+        post["comments"].append({
+            "id": comment_id,
+            "author": f"user{rng.randint(1, 50000)}",
+            "body": _text(rng, topic_words, rng.randint(5, 80)),
+            "subreddit": subreddit,
+            "parent_id": f"t3_{post_id}",
+            "permalink": permalink + comment_id + "/",
+            "author_flair_text": None,
+            "created_utc": float(created + rng.randint(60, 86400)),
+            "score": int(rng.paretovariate(1.5)),
+            "is_submitter": False,
+            "stickied": False,
+            "edited": False,
+            "distinguished": None,
+        })
+    return post
+
+def write_corpus(out_dir, posts=1000, comments=5, seed=42, file_size=FILE_SIZE_THRESHOLD):
+    """
+    Writes `posts` posts (each with about `comments` comments) to
+    out_dir/reddit_batch_<n>.txt. Returns {"files", "posts", "bytes"}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    file_index = 1
+    written = 0
+    out = open(os.path.join(out_dir, f"reddit_batch_{file_index}.txt"), "w")
+    try:
+        for i in range(posts):
+            count = max(0, int(rng.gauss(comments, comments / 3))) if comments else 0
+            out.write(json.dumps(make_post(rng, i, count)) + ",\n")
+            if out.tell() >= file_size and i < posts - 1:
+                written += out.tell()
+                out.close()
+                file_index += 1
+                out = open(os.path.join(out_dir, f"reddit_batch_{file_index}.txt"), "w")
+        written += out.tell()
+    finally:
+        out.close()
+    return {"files": file_index, "posts": posts, "bytes": written}
+
+def make_queries(count, seed=7):
+    """
+    Distinct 1-4 word keyword queries over the corpus vocabulary.
+    """
+    rng = random.Random(seed)
+    queries = {}
+    topics = sorted(SUBREDDIT_WORDS)
+    while len(queries) < count:
+        words = SUBREDDIT_WORDS[rng.choice(topics)].split()
+        queries.setdefault(" ".join(rng.sample(words, rng.randint(1, 4))), None)
+    return list(queries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Reddit corpus in the crawler's format")
+    parser.add_argument("--out", required=True, help="directory for the reddit_batch_*.txt files")
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--comments", type=int, default=5, help="mean comments per post")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--file-size-mb", type=float, default=FILE_SIZE_THRESHOLD / 2**20)
+    args = parser.parse_args()
+    summary = write_corpus(args.out, args.posts, args.comments, args.seed, args.file_size_mb * 2**20)
+    print(f"Wrote {summary['posts']} posts to {summary['files']} files ({summary['bytes'] / 2**20:.1f} MB) in {args.out}.")
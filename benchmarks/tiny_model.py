@@ -0,0 +1,53 @@
+"""
+A tiny, randomly initialized RoBERTa encoder for running the benchmarks
+offline. Its word-level tokenizer covers the synthetic corpus vocabulary, so
+tokenization and the forward pass do the same work per token as the real
+model, only with far smaller layers. Rankings are meaningless; timings of
+everything around the model (reading, FAISS, batching, serving) are not.
+
+Usage (from the repository root):
+    python benchmarks/tiny_model.py --out /tmp/tiny-model
+"""
+import os
+import argparse
+
+from synthetic_corpus import vocabulary
+
+SPECIAL_TOKENS = ("<s>", "<pad>", "</s>", "<unk>")
+
+def make_tiny_model(out_dir, hidden_size=32, layers=2, heads=2, max_length=512, seed=0):
+    """
+    Saves a tokenizer and RobertaModel to out_dir that
+    query_bert.load_transformers_model(out_dir) can load. Returns out_dir.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, normalizers
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaModel
+
+    vocab = {token: i for i, token in enumerate(SPECIAL_TOKENS)}
+    for word in vocabulary():
+        vocab.setdefault(word, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>",
+                                   pad_token="<pad>", unk_token="<unk>", model_max_length=max_length)
+
+    torch.manual_seed(seed)
+    config = RobertaConfig(vocab_size=len(vocab), hidden_size=hidden_size, num_hidden_layers=layers,
+                           num_attention_heads=heads, intermediate_size=hidden_size * 4,
+                           max_position_embeddings=max_length + 2, pad_token_id=vocab["<pad>"],
+                           bos_token_id=vocab["<s>"], eos_token_id=vocab["</s>"])
+    model = RobertaModel(config, add_pooling_layer=False)
+    os.makedirs(out_dir, exist_ok=True)
+    fast.save_pretrained(out_dir)
+    model.save_pretrained(out_dir)
+    return out_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save a tiny offline stand-in for the BERT model")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--hidden-size", type=int, default=32)
+    parser.add_argument("--layers", type=int, default=2)
+    args = parser.parse_args()
+    print(f"Saved tiny model to {make_tiny_model(args.out, args.hidden_size, args.layers)}.")